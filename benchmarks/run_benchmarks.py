@@ -0,0 +1,324 @@
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import numpy as np
+import yaml
+import pycollisionavoidance
+from pycollisionavoidance.collision.Detection import ParticleCollisionDetection
+from pycollisionavoidance.raycast.Particle import Particle, look_batch
+from pycollisionavoidance.raycast.Point import Point
+from pycollisionavoidance.raycast.Ray import Ray
+from pycollisionavoidance.raycast.StaticMap import StaticMap
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+handler = logging.FileHandler('/tmp/walkgen.log')
+handler.setLevel(logging.ERROR)
+formatter = logging.Formatter('%(levelname)-8s-[%(filename)s:%(lineno)d]-%(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# scenes of the configuration file benchmarked next to the generated ones
+CONFIG_SCENES = ("obstacles_1", "obstacles_2")
+# number of segments of the generated scenes
+GENERATED_SIZES = (10, 100, 1000, 10000, 100000)
+QUICK_GENERATED_SIZES = (10, 100, 1000)
+RESOLUTIONS = (5, 1, 0.25)
+WALKER_COUNTS = (1, 10, 100)
+# the pure Python reference engine is only benchmarked up to this number of ray-segment tests per call
+REFERENCE_LIMIT = 2e5
+ENV_COLLISION_DISTANCE = 1.5
+ROBOT_COLLISION_DISTANCE = 2.5
+
+
+def parse_arguments():
+    """Arguments to run the script"""
+    parser = argparse.ArgumentParser(description='Collision Avoidance Benchmarks')
+    parser.add_argument('--config', '-c', default='config.yaml', help='YAML Configuration File with the scenes')
+    parser.add_argument('--output', '-o', default='benchmark_results.json', help='JSON file the results are written to')
+    parser.add_argument('--compare', default=None, help='JSON results of a previous run to compare against')
+    parser.add_argument('--backends', nargs='+', default=['raycast', 'sweep'], choices=['raycast', 'sweep'],
+                        help='ranging backends of the scene')
+    parser.add_argument('--filter', '-k', default=None, help='run only benchmarks whose name contains this text')
+    parser.add_argument('--repeat', '-r', type=int, default=5, help='timing repetitions per benchmark')
+    parser.add_argument('--min-time', type=float, default=None,
+                        help='minimum seconds per repetition (default 0.2, 0.05 with --quick)')
+    parser.add_argument('--quick', action='store_true',
+                        help='generated scenes up to 1000 segments and shorter repetitions only')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated scenes and walker positions')
+    return parser.parse_args()
+
+
+def measure(func, repeat, min_time):
+    """
+    time a function like `timeit`: the number of calls per repetition is doubled until a repetition takes at least
+    the minimum time
+    :param func: function without arguments
+    :param repeat: number of repetitions
+    :param min_time: minimum seconds per repetition
+    :return: dictionary of timing statistics in seconds per call
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number=number) < min_time:
+        number *= 2
+    times = [total / number for total in timer.repeat(repeat=repeat, number=number)]
+    return {"calls": number, "repeat": repeat, "min": min(times), "median": statistics.median(times),
+            "mean": statistics.mean(times), "stdev": statistics.stdev(times) if len(times) > 1 else 0.0}
+
+
+def config_scene(config, name):
+    """
+    scene of the configuration file
+    :param config: configuration with a `scene` section
+    :param name: name of the obstacle list in the scene section
+    :return: tuple (obstacles, robots)
+    """
+    return config["scene"][name], config["scene"]["robots"]
+
+
+def generated_scene(num_of_segments, robots, rng):
+    """
+    scene of randomly placed walls, one segment each. The area grows with the number of walls, so the density of
+    the scene stays the same
+    :param num_of_segments: number of walls
+    :param robots: robots of the scene
+    :param rng: random generator
+    :return: tuple (obstacles, robots)
+    """
+    side = 10 * math.sqrt(num_of_segments)
+    start = rng.uniform(0, side, size=(num_of_segments, 2))
+    angle = rng.uniform(0, 2 * math.pi, size=num_of_segments)
+    length = rng.uniform(1, 5, size=num_of_segments)
+    stop = start + np.stack((np.cos(angle), np.sin(angle)), axis=1) * length[:, None]
+    obstacles = [{"id": f"gen-{idx}",
+                  "description": f"wall-gen-{idx}",
+                  "render": {"type": "static", "shape": "line"},
+                  "points": [start[idx].tolist(), stop[idx].tolist()]}
+                 for idx in range(num_of_segments)]
+    return obstacles, robots
+
+
+def walker_positions(scene, count, rng):
+    """
+    random walker positions within the bounds of the static segments
+    :param scene: scene
+    :param count: number of walkers
+    :param rng: random generator
+    :return: array of shape (count, 2)
+    """
+    coords = scene.static_segments.coords
+    low = np.minimum(coords[:, :2].min(axis=0), coords[:, 2:].min(axis=0))
+    high = np.maximum(coords[:, :2].max(axis=0), coords[:, 2:].max(axis=0))
+    return rng.uniform(low, high, size=(count, 2))
+
+
+def robot_pose_updates(scene):
+    """
+    two alternating poses of the arm of the first robot, so every `update` moves it
+    :param scene: scene
+    :return: list of (obstacle id, corner points) tuples
+    """
+    robot_id = scene.robot_ids[0]
+    obstacle_id = "robot_" + robot_id + "_base_shoulder"
+    points = scene.dynamic_index[obstacle_id].line_segments[0]
+    moved = (Point(x=points.a.x + 1, y=points.a.y + 1), Point(x=points.b.x + 1, y=points.b.y + 1))
+    return [(obstacle_id, (Point(x=points.a.x, y=points.a.y), Point(x=points.b.x, y=points.b.y))),
+            (obstacle_id, moved)]
+
+
+def bench_ray_cast(scene_name, scene, rng, record):
+    """
+    time the primitive of the reference engine, one ray against every segment of the scene. It does not depend
+    on the ranging backend, so it runs once per scene
+    :param scene_name: scene name
+    :param scene: scene
+    :param rng: random generator
+    :param record: function timing a benchmark case and recording the result
+    :return:
+    """
+    origin = walker_positions(scene, 1, rng)[0]
+    segments = list(scene.get_segments())
+    ray = Ray(origin=Point(x=origin[0], y=origin[1]), angle=30)
+    record("Ray.cast", scene_name, len(segments), lambda: [ray.cast(segment) for segment in segments],
+           engine="reference")
+
+
+def bench_scene(scene_name, scene, rng, record):
+    """
+    run all benchmarks of one scene that depend on the ranging backend
+    :param scene_name: scene name
+    :param scene: scene
+    :param rng: random generator
+    :param record: function timing a benchmark case and recording the result
+    :return:
+    """
+    num_of_segments = len(scene.get_segments())
+    origin = walker_positions(scene, 1, rng)[0]
+
+    for resolution in RESOLUTIONS:
+        particle = Particle(particle_id="bench", x=origin[0], y=origin[1], resolution=resolution)
+        record("Particle.look", scene_name, num_of_segments,
+               lambda: particle.look(scene), resolution=resolution)
+        record("Particle.look_at_angle", scene_name, num_of_segments,
+               lambda: particle.look_at_angle(scene, start_angle=0, stop_angle=90),
+               resolution=resolution)
+        if num_of_segments * len(particle.ray_angles) <= REFERENCE_LIMIT:
+            reference = Particle(particle_id="bench", x=origin[0], y=origin[1], resolution=resolution,
+                                 engine="reference")
+            record("Particle.look", scene_name, num_of_segments,
+                   lambda: reference.look(scene), resolution=resolution, engine="reference")
+
+    record("StaticMap.get_segments", scene_name, num_of_segments,
+           lambda: scene.get_segments())
+    poses = robot_pose_updates(scene)
+    pose_iter = itertools.count()
+    record("StaticMap.update", scene_name, num_of_segments,
+           lambda: scene.update(*poses[next(pose_iter) % 2]))
+
+    for resolution in RESOLUTIONS:
+        for count in WALKER_COUNTS:
+            positions = walker_positions(scene, count, rng)
+            detections = [ParticleCollisionDetection(scene=scene,
+                                                     particle=Particle(particle_id=str(idx), x=x, y=y,
+                                                                       resolution=resolution),
+                                                     env_collision_distance=ENV_COLLISION_DISTANCE,
+                                                     robot_collision_distance=ROBOT_COLLISION_DISTANCE)
+                          for idx, (x, y) in enumerate(positions.tolist())]
+            step = itertools.count()
+
+            def range_each():
+                # every walker moves a little, so its view is ranged from scratch
+                jitter = 0.01 * (next(step) % 2)
+                for detection, (x, y) in zip(detections, positions.tolist()):
+                    detection.update_particles(x=x + jitter, y=y)
+                    detection.ranging()
+
+            def range_batch():
+                # every walker moves a little and all walkers are ranged together, like a workspace tick
+                jitter = 0.01 * (next(step) % 2)
+                for detection, (x, y) in zip(detections, positions.tolist()):
+                    detection.update_particles(x=x + jitter, y=y)
+                snapshot = scene.snapshot()
+                views = look_batch([detection.particle for detection in detections], snapshot)
+                for detection, view in zip(detections, views):
+                    detection.ranging(views=view, snapshot=snapshot)
+
+            record("ParticleCollisionDetection.ranging", scene_name, num_of_segments,
+                   range_each, resolution=resolution, walkers=count)
+            record("ParticleCollisionDetection.ranging[batch]", scene_name, num_of_segments,
+                   range_batch, resolution=resolution, walkers=count)
+
+
+def result_key(result):
+    """
+    key identifying a benchmark case across runs
+    :param result: benchmark result
+    :return: tuple
+    """
+    return (result["benchmark"], result["scene"], result["backend"], result["engine"], result["resolution"],
+            result["walkers"])
+
+
+def compare(results, baseline_file):
+    """
+    print the change of the fastest time per call of every benchmark case against a previous run. The minimum is
+    the least disturbed by other load on the machine
+    :param results: benchmark results
+    :param baseline_file: JSON results of the previous run
+    :return:
+    """
+    with open(baseline_file) as f:
+        baseline = {result_key(result): result for result in json.load(f)["results"]}
+    print(f"\n{'benchmark':60} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for result in results:
+        previous = baseline.get(result_key(result))
+        if previous is None:
+            continue
+        name = "/".join(str(part) for part in result_key(result) if part is not None)
+        print(f"{name:60} {previous['min']:12.3e} {result['min']:12.3e} {result['min'] / previous['min']:8.2f}")
+
+
+def git_revision():
+    """
+    git revision of the working tree
+    :return: commit hash, None outside of a git checkout
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """Benchmarks of the raycast and collision hot paths, results are written as JSON"""
+    args = parse_arguments()
+    try:
+        with open(args.config, 'r') as yaml_file:
+            config = yaml.safe_load(yaml_file)
+    except Exception as e:
+        logger.critical(f'Error while reading configuration: {e}')
+        sys.exit(-1)
+
+    min_time = args.min_time if args.min_time is not None else (0.05 if args.quick else 0.2)
+    rng = np.random.default_rng(args.seed)
+    scenes = [(name, *config_scene(config, name)) for name in CONFIG_SCENES]
+    for size in QUICK_GENERATED_SIZES if args.quick else GENERATED_SIZES:
+        scenes.append((f"generated_{size}", *generated_scene(size, config["scene"]["robots"], rng)))
+
+    results = []
+
+    def recorder(backend):
+        """function recording the benchmark cases of a ranging backend (None: independent of the backend)"""
+        def record(benchmark, name, num_of_segments, func, resolution=None, walkers=None, engine="vectorized"):
+            if args.filter is not None and args.filter not in benchmark:
+                return
+            timing = measure(func, args.repeat, min_time)
+            result = {"benchmark": benchmark, "scene": name, "segments": num_of_segments, "backend": backend,
+                      "engine": engine, "resolution": resolution, "walkers": walkers, **timing}
+            results.append(result)
+            print(f"{benchmark:42} {name:18} {str(backend):8} {engine:10} res={str(resolution):5} "
+                  f"walkers={str(walkers):4} median={timing['median']:.3e}s", flush=True)
+        return record
+
+    for scene_name, obstacles, robots in scenes:
+        scene = StaticMap(config_file={"obstacles": obstacles, "robots": robots})
+        bench_ray_cast(scene_name, scene, rng, recorder(backend=None))
+    for backend in args.backends:
+        for scene_name, obstacles, robots in scenes:
+            scene = StaticMap(config_file={"obstacles": obstacles, "robots": robots, "ranging_backend": backend})
+            bench_scene(scene_name, scene, rng, recorder(backend=backend))
+
+    output = {
+        "meta": {
+            "version": pycollisionavoidance.__version__,
+            "git_revision": git_revision(),
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,9 @@ import sys
 import signal
 import functools
 import yaml
+from concurrent.futures import ThreadPoolExecutor
 from pycollisionavoidance.collision.Avoidance import CollisionAvoidance
+from pycollisionavoidance.raycast.RangingPool import RangingPool
 
 logging.basicConfig(level=logging.WARNING, format='%(levelname)-8s [%(filename)s:%(lineno)d] %(message)s')
 
@@ -25,7 +27,8 @@ def parse_arguments():
     """Arguments to run the script"""
     parser = argparse.ArgumentParser(description='Collision Avoidance')
     parser.add_argument('--config', '-c', required=True, help= 'YAML Configuration File for Collision Avoidance with path')
-    parser.add_argument('--id', '-i', required=True, help='Personnel ID ')
+    parser.add_argument('--id', '-i', required=False, default=None,
+                        help='Personnel ID (optional). Without an ID all personnel of the workspaces are served')
     return parser.parse_args()
 
 
@@ -49,30 +52,52 @@ async def app(eventloop, config, personnel_id):
 
         logger.debug("Collision Avoidance Version: %s", walk_config['version'])
 
-        # check if amq or mqtt key description present in configuration
-        if ("amq" not in walk_config) and ("mqtt" not in walk_config):
+        # check if amq or mqtt key description present in configuration, the local transport needs no broker
+        transports = {pub_sub["type"] for workspace in walk_config["workareas"]
+                      for pub_sub in (workspace["protocol"]["publishers"] or []) +
+                      (workspace["protocol"]["subscribers"] or [])}
+        if transports != {"local"} and ("amq" not in walk_config) and ("mqtt" not in walk_config):
             logger.critical("Please provide either 'amq' or 'mqtt' configuration")
             sys.exit(-1)
 
+        # ranging processes shared by all workspaces, the event loop only does the I/O
+        ranging_processes = walk_config.get("ranging_processes", 0)
+        ranging_pool = RangingPool(processes=ranging_processes) if ranging_processes > 0 else None
+        # ranging threads keep the event loop free to consume messages while a tick computes
+        ranging_threads = walk_config.get("ranging_threads", 0)
+        ranging_executor = ThreadPoolExecutor(max_workers=ranging_threads) if ranging_threads > 0 else None
+        # ticks of a workspace ranging at a time, an overrunning tick is superseded by a newer one
+        ranging_max_in_flight = walk_config.get("ranging_max_in_flight", 1)
+
         # Personnel instantiation
         for workspace in walk_config["workareas"]:
-            ws = CollisionAvoidance(eventloop=eventloop, config_file=workspace, personnel_id= personnel_id)
+            ws = CollisionAvoidance(eventloop=eventloop, config_file=workspace, personnel_id= personnel_id,
+                                    ranging_pool=ranging_pool, ranging_executor=ranging_executor,
+                                    max_in_flight=ranging_max_in_flight)
             await ws.connect()
             workspace_collection.append(ws)
 
-        # continuously monitor signal handle and update walker
-        while not is_sighup_received:
-            for ws in workspace_collection:
-                await ws.update()
+        # continuously monitor signal handle and update walker, every workspace at its own pace
+        await asyncio.gather(*(run_workspace(ws) for ws in workspace_collection))
 
         # If SIGHUP Occurs, Delete the instances
         for entry in workspace_collection:
             del entry
+        if ranging_pool is not None:
+            ranging_pool.close()
+        if ranging_executor is not None:
+            ranging_executor.shutdown()
 
         # reset sighup handler flag
         is_sighup_received = False
 
 
+async def run_workspace(ws):
+    """Update a workspace until SIGHUP is received"""
+    while not is_sighup_received:
+        await ws.update()
+
+
 def read_config(yaml_file, rootkey):
     """Parse the given Configuration File"""
     if os.path.exists(yaml_file):
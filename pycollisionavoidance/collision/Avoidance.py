@@ -1,15 +1,20 @@
 # Python code for 2D random walk.
-import json
 import sys
 import random
 import time
 import math
 import logging
 import asyncio
+import functools
+import threading
+import numpy as np
 from pycollisionavoidance.pub_sub.AMQP import PubSubAMQP
-from pycollisionavoidance.raycast.Particle import Particle
+from pycollisionavoidance.pub_sub.Local import PubSubLocal
+from pycollisionavoidance.pub_sub.Codec import get_codec
+from pycollisionavoidance.raycast.Particle import Particle, look_batch, particle_positions
+from pycollisionavoidance.raycast.Engine import point_segment_distance
 from pycollisionavoidance.raycast.StaticMap import StaticMap
-from pycollisionavoidance.collision.Detection import ParticleCollisionDetection
+from pycollisionavoidance.collision.Detection import ParticleCollisionDetection, merge_robot_collisions
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -23,18 +28,66 @@ logger.addHandler(handler)
 # ========================================= WALK PATTERN GENERATOR ===================================================
 
 class CollisionAvoidance:
-    def __init__(self, eventloop, config_file, personnel_id):
+    def __init__(self, eventloop, config_file, personnel_id=None, ranging_pool=None, ranging_executor=None,
+                 max_in_flight=1):
         """
         Initialize Collision Avoidance
         :param eventloop: event loop for amqp pub sub
         :param config_file: configuration file
+        :param personnel_id: id of the only personnel to serve. Without an id every personnel publishing its
+                             position is served: walkers are registered on their first position message and
+                             dropped when they stay silent longer than the idle timeout of the workspace
+        :param ranging_pool: pool of ranging processes (optional). Without a pool walkers are ranged in the event loop
+        :param ranging_executor: executor ranging the walkers off the event loop (optional). A tick still ranging
+                                 at the next deadline is superseded: it stops ranging, its stop decisions are
+                                 discarded and a new tick ranges the latest positions
+        :param max_in_flight: ticks ranging in the executor at a time, superseded ticks winding down included
         """
         try:
             self.workspace_attributes = config_file["workspace"]
-            self.walkers_in_ws = []
+            self.personnel_id = personnel_id
+            self.ranging_pool = ranging_pool
+            self.ranging_executor = ranging_executor
+            assert max_in_flight > 0, f"number of ticks in flight must be positive, got {max_in_flight}"
+            self.max_in_flight = max_in_flight
+            # ticks ranging in the executor, oldest first, and whether a tick waits for a free slot
+            self.in_flight = []
+            self.tick_pending = False
+            # ticks in flight step walkers one at a time, positions are applied between the steps
+            self.step_lock = threading.Lock()
+            # deadline of the current tick and counts of ticks run, overrunning the interval, skipped and superseded
+            self.deadline = None
+            self.ticks = 0
+            self.overrun_ticks = 0
+            self.skipped_ticks = 0
+            self.superseded_ticks = 0
+            self.last_overrun_warning = 0.0
+            # walkers by walker id, and the time their last position was received
+            self.walkers_in_ws = {}
+            self.last_seen = {}
+            # latest position received per walker, applied at the start of a tick
+            self.positions = {}
+            self.idle_timeout = self.workspace_attributes.get("personnel_idle_timeout", 60)
             self.interval = self.workspace_attributes["update_interval"]
+            # "interval" ranges all walkers every update interval, "event" ranges walkers when their position or
+            # a robot near them changed, within the latency budget, and all walkers every heartbeat interval
+            self.update_mode = self.workspace_attributes.get("update_mode", "interval")
+            assert self.update_mode in ("interval", "event"), f"unknown update mode: {self.update_mode}"
+            self.latency_budget = self.workspace_attributes.get("latency_budget", 0.01)
+            self.heartbeat_interval = self.workspace_attributes.get("heartbeat_interval", 1.0)
+            self.next_heartbeat = time.monotonic()
+            # walkers to range, the time the first of them was marked and the signal waking the update
+            self.dirty = set()
+            self.first_dirty = 0.0
+            self.wakeup = asyncio.Event()
+            # all walkers of the workspace range in the same scene
+            self.scene = StaticMap(config_file=self.workspace_attributes)
             self.publishers = []
+            # publishers by exchange name
+            self.publisher_index = {}
             self.subscribers = []
+            # message codec by exchange name
+            self.codecs = {}
 
             protocol = config_file["protocol"]
             # check for protocol key
@@ -42,64 +95,98 @@ class CollisionAvoidance:
                 logger.critical("no 'protocol' key found.")
                 sys.exit(-1)
 
-            # Personnel instantiation
-            for each_walker in config_file["personnels"]:
-                # create walker
-                walker_id = personnel_id
-                # walker_id = each_walker["id"]
-                # pos = {'x': each_walker["start_coordinates"]["x"],
-                #        'y': each_walker["start_coordinates"]["y"],
-                #        'z': each_walker["start_coordinates"]["z"]}
-                pos = {'x': None, 'y': None, 'z': None}
-                env_collision_distance = each_walker["attribute"]["collision"]["distance"]["environment"]
-                robot_collision_distance = each_walker["attribute"]["collision"]["distance"]["robot"]
-
-                # Collision detection
-                walker = ParticleCollisionDetection(scene=StaticMap(config_file=self.workspace_attributes),
-                                                    particle=Particle(particle_id=walker_id, x=pos["x"], y=pos["y"]),
-                                                    env_collision_distance=env_collision_distance,
-                                                    robot_collision_distance=robot_collision_distance)
-
-                self.walkers_in_ws.append(walker)
+            # Personnel instantiation. Personnel registered later use the attributes of the first entry
+            self.personnel_attributes = config_file["personnels"][0]["attribute"]
+            if personnel_id is not None:
+                for each_walker in config_file["personnels"]:
+                    self.walkers_in_ws[personnel_id] = self._create_walker(walker_id=personnel_id,
+                                                                           attribute=each_walker["attribute"])
 
             # Publisher
             if protocol["publishers"] is not None:
                 for publisher in protocol["publishers"]:
-                    if publisher["type"] == "amq":
-                        logger.debug('Setting Up AMQP Publisher for Robot')
+                    if publisher["type"] in ("amq", "local"):
+                        logger.debug('Setting Up %s Publisher for Robot', publisher["type"])
+                        pub_sub = PubSubAMQP if publisher["type"] == "amq" else PubSubLocal
                         self.publishers.append(
-                            PubSubAMQP(
+                            pub_sub(
                                 eventloop=eventloop,
                                 config_file=publisher,
                                 binding_suffix=""
                             )
                         )
+                        self.publisher_index.setdefault(publisher["exchange"], []).append(self.publishers[-1])
+                        self.codecs[publisher["exchange"]] = get_codec(publisher.get("codec", "json"))
                     else:
-                        logger.error("Provide protocol amq config")
-                        raise AssertionError("Provide protocol amq config")
+                        logger.error("Provide protocol amq or local config")
+                        raise AssertionError("Provide protocol amq or local config")
 
             # Subscriber
             if protocol["subscribers"] is not None:
                 for subscriber in protocol["subscribers"]:
-                    if subscriber["type"] == "amq":
-                        logger.debug('Setting Up AMQP Subcriber for Robot')
+                    if subscriber["type"] in ("amq", "local"):
+                        logger.debug('Setting Up %s Subcriber for Robot', subscriber["type"])
+                        pub_sub = PubSubAMQP if subscriber["type"] == "amq" else PubSubLocal
                         self.subscribers.append(
-                            PubSubAMQP(
+                            pub_sub(
                                 eventloop=eventloop,
                                 config_file=subscriber,
                                 binding_suffix="",
                                 app_callback=self._consume_telemetry_msg
                             )
                         )
+                        self.codecs[subscriber["exchange"]] = get_codec(subscriber.get("codec", "json"))
 
                     else:
-                        logger.error("Provide protocol amq config")
-                        raise AssertionError("Provide protocol amq config")
+                        logger.error("Provide protocol amq or local config")
+                        raise AssertionError("Provide protocol amq or local config")
 
         except Exception as e:
             logger.critical("unhandled exception", e)
             sys.exit(-1)
 
+    def _create_walker(self, walker_id, attribute):
+        """
+        create collision detection for a walker
+        :param walker_id: walker id
+        :param attribute: personnel attributes of the configuration
+        :return: collision detection of the walker
+        """
+        # position is unknown until the first position message
+        pos = {'x': None, 'y': None, 'z': None}
+        env_collision_distance = attribute["collision"]["distance"]["environment"]
+        robot_collision_distance = attribute["collision"]["distance"]["robot"]
+        ranging = attribute["collision"].get("ranging", {})
+
+        particle = Particle(particle_id=walker_id,
+                            x=pos["x"],
+                            y=pos["y"],
+                            resolution=ranging.get("resolution", 1),
+                            mode=ranging.get("mode", "full"),
+                            coarse_resolution=ranging.get("coarse_resolution", 5),
+                            max_range=ranging.get("max_range"))
+
+        # Collision detection
+        return ParticleCollisionDetection(scene=self.scene,
+                                          particle=particle,
+                                          env_collision_distance=env_collision_distance,
+                                          robot_collision_distance=robot_collision_distance,
+                                          position_epsilon=ranging.get("position_epsilon", 0.0))
+
+    def _evict_idle_walkers(self):
+        """
+        drop walkers registered on demand whose last position message is older than the idle timeout
+        :return:
+        """
+        if self.personnel_id is not None or self.idle_timeout is None:
+            return
+        deadline = time.monotonic() - self.idle_timeout
+        for walker_id in [walker_id for walker_id, seen in self.last_seen.items() if seen < deadline]:
+            logger.debug(f'walker {walker_id} idle, removed')
+            del self.walkers_in_ws[walker_id]
+            del self.last_seen[walker_id]
+            self.positions.pop(walker_id, None)
+
     async def update(self):
         """
         update walk generator.
@@ -108,28 +195,268 @@ class CollisionAvoidance:
         :return:
         """
         try:
-            for walker in self.walkers_in_ws:
-                if self.interval >= 0:
-                    await walker.update(tdelta=self.interval)
-                else:
-                    await walker.update()
-
-                # collision avoidance
-                if len(walker.robot_collision) > 0:
-                    for msg in walker.robot_collision:
-                        await self.publish(exchange_name="control_robot",
-                                           msg=json.dumps(msg).encode(),
-                                           external_binding_suffix=msg["id"])
-
-            # sleep until its time for next sample
-            if self.interval >= 0:
-                await asyncio.sleep(delay=self.interval)
+            if self.update_mode == "event":
+                await self._update_on_events()
+                return
+
+            self.dirty.clear()
+            if self.deadline is None:
+                self.deadline = time.monotonic()
+            self.ticks += 1
+            if self.ranging_executor is None:
+                await self._tick()
+            else:
+                self._schedule_tick()
+
+            # sleep until its time for next sample, without an interval ticks are free running
+            if self.interval > 0:
+                await asyncio.sleep(delay=self._advance_deadline())
             else:
                 await asyncio.sleep(delay=0)
         except Exception as e:
             logger.critical("unhandled exception", e)
             sys.exit(-1)
 
+    def _advance_deadline(self):
+        """
+        move on to the deadline of the next tick. Deadlines are fixed multiples of the update interval, so the
+        rate does not drift with the time a tick takes. A tick that ends after the next deadline is an overrun:
+        the next tick starts at once and the deadlines that passed meanwhile are skipped. Free running ticks
+        (no positive update interval) have no deadline to overrun
+        :return: delay until the next tick in seconds
+        """
+        if self.interval <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.deadline += self.interval
+        if now <= self.deadline:
+            return self.deadline - now
+        missed = int((now - self.deadline) // self.interval)
+        self.overrun_ticks += 1
+        self.skipped_ticks += missed
+        self.deadline += missed * self.interval
+        if now - self.last_overrun_warning >= 1.0:
+            self.last_overrun_warning = now
+            logger.warning(f'workspace {self.workspace_attributes.get("id")}: tick overran the update interval, '
+                           f'{self.overrun_ticks} overruns, {self.skipped_ticks} ticks skipped so far')
+        return 0.0
+
+    def _schedule_tick(self):
+        """
+        start a tick ranging in the executor. A tick still in flight overran: it is superseded by a catch-up tick,
+        which starts as soon as a slot is free. A catch-up tick is not superseded itself, so stop decisions are
+        still published when the scene is too heavy for the update rate; ticks due meanwhile are skipped
+        :return:
+        """
+        # raise errors of finished ticks
+        for tick in [tick for tick in self.in_flight if tick["future"].done()]:
+            self.in_flight.remove(tick)
+            tick["future"].result()
+
+        running = [tick for tick in self.in_flight if not tick["superseded"]]
+        if len(running) == 0 and not self.tick_pending:
+            self._start_tick(catch_up=False)
+            return
+        if len(running) > 0 and not running[-1]["overran"]:
+            running[-1]["overran"] = True
+            self.overrun_ticks += 1
+        if self.tick_pending or running[-1]["catch_up"]:
+            self.skipped_ticks += 1
+            return
+        running[-1]["superseded"] = True
+        self.superseded_ticks += 1
+        self._start_tick(catch_up=True)
+
+    def _start_tick(self, catch_up):
+        """
+        start a tick if a slot is free, otherwise when the next tick in flight finishes
+        :param catch_up: True if the tick supersedes a tick that overran
+        :return:
+        """
+        if len(self.in_flight) >= self.max_in_flight:
+            self.tick_pending = True
+            return
+        self.tick_pending = False
+        tick = {"superseded": False, "catch_up": catch_up, "overran": False}
+        tick["future"] = asyncio.ensure_future(self._tick(tick=tick))
+        tick["future"].add_done_callback(functools.partial(self._tick_done, tick))
+        self.in_flight.append(tick)
+
+    def _tick_done(self, tick, future):
+        """
+        free the slot of a finished tick and start the tick waiting for it
+        :param tick: finished tick
+        :param future: future of the tick
+        :return:
+        """
+        if future.exception() is not None:
+            # raised by the next update
+            return
+        self.in_flight.remove(tick)
+        if self.tick_pending:
+            self._start_tick(catch_up=True)
+
+    def get_tick_statistics(self):
+        """
+        get counts of the ticks
+        :return: dictionary of ticks run (fixed rate or event driven), ticks that overran the update interval,
+                 ticks skipped and ticks superseded by a newer tick
+        """
+        return {"ticks": self.ticks, "overrun_ticks": self.overrun_ticks, "skipped_ticks": self.skipped_ticks,
+                "superseded_ticks": self.superseded_ticks}
+
+    async def _update_on_events(self):
+        """
+        range the walkers marked dirty by telemetry. Telemetry arriving within the latency budget after the first
+        mark is coalesced into one ranging, all walkers are ranged at least every heartbeat interval
+        :return:
+        """
+        timeout = self.next_heartbeat - time.monotonic()
+        if timeout > 0 and not self.wakeup.is_set():
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        if self.wakeup.is_set():
+            await asyncio.sleep(delay=max(0.0, self.first_dirty + self.latency_budget - time.monotonic()))
+        self.wakeup.clear()
+
+        walker_ids = self.dirty
+        self.dirty = set()
+        if time.monotonic() >= self.next_heartbeat:
+            # safety heartbeat
+            walker_ids = None
+            self.next_heartbeat = time.monotonic() + self.heartbeat_interval
+        # event ticks count like fixed rate ticks, they evict idle walkers as well
+        self.ticks += 1
+        await self._tick(walker_ids=walker_ids)
+
+    def _mark_dirty(self, walker_ids):
+        """
+        mark walkers to be ranged by the next event driven update
+        :param walker_ids: iterable of walker ids
+        :return:
+        """
+        if not self.dirty:
+            self.first_dirty = time.monotonic()
+        self.dirty.update(walker_ids)
+        if self.dirty:
+            self.wakeup.set()
+
+    def _walkers_near(self, moved):
+        """
+        walkers that may see segments that moved
+        :param moved: coordinate array of moved segments, None if unknown
+        :return: list of walker ids
+        """
+        if moved is None:
+            return list(self.walkers_in_ws)
+        if len(moved) == 0:
+            return []
+        walker_ids = []
+        located = []
+        for walker_id, walker in self.walkers_in_ws.items():
+            particle = walker.particle
+            if particle.pos.x is None or particle.pos.y is None:
+                continue
+            if particle.max_range is None:
+                walker_ids.append(walker_id)
+            else:
+                located.append((walker_id, particle.pos.x, particle.pos.y, particle.max_range))
+        if located:
+            _, x, y, max_range = (np.array(column) for column in zip(*located))
+            distance = point_segment_distance(x[:, None], y[:, None], moved).min(axis=1)
+            walker_ids.extend(walker_id for (walker_id, _, _, _), near in zip(located, distance <= max_range)
+                              if near)
+        return walker_ids
+
+    async def _tick(self, walker_ids=None, tick=None):
+        """
+        range walkers once and publish the robot control messages
+        :param walker_ids: ids of the walkers to range (optional, default all walkers)
+        :param tick: record of a tick ranging in the executor (optional). A superseded tick publishes nothing
+        :return:
+        """
+        self._evict_idle_walkers()
+        self._apply_positions()
+        if walker_ids is None:
+            walkers = list(self.walkers_in_ws.values())
+        else:
+            walkers = [self.walkers_in_ws[walker_id] for walker_id in walker_ids if walker_id in self.walkers_in_ws]
+
+        # all walkers of the tick range the same snapshot of the scene, robot updates received while
+        # ranging go to the next tick
+        snapshot = self.scene.snapshot()
+        # walkers whose view can not be reused are ranged in one pass over the scene,
+        # the others update their view incrementally
+        stale = [idx for idx, walker in enumerate(walkers) if walker.needs_full_ranging(snapshot)]
+        # positions of the stale walkers are copied here, telemetry applied by the next tick while this one
+        # ranges in the executor must not mix into them
+        positions = particle_positions([walkers[idx].particle for idx in stale])
+        batch = None
+        if self.ranging_pool is not None:
+            batch = await self.ranging_pool.look_batch(scene_key=id(self.scene),
+                                                       particles=[walkers[idx].particle for idx in stale],
+                                                       snapshot=snapshot, positions=positions)
+        if self.ranging_executor is not None:
+            await asyncio.get_running_loop().run_in_executor(self.ranging_executor, self._range, walkers, stale,
+                                                             positions, snapshot, batch, tick)
+        else:
+            self._range(walkers=walkers, stale=stale, positions=positions, snapshot=snapshot, batch=batch)
+        if tick is not None and tick["superseded"]:
+            return  # stop decisions from stale positions
+
+        # collision avoidance, one stop message per robot for all walkers, sent at once
+        codec = self.codecs.get("control_robot")
+        if codec is None:
+            return  # no robot control publisher
+        control_msgs = [(codec.encode(msg, schema="control"), msg["id"])
+                        for msg in merge_robot_collisions(walker.robot_collision for walker in walkers)]
+        if len(control_msgs) > 0:
+            await self.publish_batch(exchange_name="control_robot", msgs=control_msgs)
+
+    def _range(self, walkers, stale, positions, snapshot, batch=None, tick=None):
+        """
+        range walkers against a snapshot of the scene. Runs in the ranging executor if there is one, so it
+        must not touch state the event loop modifies (positions are copied before, messages published after)
+        :param walkers: list of walkers
+        :param stale: indices of the walkers that need to be ranged from scratch
+        :param positions: (x, y) positions of the stale walkers, copied on the event loop
+        :param snapshot: scene snapshot
+        :param batch: views of the stale walkers ranged already (optional)
+        :param tick: record of the tick (optional), a superseded tick stops before the next walker
+        :return:
+        """
+        if batch is None:
+            batch = look_batch(particles=[walkers[idx].particle for idx in stale], segments=snapshot,
+                               positions=positions)
+        views = [None] * len(walkers)
+        ranged_positions = [None] * len(walkers)
+        for idx, view, position in zip(stale, batch, positions):
+            if view is not None:
+                views[idx] = view
+                ranged_positions[idx] = position
+        for walker, view, ranged_pos in zip(walkers, views, ranged_positions):
+            if tick is not None and tick["superseded"]:
+                return
+            with self.step_lock:
+                if self.interval >= 0:
+                    walker.step(tdelta=self.interval, views=view, snapshot=snapshot, ranged_pos=ranged_pos)
+                else:
+                    walker.step(views=view, snapshot=snapshot, ranged_pos=ranged_pos)
+
+    def _apply_positions(self):
+        """
+        move the walkers to the latest positions received
+        :return:
+        """
+        with self.step_lock:
+            for walker_id, (x, y) in self.positions.items():
+                walker = self.walkers_in_ws.get(walker_id)
+                if walker is not None:
+                    walker.update_particles(x=x, y=y)
+        self.positions.clear()
+
     def get_states(self):
         return {"x_ref_pos": self.pos['x'], "y_ref_pos ": self.pos['y'], "z_ref_pos": self.pos['z']}
 
@@ -141,11 +468,19 @@ class CollisionAvoidance:
         :param external_binding_suffix: binding suffix. suffix is appended to the end of binding namedd
         :return:
         '''
+        await self.publish_batch(exchange_name=exchange_name, msgs=[(msg, external_binding_suffix)])
+
+    async def publish_batch(self, exchange_name, msgs):
+        '''
+        publishes several amqp messages concurrently
+        :param exchange_name: name of amqp exchange
+        :param msgs: list of (message, binding suffix or None) tuples
+        :return:
+        '''
         try:
-            for publisher in self.publishers:
-                if exchange_name == publisher.exchange_name:
-                    await publisher.publish(message_content=msg, external_binding_suffix=external_binding_suffix)
-                    logger.debug(f'pub: {msg}')
+            await asyncio.gather(*(publisher.publish_batch(messages=msgs)
+                                   for publisher in self.publisher_index.get(exchange_name, [])))
+            logger.debug(f'pub: {msgs}')
         except Exception as e:
             logger.critical("unhandled exception", e)
             sys.exit(-1)
@@ -177,56 +512,52 @@ class CollisionAvoidance:
         # extract message attributes from message
         exchange_name = kwargs["exchange_name"]
         binding_name = kwargs["binding_name"]
-        message_body = json.loads(kwargs["message_body"])
-
-        # check for matching subscriber with exchange and binding name in all subscribers
-        for subscriber in self.subscribers:
-            if subscriber.exchange_name == exchange_name:
-                if "rmt.robot." in binding_name:
-                    # extract robot id from binding name
-                    binding_delimited_array = binding_name.split(".")
-                    robot_id = binding_delimited_array[len(binding_delimited_array) - 1]
-                    msg_attributes = message_body.keys()
-
-                    # check for must fields in the message attributes
-                    if ("id" in msg_attributes) and ("base" in msg_attributes) \
-                            and ("shoulder" in msg_attributes) and ("elbow" in msg_attributes):
-
-                        # check if robot id matches with 'id' field in the message
-                        if robot_id == message_body["id"]:
-                            # extract information from message body
-                            base_shoulder = [message_body["base"], message_body["shoulder"]]
-                            shoulder_elbow = [message_body["shoulder"], message_body["elbow"]]
-                            elbow_wrist = [message_body["elbow"], message_body["wrist"]]
-                            prefix = "robot_" + message_body["id"]
-                            for walker in self.walkers_in_ws:
-                                # update robot in scene for collision detection
-                                walker.update_scene(obstacle_id=prefix + "_base_shoulder",
-                                                    points=base_shoulder,
-                                                    shape="line")
-                                walker.update_scene(obstacle_id=prefix + "_shoulder_elbow",
-                                                    points=shoulder_elbow,
-                                                    shape="line")
-                                walker.update_scene(obstacle_id=prefix + "_elbow_wrist",
-                                                    points=elbow_wrist,
-                                                    shape="line")
-                elif "plm.walker." in binding_name:
-                    # extract walker id
-                    binding_delimited_array = binding_name.split(".")
-                    walker_id = binding_delimited_array[len(binding_delimited_array) - 1]
-                    msg_attributes = message_body.keys()
-                    if ("id" in msg_attributes) and \
-                            ("x_est_pos" in msg_attributes) and \
-                            ("y_est_pos" in msg_attributes) and \
-                            ("z_est_pos" in msg_attributes) and \
-                            ("timestamp" in msg_attributes):
-                        for walker in self.walkers_in_ws:
-                            if walker.id == walker_id and walker_id == message_body["id"]:
-                                logger.debug(f'sub: exchange {exchange_name}: msg {message_body}')
-                                walker.update_particles(x=message_body["x_est_pos"],
-                                                        y=message_body["y_est_pos"])
-                                break
-                        else:
-                            return False  # robot id in binding name and message body does not match
-                    else:
-                        return False  # invalid message body format
+
+        # decoder of the subscribed exchange, decoding checks the message fields
+        codec = self.codecs.get(exchange_name)
+        if codec is None:
+            return False
+        if "rmt.robot." in binding_name:
+            message_body = codec.decode(kwargs["message_body"], schema="robot")
+            if message_body is None:
+                return False  # invalid message body format
+
+            # extract robot id from binding name
+            binding_delimited_array = binding_name.split(".")
+            robot_id = binding_delimited_array[len(binding_delimited_array) - 1]
+
+            # check if robot id matches with 'id' field in the message
+            if robot_id == message_body["id"]:
+                # update robot in the shared scene for collision detection, all links at once
+                version = self.scene.version
+                updated = self.scene.update_robot_pose(robot_id=robot_id,
+                                                       base=message_body["base"],
+                                                       shoulder=message_body["shoulder"],
+                                                       elbow=message_body["elbow"],
+                                                       wrist=message_body["wrist"])
+                if updated and self.update_mode == "event":
+                    self._mark_dirty(self._walkers_near(self.scene.changes_since(version)))
+                return updated
+        elif "plm.walker." in binding_name:
+            message_body = codec.decode(kwargs["message_body"], schema="walker")
+            if message_body is None:
+                return False  # invalid message body format
+
+            # extract walker id
+            binding_delimited_array = binding_name.split(".")
+            walker_id = binding_delimited_array[len(binding_delimited_array) - 1]
+            if walker_id != message_body["id"]:
+                return False  # walker id in binding name and message body does not match
+            walker = self.walkers_in_ws.get(walker_id)
+            if walker is None:
+                if self.personnel_id is not None:
+                    return False  # walker is not served by this instance
+                # first position of the walker, register it
+                logger.debug(f'walker {walker_id} registered')
+                walker = self._create_walker(walker_id=walker_id, attribute=self.personnel_attributes)
+                self.walkers_in_ws[walker_id] = walker
+            logger.debug(f'sub: exchange {exchange_name}: msg {message_body}')
+            self.positions[walker_id] = (message_body["x_est_pos"], message_body["y_est_pos"])
+            self.last_seen[walker_id] = time.monotonic()
+            if self.update_mode == "event":
+                self._mark_dirty((walker_id,))
@@ -1,6 +1,10 @@
 import sys
 import time
+import math
+import numpy as np
 from pycollisionavoidance.raycast.Point import Point, LineSegment
+from pycollisionavoidance.raycast.Geometry import CATEGORY_ROBOT
+from pycollisionavoidance.raycast.Engine import point_segment_distance
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,6 +16,21 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 
 
+def merge_robot_collisions(robot_collision_msgs):
+    """
+    merge the stop decisions of several particles, at most one per robot with the nearest distance and its angle
+    :param robot_collision_msgs: lists of robot control messages, one list per particle
+    :return: list of robot control messages in order of first appearance of the robots
+    """
+    nearest = {}
+    for msgs in robot_collision_msgs:
+        for msg in msgs:
+            current = nearest.get(msg["id"])
+            if current is None or msg["distance"] < current["distance"]:
+                nearest[msg["id"]] = msg
+    return list(nearest.values())
+
+
 class ParticleCollisionDetection:
     """
     This class ranges the distance between following using 2D ray cast algorithm
@@ -19,20 +38,27 @@ class ParticleCollisionDetection:
     2. particle (human worker) and robot (dynamic obstacles)
     """
 
-    def __init__(self, scene, particle, env_collision_distance, robot_collision_distance):
+    def __init__(self, scene, particle, env_collision_distance, robot_collision_distance, position_epsilon=0.0):
         """
         Initializes collision detection
         :param scene: scene object
         :param particle: particle object
         :param env_collision_distance: environment obstacle collision distance
         :param robot_collision_distance: robot (obstacle) collision distance
+        :param position_epsilon: distance the particle may move before its view is ranged again
         """
         self.scene = scene
         self.id = particle.id
         self.particle = particle
         self.views = None
+        # snapshot of the scene the view was ranged in
+        self.snapshot = None
         self.env_collision_distance = env_collision_distance
         self.robot_collision_distance = robot_collision_distance
+        self.position_epsilon = position_epsilon
+        # particle position and scene version the view was ranged at
+        self.ranged_pos = None
+        self.scene_version = None
         self.time_now = 0
         self.time_past = 0
         self.robot_collision = []
@@ -71,41 +97,59 @@ class ParticleCollisionDetection:
     def get_environmental_collision_distance(self):
         """
         get environmental collision distance between static obstacles and particle (human worker)
-        :return: array consisting of map {obstacle id ,distance from the particle}
+        :return: view of the rays with an obstacle farther than the environment collision distance.
+                 Iterating over it yields maps {obstacle id ,distance from the particle}
         """
-        result = []
-        for item in self.views:
-            if item['distance'] is not None:
-                if item['distance'] > self.env_collision_distance:
-                    result.append(item)
-        return result
+        return self.views.select(self.views.farther_than(self.env_collision_distance))
 
     def get_robot_collision_distance(self):
         """
         get robot collision distance between robot and particle (human worker)
-        :return:  array consisting of {robot id,control message}
+        :return:  array consisting of {robot id,control message}, at most one per robot with the distance and angle
+                  of the nearest hit on the robot
         """
         robot_control_msg = []
-        for item in self.views:
-            if item['distance'] is not None:
-                if item['distance'] < self.robot_collision_distance:
-                    view_substring = item['obstacle'].split("_")
-                    if "robot" in view_substring:
-                        robot_control_msg.append({"id": view_substring[1], "control": "stop"})
+        rows = self.views.closer_than(self.robot_collision_distance)
+        segments = self.views.obstacle_index[rows]
+        robots = self.snapshot.segment_robot[segments]
+        on_robot = self.snapshot.segment_category[segments] == CATEGORY_ROBOT
+        rows, robots = rows[on_robot], robots[on_robot]
+        if len(rows) == 0:
+            return robot_control_msg
+
+        # nearest hit per robot
+        distances = self.views.distances[rows]
+        order = np.lexsort((distances, robots))
+        nearest = order[np.r_[True, robots[order][1:] != robots[order][:-1]]]
+        for robot, row, distance in zip(robots[nearest].tolist(), rows[nearest].tolist(),
+                                        distances[nearest].tolist()):
+            robot_control_msg.append({"id": self.snapshot.robot_tags[robot],
+                                      "control": "stop",
+                                      "distance": distance,
+                                      "angle": self.views.angle_table[self.views.ray_ids[row]]})
         return robot_control_msg
 
-    def ranging(self):
+    def ranging(self, views=None, snapshot=None, ranged_pos=None):
         """
         range (measure distances) from the obstacles.
-        Ranging is done 360 degree with 1 degree increment about a particle
+        Ranging is done 360 degree about a particle with the angular resolution of the particle
         and ranging result is added to an distance
+        :param views: view of the particle already ranged together with other particles (optional)
+        :param snapshot: scene snapshot to range in, the views must have been ranged in it (optional, default
+                         the current snapshot of the scene)
+        :param ranged_pos: (x, y) position the views were ranged at (optional, default the current position)
         :return:
         """
         result = []
         robot_control_msg = []
 
-        # ranging about the particle
-        self.views = self.particle.look(self.scene.get_segments())
+        # ranging about the particle, against one consistent state of the scene
+        snapshot = snapshot if snapshot is not None else self.scene.snapshot()
+        if views is not None:
+            self.views = views
+            self._mark_ranged(snapshot, ranged_pos)
+        else:
+            self.views = self._look(snapshot)
 
         # get environment collision distance
         env_collision_distance = self.get_environmental_collision_distance()
@@ -115,6 +159,66 @@ class ParticleCollisionDetection:
 
         return env_collision_distance, robot_collision_msg
 
+    def needs_full_ranging(self, snapshot=None):
+        """
+        check if the view has to be ranged from scratch: no view yet, the particle moved more than the position
+        epsilon since it was ranged or the scene changed in a way that can not be tracked
+        :param snapshot: scene snapshot to range in (optional, default the current snapshot of the scene)
+        :return: True if the whole view has to be ranged
+        """
+        snapshot = snapshot if snapshot is not None else self.scene.snapshot()
+        if self.views is None or self.ranged_pos is None or self.particle.pos.x is None or self.particle.pos.y is None:
+            return True
+        if math.hypot(self.particle.pos.x - self.ranged_pos[0],
+                      self.particle.pos.y - self.ranged_pos[1]) > self.position_epsilon:
+            return True
+        return self.scene.changes_since(self.scene_version, until=snapshot.version) is None
+
+    def _mark_ranged(self, snapshot, ranged_pos=None):
+        """
+        remember the particle position and the scene snapshot the view was ranged at
+        :param snapshot: scene snapshot
+        :param ranged_pos: (x, y) position the view was ranged at (optional, default the current position)
+        :return:
+        """
+        x, y = ranged_pos if ranged_pos is not None else (self.particle.pos.x, self.particle.pos.y)
+        if x is None or y is None:
+            self.ranged_pos = None
+        else:
+            self.ranged_pos = (x, y)
+        self.snapshot = snapshot
+        self.scene_version = snapshot.version
+
+    def _look(self, snapshot):
+        """
+        range the view, reusing the previous one as far as possible.
+        The view is reused if the particle barely moved and no moving obstacle in range was updated, otherwise
+        only the rays across the moved obstacles are cast again
+        :param snapshot: scene snapshot to range in
+        :return: view of the particle
+        """
+        near_distance = max(self.env_collision_distance, self.robot_collision_distance)
+        if self.needs_full_ranging(snapshot):
+            self._mark_ranged(snapshot)
+            return self.particle.look(snapshot, near_distance=near_distance)
+
+        # moved segments, both at their previous and their current position
+        moved = self.scene.changes_since(self.scene_version, until=snapshot.version)
+        self.snapshot = snapshot
+        self.scene_version = snapshot.version
+        if self.particle.max_range is not None:
+            moved = moved[point_segment_distance(self.particle.pos.x, self.particle.pos.y, moved)
+                          <= self.particle.max_range]
+        if len(moved) == 0:
+            return self.views
+        if self.particle.mode != "full":
+            # the adaptive view only holds the rays cast, there is no ray to patch
+            return self.particle.look(snapshot, near_distance=near_distance)
+
+        # the full view holds one entry per ray of the sweep, in ray order
+        ray_ids = self.particle.rays_across(moved)
+        return self.views.replace(ray_ids, self.particle.look_rays(snapshot, ray_ids=ray_ids))
+
     def get_view(self):
         """
         get view of the scene around
@@ -122,10 +226,23 @@ class ParticleCollisionDetection:
         """
         return self.views
 
-    async def update(self, tdelta=-1):
+    async def update(self, tdelta=-1, views=None, snapshot=None):
         """
         update walker position in 3D
         :param tdelta: time duration between successive updates
+        :param views: view of the particle already ranged together with other particles (optional)
+        :param snapshot: scene snapshot the views were ranged in (optional)
+        :return:
+        """
+        self.step(tdelta=tdelta, views=views, snapshot=snapshot)
+
+    def step(self, tdelta=-1, views=None, snapshot=None, ranged_pos=None):
+        """
+        update walker synchronously, e.g. in a ranging thread. See `update`
+        :param tdelta: time duration between successive updates
+        :param views: view of the particle already ranged together with other particles (optional)
+        :param snapshot: scene snapshot the views were ranged in (optional)
+        :param ranged_pos: (x, y) position the views were ranged at (optional, default the current position)
         :return:
         """
         try:
@@ -134,9 +251,10 @@ class ParticleCollisionDetection:
                 # valid time delta received as input paramter
                 timedelta = tdelta
             elif self.time_now == 0 and self.time_past == 0:
-                # time delta calculation for first update cycle
+                # first update cycle, no time has passed yet
                 self.time_now = time.time()
-                timedelta = self.interval
+                self.time_past = self.time_now
+                timedelta = 0
             else:
                 # time delta calculation based on run time
                 self.time_now = time.time()
@@ -146,7 +264,8 @@ class ParticleCollisionDetection:
             assert (timedelta >= 0), f"Time delta: {timedelta},  can't be negative"
 
             # Calculate Walk angle for next step, and also check if walker is in collision course
-            self.env_collision, self.robot_collision = self.ranging()
+            self.env_collision, self.robot_collision = self.ranging(views=views, snapshot=snapshot,
+                                                                    ranged_pos=ranged_pos)
 
         except Exception as e:
             logger.critical("unhandled exception", e)
@@ -1,4 +1,5 @@
 import sys
+import asyncio
 from aio_pika import connect_robust, Message, DeliveryMode, ExchangeType, IncomingMessage
 from aio_pika import exceptions as aio_pika_exception
 import logging
@@ -20,6 +21,12 @@ class PubSubAMQP:
         - binding_suffix: Binding Suffix necessary for Publishing on dedicated routing key
         - mode: Publish/Subscribe (default: 'publisher')
         - app_callback: Callback function  (default: None)
+        Optional publisher settings in config_file:
+        - publisher_confirms: wait for the broker to confirm every published message (default: True)
+        Optional subscriber settings in config_file:
+        - prefetch_count: messages the broker sends ahead of their acknowledgement (default: 1)
+        - ack_batch_size: messages acknowledged together with one multiple acknowledgement (default: 1)
+        - coalesce: pass only the latest message of each routing key of a burst to the callback (default: False)
         """
         try:
             self.broker_info = config_file["broker"]
@@ -35,6 +42,16 @@ class PubSubAMQP:
             self.channel = None
             self.exchange = None
             self.app_callback = app_callback
+            self.publisher_confirms = config_file.get("publisher_confirms", True)
+            self.prefetch_count = config_file.get("prefetch_count", 1)
+            self.ack_batch_size = config_file.get("ack_batch_size", 1)
+            self.coalesce = config_file.get("coalesce", False)
+            # last message received and not acknowledged yet, number of such messages
+            self.unacked_message = None
+            self.num_of_unacked = 0
+            # latest message per routing key waiting for the callback (coalescing), in order of arrival
+            self.pending = {}
+            self.flush_scheduled = False
 
             logger.debug('RabbitMQ Exchange: %s', self.exchange_name)
             logger.debug('Binding Suffix: %s', self.binding_suffix)
@@ -55,9 +72,12 @@ class PubSubAMQP:
                 port=self.broker_info["port"],
                 loop=self.eventloop
             )
-            self.channel = await self.connection.channel()
+            self.channel = await self.connection.channel(publisher_confirms=self.publisher_confirms)
             if mode == "subscriber":
                 await self._sub_connect()
+            else:
+                # declared once, publishing reuses the exchange
+                self.exchange = await self.channel.declare_exchange(self.exchange_name, ExchangeType.FANOUT)
         except aio_pika_exception.AMQPException as e:
             logger.error('Exception while Connecting to Broker')
             logger.error(e)
@@ -66,7 +86,7 @@ class PubSubAMQP:
     async def _sub_connect(self):
         """_sub_connect: private method for subscribing data to Broker. Setup dedicated channel, exchange"""
         try:
-            await self.channel.set_qos(prefetch_count=1)
+            await self.channel.set_qos(prefetch_count=self.prefetch_count)
             self.exchange = await self.channel.declare_exchange(self.exchange_name, ExchangeType.FANOUT)
             queue = await self.channel.declare_queue(exclusive=True)
             for binding in self.binding_keys:
@@ -79,37 +99,82 @@ class PubSubAMQP:
             sys.exit(-1)
 
     async def _sub_on_message(self, message: IncomingMessage):
-        """_sub_on_message: private method to handle consumption of message during subscription"""
+        """_sub_on_message: private method to handle consumption of message during subscription.
+        Messages are acknowledged in batches. With coalescing a newer message of a routing key replaces the one
+        waiting, the waiting messages are passed to the callback once the burst received so far is consumed
+        """
+        logger.debug(f"msg received: Exchange {message.exchange}, Routing {message.routing_key}")
+        if self.coalesce:
+            self.pending.pop(message.routing_key, None)
+            self.pending[message.routing_key] = message
+        else:
+            self._deliver(message)
+        self.unacked_message = message
+        self.num_of_unacked += 1
+        if not self.coalesce and self.num_of_unacked >= self.ack_batch_size:
+            self._ack()
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            asyncio.get_event_loop().call_soon(self._flush)
 
-        async with message.process():
-            logger.debug(f"msg received: Exchange {message.exchange}, Routing {message.routing_key}")
-            if self.app_callback is not None:
+    def _deliver(self, message):
+        """_deliver: private method passing a message to the callback"""
+        if self.app_callback is not None:
+            try:
                 self.app_callback(
                     exchange_name=message.exchange,
                     binding_name=message.routing_key,
                     message_body=message.body
                 )
+            except Exception as e:
+                logger.error(f'Exception while consuming message: Exchange {message.exchange}, '
+                             f'Routing {message.routing_key}')
+                logger.error(e)
+
+    def _flush(self):
+        """_flush: private method passing the coalesced messages to the callback and acknowledging all received"""
+        self.flush_scheduled = False
+        pending = self.pending
+        self.pending = {}
+        for message in pending.values():
+            self._deliver(message)
+        self._ack()
+
+    def _ack(self):
+        """_ack: private method acknowledging all messages received so far with one multiple acknowledgement"""
+        if self.unacked_message is not None:
+            self.unacked_message.ack(multiple=True)
+            self.unacked_message = None
+            self.num_of_unacked = 0
 
     async def publish(self, message_content, priority=0, external_binding_suffix=None):
         """publish: Produce Message to Message Broker
         - message_content: payload of message to be published
         - priority: message priority
+        - external_binding_suffix: binding suffix used instead of the default one (optional)
+        """
+        await self.publish_batch(messages=[(message_content, external_binding_suffix)], priority=priority)
+
+    async def publish_batch(self, messages, priority=0):
+        """publish_batch: Produce several Messages to Message Broker at once. All messages are sent before waiting
+        for the broker, with publisher confirms the call returns once every message is confirmed
+        - messages: list of (payload, external binding suffix or None) tuples
+        - priority: message priority
         """
         try:
-            self.exchange = await self.channel.declare_exchange(self.exchange_name, ExchangeType.FANOUT)
-            for binding_key in self.binding_keys:
-                message = Message(
-                    body=message_content,
-                    delivery_mode=DeliveryMode.NOT_PERSISTENT,
-                    priority=priority
-                )
-                # logger.debug(
-                #     f'msg Publish: Exchange: {self.exchange_name}, Routing:{binding_key + self.binding_suffix}'
-                # )
-                if external_binding_suffix is not None:
-                    await self.exchange.publish(message, routing_key=binding_key + external_binding_suffix)
-                else:
-                    await self.exchange.publish(message, routing_key=binding_key + self.binding_suffix)
+            if self.exchange is None:
+                self.exchange = await self.channel.declare_exchange(self.exchange_name, ExchangeType.FANOUT)
+            publishes = []
+            for message_content, external_binding_suffix in messages:
+                suffix = external_binding_suffix if external_binding_suffix is not None else self.binding_suffix
+                for binding_key in self.binding_keys:
+                    message = Message(
+                        body=message_content,
+                        delivery_mode=DeliveryMode.NOT_PERSISTENT,
+                        priority=priority
+                    )
+                    publishes.append(self.exchange.publish(message, routing_key=binding_key + suffix))
+            await asyncio.gather(*publishes)
         except aio_pika_exception.AMQPException as e:
             logger.error(e)
             await self.terminate()
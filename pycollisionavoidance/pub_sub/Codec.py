@@ -0,0 +1,166 @@
+import json
+import math
+import struct
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+handler = logging.FileHandler('/tmp/walkgen.log')
+handler.setLevel(logging.ERROR)
+formatter = logging.Formatter('%(levelname)-8s-[%(filename)s:%(lineno)d]-%(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# message schemas: tuples of (field, kind). Kinds are "str", "float" and "point" ([x, y])
+SCHEMAS = {
+    "walker": (("id", "str"), ("x_est_pos", "float"), ("y_est_pos", "float"), ("z_est_pos", "float"),
+               ("timestamp", "float")),
+    "robot": (("id", "str"), ("base", "point"), ("shoulder", "point"), ("elbow", "point"), ("wrist", "point")),
+    "control": (("id", "str"), ("control", "str"), ("distance", "float"), ("angle", "float")),
+}
+
+
+class JSONCodec:
+    """
+    JSON messages with the standard library (default)
+    """
+    name = "json"
+
+    def encode(self, msg, schema):
+        """
+        encode a message
+        :param msg: message dictionary
+        :param schema: schema name
+        :return: message body
+        """
+        return json.dumps(msg).encode()
+
+    def decode(self, body, schema):
+        """
+        decode a message and check that it has all fields of the schema
+        :param body: message body
+        :param schema: schema name
+        :return: message dictionary, None if the body is no valid message of the schema
+        """
+        try:
+            msg = json.loads(body)
+        except ValueError:
+            return None
+        return msg if _has_fields(msg, schema) else None
+
+
+class ORJSONCodec(JSONCodec):
+    """
+    JSON messages with orjson
+    """
+    name = "orjson"
+
+    def encode(self, msg, schema):
+        return orjson.dumps(msg)
+
+    def decode(self, body, schema):
+        try:
+            msg = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return None
+        return msg if _has_fields(msg, schema) else None
+
+
+class StructCodec:
+    """
+    Fixed layout binary messages: a schema tag byte, the string fields as length (one byte) and UTF-8 bytes,
+    then all numbers as little endian doubles (two per point)
+    """
+    name = "struct"
+
+    def __init__(self):
+        # per schema: tag, string fields, number fields with their position in the number block and the struct
+        # of the number block
+        self.layouts = {}
+        for tag, (schema, fields) in enumerate(SCHEMAS.items()):
+            strings = tuple(field for field, kind in fields if kind == "str")
+            numbers = []
+            num_of_doubles = 0
+            for field, kind in fields:
+                if kind != "str":
+                    numbers.append((field, kind, num_of_doubles))
+                    num_of_doubles += 2 if kind == "point" else 1
+            self.layouts[schema] = (tag, strings, tuple(numbers), struct.Struct(f'<{num_of_doubles}d'))
+
+    def encode(self, msg, schema):
+        tag, strings, numbers, layout = self.layouts[schema]
+        body = bytearray((tag,))
+        for field in strings:
+            value = str(msg[field]).encode()
+            assert len(value) < 256, f"{field} too long for the struct codec"
+            body.append(len(value))
+            body += value
+        values = []
+        for field, kind, _ in numbers:
+            if kind == "point":
+                values.extend(msg[field][:2])
+            else:
+                values.append(msg[field])
+        return bytes(body) + layout.pack(*values)
+
+    def decode(self, body, schema):
+        tag, strings, numbers, layout = self.layouts[schema]
+        if len(body) == 0 or body[0] != tag:
+            return None
+        msg = {}
+        offset = 1
+        for field in strings:
+            if offset >= len(body):
+                return None
+            end = offset + 1 + body[offset]
+            try:
+                msg[field] = bytes(body[offset + 1:end]).decode()
+            except UnicodeDecodeError:
+                return None
+            offset = end
+        if len(body) - offset != layout.size:
+            return None
+        values = layout.unpack_from(body, offset)
+        if not all(math.isfinite(value) for value in values):
+            return None
+        for field, kind, idx in numbers:
+            msg[field] = [values[idx], values[idx + 1]] if kind == "point" else values[idx]
+        return msg
+
+
+def _has_fields(msg, schema):
+    """
+    check that a decoded JSON message has all fields of a schema
+    :param msg: decoded message
+    :param schema: schema name
+    :return: True if the message is valid
+    """
+    if not isinstance(msg, dict):
+        return False
+    for field, _ in SCHEMAS[schema]:
+        if field not in msg:
+            return False
+    return True
+
+
+def get_codec(name="json"):
+    """
+    get message codec by name
+    :param name: "json", "orjson" (falls back to "json" if orjson is not installed) or "struct"
+    :return: codec
+    """
+    if name == "json":
+        return JSONCodec()
+    if name == "orjson":
+        if orjson is None:
+            logger.warning("orjson is not installed, using json codec")
+            return JSONCodec()
+        return ORJSONCodec()
+    if name == "struct":
+        return StructCodec()
+    raise AssertionError(f"unknown codec: {name}")
@@ -0,0 +1,177 @@
+import sys
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+handler = logging.FileHandler('/tmp/walkgen.log')
+handler.setLevel(logging.ERROR)
+formatter = logging.Formatter('%(levelname)-8s-[%(filename)s:%(lineno)d]-%(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+EXCHANGE_TYPES = ("fanout", "direct", "topic")
+
+
+class LocalBroker:
+    """
+    In memory message broker. Exchanges route published messages to the bound subscribers of the same process:
+    "fanout" to every subscriber, "direct" to bindings equal to the routing key and "topic" to bindings matching
+    the routing key, where `*` stands for one word and `#` for any number of words
+    """
+
+    def __init__(self):
+        # exchange name -> exchange type
+        self.exchanges = {}
+        # exchange name -> list of (binding key words, binding key, subscriber)
+        self.bindings = {}
+
+    def declare_exchange(self, exchange_name, exchange_type):
+        """
+        declare an exchange, redeclaring it with another type fails like on an AMQP broker
+        :param exchange_name: exchange name
+        :param exchange_type: "fanout", "direct" or "topic"
+        :return:
+        """
+        assert exchange_type in EXCHANGE_TYPES, f"unknown exchange type: {exchange_type}"
+        declared = self.exchanges.setdefault(exchange_name, exchange_type)
+        assert declared == exchange_type, f"exchange {exchange_name} is declared as {declared}, not {exchange_type}"
+        self.bindings.setdefault(exchange_name, [])
+
+    def bind(self, exchange_name, binding_key, subscriber):
+        """
+        bind a subscriber to an exchange
+        :param exchange_name: exchange name
+        :param binding_key: binding key
+        :param subscriber: subscriber receiving the messages (`PubSubLocal`)
+        :return:
+        """
+        self.bindings[exchange_name].append((tuple(binding_key.split(".")), binding_key, subscriber))
+
+    def unbind(self, subscriber):
+        """
+        remove all bindings of a subscriber
+        :param subscriber: subscriber
+        :return:
+        """
+        for exchange_name, bindings in self.bindings.items():
+            self.bindings[exchange_name] = [binding for binding in bindings if binding[2] is not subscriber]
+
+    def route(self, exchange_name, routing_key, message_content):
+        """
+        route a message to the subscribers of an exchange. Like an AMQP queue, a subscriber receives a message once
+        even if several of its bindings match
+        :param exchange_name: exchange name
+        :param routing_key: routing key of the message
+        :param message_content: message body
+        :return:
+        """
+        exchange_type = self.exchanges[exchange_name]
+        routing_words = tuple(routing_key.split("."))
+        receivers = []
+        for binding_words, binding_key, subscriber in self.bindings[exchange_name]:
+            if exchange_type == "fanout" or \
+                    (exchange_type == "direct" and binding_key == routing_key) or \
+                    (exchange_type == "topic" and topic_matches(binding_words, routing_words)):
+                if subscriber not in receivers:
+                    receivers.append(subscriber)
+        for subscriber in receivers:
+            subscriber.deliver(exchange_name=exchange_name, routing_key=routing_key, message_content=message_content)
+
+
+def topic_matches(binding_words, routing_words):
+    """
+    check if a routing key matches a topic binding key
+    :param binding_words: words of the binding key, `*` matches one word and `#` any number of words
+    :param routing_words: words of the routing key
+    :return: True if the routing key matches
+    """
+    if len(binding_words) == 0:
+        return len(routing_words) == 0
+    if binding_words[0] == "#":
+        return any(topic_matches(binding_words[1:], routing_words[idx:]) for idx in range(len(routing_words) + 1))
+    if len(routing_words) == 0:
+        return False
+    return binding_words[0] in ("*", routing_words[0]) and topic_matches(binding_words[1:], routing_words[1:])
+
+
+# broker shared by all local publishers and subscribers of the process
+broker = LocalBroker()
+
+
+class PubSubLocal:
+    def __init__(self, eventloop, config_file, binding_suffix, app_callback=None):
+        """PubSubLocal: in process stand-in of PubSubAMQP, no message broker or network is needed
+        - eventloop: AsyncIO EventLoop
+        - config_file: Python Dictionary with the exchange configuration. Optional exchange_type:
+          "fanout" (default, like PubSubAMQP), "direct" or "topic"
+        - binding_suffix: Binding Suffix necessary for Publishing on dedicated routing key
+        - app_callback: Callback function  (default: None)
+        """
+        try:
+            self.exchange_name = config_file["exchange"]
+            self.exchange_type = config_file.get("exchange_type", "fanout")
+            self.binding_keys = list()
+            for binding in config_file["binding_keys"]:
+                self.binding_keys.append(binding)
+
+            self.binding_suffix = binding_suffix
+            self.eventloop = eventloop
+            self.app_callback = app_callback
+            self.broker = broker
+
+            logger.debug('Local Exchange: %s', self.exchange_name)
+            logger.debug('Binding Suffix: %s', self.binding_suffix)
+
+        except Exception as e:
+            logger.error('Error while Creating PubSubLocal Instance')
+            logger.error(e)
+            sys.exit(-1)
+
+    async def connect(self, mode="publisher"):
+        """connect: declare the exchange and bind the subscriber"""
+        self.broker.declare_exchange(self.exchange_name, self.exchange_type)
+        if mode == "subscriber":
+            for binding in self.binding_keys:
+                self.broker.bind(self.exchange_name, binding + self.binding_suffix, self)
+
+    def deliver(self, exchange_name, routing_key, message_content):
+        """deliver: hand a routed message to the callback on the next iteration of the event loop, like a message
+        received from a broker"""
+        if self.app_callback is not None:
+            asyncio.get_event_loop().call_soon(self._on_message, exchange_name, routing_key, message_content)
+
+    def _on_message(self, exchange_name, routing_key, message_content):
+        """_on_message: private method to handle consumption of message during subscription"""
+        logger.debug(f"msg received: Exchange {exchange_name}, Routing {routing_key}")
+        try:
+            self.app_callback(
+                exchange_name=exchange_name,
+                binding_name=routing_key,
+                message_body=message_content
+            )
+        except Exception as e:
+            logger.error(f'Exception while consuming message: Exchange {exchange_name}, Routing {routing_key}')
+            logger.error(e)
+
+    async def publish(self, message_content, priority=0, external_binding_suffix=None):
+        """publish: Produce Message to the local broker
+        - message_content: payload of message to be published
+        - priority: message priority (unused, messages are delivered in order)
+        - external_binding_suffix: binding suffix used instead of the default one (optional)
+        """
+        await self.publish_batch(messages=[(message_content, external_binding_suffix)], priority=priority)
+
+    async def publish_batch(self, messages, priority=0):
+        """publish_batch: Produce several Messages to the local broker at once
+        - messages: list of (payload, external binding suffix or None) tuples
+        - priority: message priority (unused, messages are delivered in order)
+        """
+        for message_content, external_binding_suffix in messages:
+            suffix = external_binding_suffix if external_binding_suffix is not None else self.binding_suffix
+            for binding_key in self.binding_keys:
+                self.broker.route(self.exchange_name, binding_key + suffix, message_content)
+
+    async def terminate(self):
+        """terminate: remove the bindings of the subscriber"""
+        self.broker.unbind(self)
@@ -2,7 +2,9 @@ from __future__ import generator_stop
 from __future__ import annotations
 
 from .AMQP import PubSubAMQP
+from .Local import PubSubLocal
 
 __all__ = [
-    'PubSubAMQP'
+    'PubSubAMQP',
+    'PubSubLocal'
 ]
@@ -0,0 +1,176 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+handler = logging.FileHandler('/tmp/walkgen.log')
+handler.setLevel(logging.ERROR)
+formatter = logging.Formatter('%(levelname)-8s-[%(filename)s:%(lineno)d]-%(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# maximum number of ray/segment pairs solved in one array operation (bounds the temporary memory)
+MAX_PAIRS_PER_CHUNK = 1 << 20
+
+
+def segments_to_array(segments):
+    """
+    Convert line segments into a contiguous coordinate array
+    :param segments: list of line segments (objects with end points `a` and `b`)
+    :return: float array of shape (N, 4) with rows [x1, y1, x2, y2]
+    """
+    coords = np.empty((len(segments), 4), dtype=np.float64)
+    for idx, segment in enumerate(segments):
+        coords[idx] = (segment.a.x, segment.a.y, segment.b.x, segment.b.y)
+    return coords
+
+
+def bounding_box_distance(x, y, coords):
+    """
+    Distance between a point and the axis aligned bounding box of every segment (0 inside the box)
+    :param x: x coordinate of the point
+    :param y: y coordinate of the point
+    :param coords: segment coordinate array of shape (N, 4)
+    :return: array of N distances
+    """
+    gap_x = np.maximum(np.maximum(np.minimum(coords[:, 0], coords[:, 2]) - x,
+                                  x - np.maximum(coords[:, 0], coords[:, 2])), 0.0)
+    gap_y = np.maximum(np.maximum(np.minimum(coords[:, 1], coords[:, 3]) - y,
+                                  y - np.maximum(coords[:, 1], coords[:, 3])), 0.0)
+    return np.hypot(gap_x, gap_y)
+
+
+def point_segment_distance(x, y, coords):
+    """
+    Shortest distance between a point and every segment
+    :param x: x coordinate of the point
+    :param y: y coordinate of the point
+    :param coords: segment coordinate array of shape (N, 4)
+    :return: array of N distances
+    """
+    seg_x = coords[:, 2] - coords[:, 0]
+    seg_y = coords[:, 3] - coords[:, 1]
+    length = seg_x ** 2 + seg_y ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = ((x - coords[:, 0]) * seg_x + (y - coords[:, 1]) * seg_y) / length
+    t = np.clip(np.nan_to_num(t), 0.0, 1.0)
+    return np.hypot(coords[:, 0] + t * seg_x - x, coords[:, 1] + t * seg_y - y)
+
+
+def intersect(x, y, dir_x, dir_y, coords):
+    """
+    Intersect rays from a point source with segments, using the same arithmetic as `Ray.cast`.
+    Ray directions and segment rows broadcast against each other: pass directions of shape (R, 1) to intersect
+    every ray with every segment, or directions of shape (N,) to intersect ray i with segment i only.
+    The ray origin is either a single point or given per ray, shaped like the directions
+    :param x: x coordinate(s) of the ray origin
+    :param y: y coordinate(s) of the ray origin
+    :param dir_x: x components of the ray directions
+    :param dir_y: y components of the ray directions
+    :param coords: segment coordinate array of shape (N, 4)
+    :return: tuple (distance, contact x, contact y). Distance is infinite where ray and segment do not intersect
+    """
+    # the ray is the line through (x3, y3) and (x4, y4) with (x4, y4) = (x3, y3) + direction
+    x3 = np.asarray(x, dtype=np.float64)
+    y3 = np.asarray(y, dtype=np.float64)
+    dx34 = x3 - (x3 + dir_x)
+    dy34 = y3 - (y3 + dir_y)
+    x1 = coords[:, 0]
+    y1 = coords[:, 1]
+    x2 = coords[:, 2]
+    y2 = coords[:, 3]
+    dx12 = x1 - x2
+    dy12 = y1 - y2
+    dx13 = x1 - x3
+    dy13 = y1 - y3
+    with np.errstate(divide='ignore', invalid='ignore'):
+        den = dx12 * dy34 - dy12 * dx34
+        t = (dx13 * dy34 - dy13 * dx34) / den
+        u = -(dx12 * dy13 - dy12 * dx13) / den
+        hit = (den != 0) & (t > 0) & (t < 1) & (u > 0)
+        ptx = x1 + t * (x2 - x1)
+        pty = y1 + t * (y2 - y1)
+        distance = np.sqrt((x3 - ptx) ** 2 + (y3 - pty) ** 2)
+    return np.where(hit, distance, np.inf), ptx, pty
+
+
+def no_hits(num_of_rays):
+    """
+    Ray casting result of rays that hit nothing
+    :param num_of_rays: number of rays
+    :return: tuple (segment index, distance, contact x, contact y) of arrays, one entry per ray
+    """
+    return (np.full(num_of_rays, -1, dtype=np.int64),
+            np.full(num_of_rays, np.inf),
+            np.full(num_of_rays, np.nan),
+            np.full(num_of_rays, np.nan))
+
+
+def cast_rays(x, y, dir_x, dir_y, coords, max_range=None):
+    """
+    Cast a batch of rays from a point source against a batch of segments.
+    Solves the same intersection as `Ray.cast` for every ray/segment pair as array operations
+    and keeps the nearest hit of every ray.
+    :param x: x coordinate of the ray origin, or array of origin x coordinates (one per ray)
+    :param y: y coordinate of the ray origin, or array of origin y coordinates (one per ray)
+    :param dir_x: array of x components of the ray directions
+    :param dir_y: array of y components of the ray directions
+    :param coords: segment coordinate array of shape (N, 4)
+    :param max_range: ranging distance limit (optional). Segments whose bounding box lies farther away are
+                      not cast against and hits beyond the limit are not reported
+    :return: tuple (segment index, distance, contact x, contact y) of arrays, one entry per ray.
+             Rays without a hit have segment index -1, infinite distance and NaN contact point
+    """
+    if max_range is not None:
+        # cull everything out of range before casting, an empty neighbourhood costs a single pass over the boxes
+        if np.ndim(x) == 0:
+            in_range = np.flatnonzero(bounding_box_distance(x, y, coords) <= max_range)
+        else:
+            # segments in range of any of the ray origins
+            origins = np.unique(np.column_stack((x, y)), axis=0)
+            in_range = np.flatnonzero((bounding_box_distance(origins[:, :1], origins[:, 1:], coords)
+                                       <= max_range).any(axis=0))
+        hit_index, hit_distance, contact_x, contact_y = cast_rays(x=x, y=y, dir_x=dir_x, dir_y=dir_y,
+                                                                  coords=coords[in_range])
+        found = hit_index >= 0
+        hit_index[found] = in_range[hit_index[found]]
+        return clip_range(hit_index, hit_distance, contact_x, contact_y, max_range)
+
+    num_of_rays = len(dir_x)
+    hit_index, hit_distance, contact_x, contact_y = no_hits(num_of_rays)
+    if num_of_rays == 0 or len(coords) == 0:
+        return hit_index, hit_distance, contact_x, contact_y
+
+    dir_x = np.asarray(dir_x, dtype=np.float64)[:, None]
+    dir_y = np.asarray(dir_y, dtype=np.float64)[:, None]
+    if np.ndim(x) > 0:
+        x = np.asarray(x, dtype=np.float64)[:, None]
+        y = np.asarray(y, dtype=np.float64)[:, None]
+    chunk = max(1, MAX_PAIRS_PER_CHUNK // num_of_rays)
+    for start in range(0, len(coords), chunk):
+        distance, ptx, pty = intersect(x=x, y=y, dir_x=dir_x, dir_y=dir_y, coords=coords[start:start + chunk])
+
+        # nearest hit per ray in this chunk; argmin keeps the first segment on ties like the reference loop
+        nearest = np.argmin(distance, axis=1)
+        rows = np.arange(num_of_rays)
+        nearest_distance = distance[rows, nearest]
+        closer = nearest_distance < hit_distance
+        hit_index[closer] = nearest[closer] + start
+        hit_distance[closer] = nearest_distance[closer]
+        contact_x[closer] = ptx[rows, nearest][closer]
+        contact_y[closer] = pty[rows, nearest][closer]
+
+    return hit_index, hit_distance, contact_x, contact_y
+
+
+def clip_range(hit_index, hit_distance, contact_x, contact_y, max_range):
+    """
+    Drop hits beyond the ranging distance limit
+    :return: tuple (segment index, distance, contact x, contact y) of arrays, one entry per ray
+    """
+    beyond = hit_distance > max_range
+    hit_index[beyond] = -1
+    hit_distance[beyond] = np.inf
+    contact_x[beyond] = np.nan
+    contact_y[beyond] = np.nan
+    return hit_index, hit_distance, contact_x, contact_y
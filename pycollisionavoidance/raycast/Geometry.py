@@ -0,0 +1,219 @@
+import math
+import logging
+import numpy as np
+from pycollisionavoidance.raycast.Point import Point
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+handler = logging.FileHandler('/tmp/walkgen.log')
+handler.setLevel(logging.ERROR)
+formatter = logging.Formatter('%(levelname)-8s-[%(filename)s:%(lineno)d]-%(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# obstacle categories
+CATEGORY_ENVIRONMENT = 0
+CATEGORY_ROBOT = 1
+
+
+def classify(description):
+    """
+    Category of an obstacle by its description. Descriptions "robot_<robot id>[_<link>]" belong to robots
+    :param description: obstacle description
+    :return: tuple (category, robot id). Robot id is None for the environment
+    """
+    parts = description.split("_")
+    if "robot" in parts and len(parts) > 1:
+        return CATEGORY_ROBOT, parts[1]
+    return CATEGORY_ENVIRONMENT, None
+
+
+def validate_points(points, shape):
+    """
+    Validate the corner points of an obstacle once, when it is loaded
+    :param points: list of [x, y] corner points in a cyclic order
+    :param shape: shape of the obstacle ("polygon", "line" or anything else for a dot)
+    :return: list of (x, y) float tuples
+    """
+    points = [(float(point[0]), float(point[1])) for point in points]
+    for point in points:
+        assert math.isfinite(point[0]) and math.isfinite(point[1]), f"corner points must be finite, got {point}"
+    minimum = 2 if shape in ("polygon", "line") else 1
+    assert len(points) >= minimum, f"a {shape} needs at least {minimum} corner points, got {len(points)}"
+    return points
+
+
+def segment_rows(points, shape):
+    """
+    Line segments of an obstacle as coordinate rows, matching the segments `Obstacle` creates for the shape
+    :param points: validated corner points, list of (x, y) tuples
+    :param shape: shape of the obstacle. A polygon is closed, a line uses the first two points, other shapes have
+                  no segments
+    :return: list of (x1, y1, x2, y2) tuples
+    """
+    if shape == 'polygon':
+        return [point1 + point2 for point1, point2 in zip(points, points[1:] + points[:1])]
+    if shape == 'line':
+        return [points[0] + points[1]]
+    return []
+
+
+class SegmentArray:
+    """
+    Line segments of many obstacles stored as rows [x1, y1, x2, y2] of one contiguous float array.
+    The segments of an obstacle are a block of consecutive rows. Indexing the array yields light weight views
+    with the `LineSegment` interface, so no Python object is kept per segment
+    """
+    __slots__ = ("coords", "obstacle_ids", "descriptions", "shapes", "obstacle_start", "segment_obstacle",
+                 "positions", "categories", "robot_ids")
+
+    def __init__(self, coords, obstacle_ids, descriptions, shapes, obstacle_start):
+        """
+        Initializes the segment array
+        :param coords: float array of shape (N, 4), the segments of all obstacles one after another
+        :param obstacle_ids: list of obstacle ids
+        :param descriptions: list of obstacle descriptions, one per obstacle
+        :param shapes: list of obstacle shapes, one per obstacle
+        :param obstacle_start: int array of the first row of every obstacle, followed by N
+        """
+        self.coords = coords
+        self.coords.flags.writeable = False
+        self.obstacle_ids = obstacle_ids
+        self.descriptions = descriptions
+        self.shapes = shapes
+        self.obstacle_start = obstacle_start
+        self.segment_obstacle = np.repeat(np.arange(len(obstacle_ids)), np.diff(obstacle_start))
+        # obstacle id -> position, the first obstacle wins if ids repeat
+        self.positions = {}
+        for position, obstacle_id in enumerate(obstacle_ids):
+            self.positions.setdefault(obstacle_id, position)
+        # category and robot id of every obstacle, tagged once here instead of parsing descriptions per hit
+        tags = [classify(description) for description in descriptions]
+        self.categories = np.array([category for category, _ in tags], dtype=np.int8)
+        self.robot_ids = [robot_id for _, robot_id in tags]
+
+    @classmethod
+    def from_obstacles(cls, obstacles):
+        """
+        Build the segment array from validated obstacles
+        :param obstacles: list of tuples (id, corner point array, shape, description)
+        :return: segment array
+        """
+        rows = []
+        counts = []
+        for _, points, shape, _ in obstacles:
+            block = segment_rows(points, shape)
+            rows.extend(block)
+            counts.append(len(block))
+        return cls(coords=np.array(rows, dtype=np.float64).reshape(-1, 4),
+                   obstacle_ids=[obstacle[0] for obstacle in obstacles],
+                   descriptions=[obstacle[3] for obstacle in obstacles],
+                   shapes=[obstacle[2] for obstacle in obstacles],
+                   obstacle_start=np.concatenate(([0], np.cumsum(counts))).astype(np.int64))
+
+    def with_coords(self, coords):
+        """
+        segment array of the same obstacles and segment layout at other coordinates
+        :param coords: float array of shape (N, 4)
+        :return: segment array
+        """
+        segments = SegmentArray.__new__(SegmentArray)
+        for name in SegmentArray.__slots__:
+            setattr(segments, name, getattr(self, name))
+        segments.coords = coords
+        segments.coords.flags.writeable = False
+        return segments
+
+    def find(self, obstacle_id):
+        """
+        position of an obstacle in the array
+        :param obstacle_id: obstacle id
+        :return: obstacle position, None if the obstacle is not stored here
+        """
+        return self.positions.get(obstacle_id)
+
+    def replace(self, obstacle, points, shape):
+        """
+        copy of the segment array with the segments of one obstacle replaced
+        :param obstacle: obstacle position
+        :param points: validated corner points of the obstacle
+        :param shape: shape of the obstacle
+        :return: segment array
+        """
+        rows = np.array(segment_rows(points, shape), dtype=np.float64).reshape(-1, 4)
+        start = self.obstacle_start[obstacle]
+        stop = self.obstacle_start[obstacle + 1]
+        obstacle_start = self.obstacle_start.copy()
+        obstacle_start[obstacle + 1:] += len(rows) - (stop - start)
+        shapes = list(self.shapes)
+        shapes[obstacle] = shape
+        return SegmentArray(coords=np.concatenate((self.coords[:start], rows, self.coords[stop:])),
+                            obstacle_ids=self.obstacle_ids,
+                            descriptions=self.descriptions,
+                            shapes=shapes,
+                            obstacle_start=obstacle_start)
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __getitem__(self, row):
+        if not -len(self.coords) <= row < len(self.coords):
+            raise IndexError("segment index out of range")
+        return SegmentView(self, row % len(self.coords))
+
+    def __iter__(self):
+        for row in range(len(self.coords)):
+            yield SegmentView(self, row)
+
+
+class SegmentView:
+    """
+    Line segment stored in a segment array. End points are created on access
+    """
+    __slots__ = ("store", "row")
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    @property
+    def a(self):
+        x1, y1 = self.store.coords[self.row, :2].tolist()
+        return Point(x=x1, y=y1)
+
+    @property
+    def b(self):
+        x2, y2 = self.store.coords[self.row, 2:].tolist()
+        return Point(x=x2, y=y2)
+
+    @property
+    def description(self):
+        return self.store.descriptions[self.store.segment_obstacle[self.row]]
+
+
+class SegmentChain:
+    """
+    Read-only sequence of line segments of several segment sequences, indexed as if they were concatenated
+    """
+    __slots__ = ("parts", "offsets")
+
+    def __init__(self, *parts):
+        self.parts = parts
+        self.offsets = [0]
+        for part in parts:
+            self.offsets.append(self.offsets[-1] + len(part))
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self.offsets[-1]
+        for part, start, stop in zip(self.parts, self.offsets, self.offsets[1:]):
+            if start <= idx < stop:
+                return part[idx - start]
+        raise IndexError("segment index out of range")
+
+    def __iter__(self):
+        for part in self.parts:
+            yield from part
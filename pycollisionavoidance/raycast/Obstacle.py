@@ -1,7 +1,6 @@
 import logging
-import sys
-import traceback
 from pycollisionavoidance.raycast.Point import LineSegment, Dot
+from pycollisionavoidance.raycast.Geometry import classify
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -16,56 +15,41 @@ class Obstacle:
     """
     This class implements the defining Obstacles
     """
+    __slots__ = ("id", "num_of_points", "corner_points", "description", "shape", "type", "line_segments",
+                 "category", "robot_id")
 
     def __init__(self, id, corner_points, obstacle_shape, obstacle_type, description=""):
         """
-        Initialization of obstacle
+        Initialization of obstacle. Corner points are validated once when the obstacle is loaded into the map
         :param id: obstacle ID
         :param corner_points: corner coordinate points of obstacle mentioned in a cyclic order
         :param obstacle_shape: shape of the obstacle
         :param obstacle_type: type of the obstacle. Obstacle can be line , polygon
         :param description: Description about the obstacle
         """
-        try:
-            assert type(corner_points) == tuple, "Corner point list must be a list of Points"
-            self.id = id
-            self.num_of_points = len(corner_points)
-            self.corner_points = corner_points
-            self.description = description
-            self.shape = obstacle_shape
-            self.type = obstacle_type
-            self.line_segments = []
+        self.id = id
+        self.num_of_points = len(corner_points)
+        self.corner_points = corner_points
+        self.description = description
+        self.shape = obstacle_shape
+        self.type = obstacle_type
+        self.category, self.robot_id = classify(description)
+        self.line_segments = []
 
-            # add segments of the obstacle based on the shape of the obstacle
-            if obstacle_shape == 'polygon':
-                for i in range(0, self.num_of_points - 1):
-                    self.line_segments.append(LineSegment(point1=corner_points[i],
-                                                          point2=corner_points[i + 1],
-                                                          description=self.description))
-                self.line_segments.append(LineSegment(point1=corner_points[self.num_of_points - 1],
-                                                      point2=corner_points[0],
+        # add segments of the obstacle based on the shape of the obstacle
+        if obstacle_shape == 'polygon':
+            for i in range(0, self.num_of_points - 1):
+                self.line_segments.append(LineSegment(point1=corner_points[i],
+                                                      point2=corner_points[i + 1],
                                                       description=self.description))
+            self.line_segments.append(LineSegment(point1=corner_points[self.num_of_points - 1],
+                                                  point2=corner_points[0],
+                                                  description=self.description))
 
-            if obstacle_shape == 'line':
-                self.line_segments.append(LineSegment(point1=corner_points[0],
-                                                      point2=corner_points[1],
-                                                      description=self.description))
-
-        except AssertionError as e:
-            logging.critical(e)
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            logging.critical(repr(traceback.format_exception(exc_type, exc_value, exc_traceback)))
-            sys.exit()
-        except ValueError as e:
-            logging.critical(e)
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            logging.critical(repr(traceback.format_exception(exc_type, exc_value, exc_traceback)))
-            sys.exit()
-        except Exception as e:
-            logging.critical(e)
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            logging.critical(repr(traceback.format_exception(exc_type, exc_value, exc_traceback)))
-            sys.exit()
+        if obstacle_shape == 'line':
+            self.line_segments.append(LineSegment(point1=corner_points[0],
+                                                  point2=corner_points[1],
+                                                  description=self.description))
 
     def update(self, corner_points, shape=None):
         """
@@ -74,37 +58,23 @@ class Obstacle:
         :param shape: shape of the obstacle (optional). No need to mention if shape of the obstacle has not changed
         :return:
         """
-        try:
-            assert type(corner_points) == tuple, "Corner point list must be a list of Points"
-            self.corner_points = corner_points
-            self.num_of_points = len(corner_points)
-            if shape is not None:
-                self.shape = shape
-            self.line_segments.clear()
-            if self.shape == 'polygon':
-                for i in range(0, self.num_of_points - 1):
-                    self.line_segments.append(LineSegment(point1=corner_points[i], point2=corner_points[i + 1]))
-                self.line_segments.append(
-                    LineSegment(point1=corner_points[self.num_of_points - 1], point2=corner_points[0],
-                                description=self.description))
-            elif self.shape == 'line':
-                self.line_segments.append(
-                    LineSegment(point1=corner_points[0], point2=corner_points[1], description=self.description))
-            else:
-                self.line_segments.append(
-                    LineSegment(point1=corner_points[0], point2=corner_points[0], description=self.description))
-        except AssertionError as e:
-            logging.critical(e)
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            logging.critical(repr(traceback.format_exception(exc_type, exc_value, exc_traceback)))
-            sys.exit()
-        except ValueError as e:
-            logging.critical(e)
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            logging.critical(repr(traceback.format_exception(exc_type, exc_value, exc_traceback)))
-            sys.exit()
-        except Exception as e:
-            logging.critical(e)
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            logging.critical(repr(traceback.format_exception(exc_type, exc_value, exc_traceback)))
-            sys.exit()
+        self.corner_points = corner_points
+        self.num_of_points = len(corner_points)
+        if shape is not None:
+            self.shape = shape
+        if self.shape == 'polygon':
+            end_points = [(corner_points[i], corner_points[i + 1]) for i in range(0, self.num_of_points - 1)]
+            end_points.append((corner_points[self.num_of_points - 1], corner_points[0]))
+        elif self.shape == 'line':
+            end_points = [(corner_points[0], corner_points[1])]
+        else:
+            end_points = [(corner_points[0], corner_points[0])]
+
+        if len(end_points) == len(self.line_segments):
+            # same number of segments: move the existing segments instead of creating new ones
+            for segment, (point1, point2) in zip(self.line_segments, end_points):
+                segment.a = point1
+                segment.b = point2
+        else:
+            self.line_segments = [LineSegment(point1=point1, point2=point2, description=self.description)
+                                  for point1, point2 in end_points]
@@ -1,7 +1,11 @@
 import math
 import logging
-from pycollisionavoidance.raycast.Point import Point
-from pycollisionavoidance.raycast.Ray import Ray
+import numpy as np
+from pycollisionavoidance.raycast.Point import Point, LineSegment
+from pycollisionavoidance.raycast.Ray import Ray, get_ray_directions
+from pycollisionavoidance.raycast.Engine import cast_rays, no_hits, point_segment_distance, segments_to_array
+from pycollisionavoidance.raycast.Geometry import CATEGORY_ROBOT
+from pycollisionavoidance.raycast.View import View
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -16,22 +20,46 @@ class Particle:
     """
     This class implements the Particle representing a personnel as point
     """
-    def __init__(self,particle_id,x,y,size_in_pixel=1):
+    def __init__(self,particle_id,x,y,size_in_pixel=1,engine="vectorized",resolution=1,mode="full",
+                 coarse_resolution=5,max_range=None):
         """
         Initializes the particle
         :param particle_id: particle id
         :param x: x cordinates of the particle
         :param y: y coordinate of the particle
         :param size_in_pixel: size of the particle in pixels
+        :param engine: ray casting engine. "vectorized" (default) solves all rays as array operations,
+                       "reference" casts every ray against every segment with `Ray.cast`
+        :param resolution: angular resolution of the ray sweep in degrees
+        :param mode: ranging mode. "full" casts every ray of the sweep, "adaptive" casts the sweep at the coarse
+                     resolution and refines only the sectors near relevant obstacles
+        :param coarse_resolution: angular resolution of the first pass of the adaptive mode in degrees
+        :param max_range: ranging distance limit (optional). Obstacles farther away are reported as no hit
         """
+        assert engine in ("vectorized", "reference"), f"unknown ray casting engine: {engine}"
+        assert mode in ("full", "adaptive"), f"unknown ranging mode: {mode}"
         self.id = particle_id
         self.pos = Point(x=x,y=y)
         self.size_in_pixel = size_in_pixel
-        self.rays = []
+        self.engine = engine
+        self.resolution = resolution
+        self.mode = mode
+        self.coarse_resolution = coarse_resolution
+        self.max_range = max_range
+        self._rays = None
 
-        # creates a rays in 360 degree with 1 degree resolution
-        for i in range(0,360):
-            self.rays.append(Ray(origin=self.pos,angle=i))
+        # rays in 360 degree with the given resolution, the direction table is shared between particles
+        self.ray_angles, self.ray_dir_x, self.ray_dir_y = get_ray_directions(resolution)
+
+    @property
+    def rays(self):
+        """
+        Ray objects of the sweep, created on first use (reference engine)
+        :return: list of rays
+        """
+        if self._rays is None:
+            self._rays = [Ray(origin=self.pos,angle=angle) for angle in self.ray_angles]
+        return self._rays
 
     def update(self,x,y):
         """
@@ -44,67 +72,298 @@ class Particle:
             self.pos.x = x
             self.pos.y = y
 
-    def look(self,segments):
+    def look(self,segments,near_distance=None):
         """
         look the world around for the obstacles and do distance ranging
+        :param segments: list of obstacle segments from the world, or the world itself (StaticMap) to query its
+                         spatial index
+        :param near_distance: distance up to which obstacles are relevant. Only used by the "adaptive" mode, which
+                              sweeps the sectors around coarse hits closer than this at full resolution
+        :return: view with one entry per cast ray
+        """
+        if self.engine == "reference":
+            if hasattr(segments, "cast_rays"):
+                segments = segments.get_segments()
+            return self.look_reference(segments)
+
+        if self.pos.x is None or self.pos.y is None:
+            return View.empty(self.ray_angles, segments)
+        if self.mode == "adaptive":
+            return self.view_from_hits(*self._cast_adaptive(segments, near_distance=near_distance))
+        return self.view_from_hits(None, *self._cast(segments, ray_ids=None))
+
+    def _cast(self,segments,ray_ids):
+        """
+        cast a subset of the rays of the sweep
+        :param segments: list of obstacle segments from the world, or the world itself (StaticMap)
+        :param ray_ids: indices of the rays to cast, None casts all rays
+        :return: tuple (segment index, distance, contact x, contact y, segments) of the hits, one entry per ray
+        """
+        dir_x = self.ray_dir_x if ray_ids is None else self.ray_dir_x[ray_ids]
+        dir_y = self.ray_dir_y if ray_ids is None else self.ray_dir_y[ray_ids]
+        if hasattr(segments, "cast_rays"):
+            # scene with a spatial index
+            hits = segments.cast_rays(x=self.pos.x, y=self.pos.y, dir_x=dir_x, dir_y=dir_y, max_range=self.max_range)
+            return hits + (segments.get_segments(),)
+        hits = cast_rays(x=self.pos.x, y=self.pos.y, dir_x=dir_x, dir_y=dir_y, coords=segments_to_array(segments),
+                         max_range=self.max_range)
+        return hits + (segments,)
+
+    def _cast_adaptive(self,segments,near_distance):
+        """
+        coarse-to-fine sweep. The sweep is first cast at the coarse resolution, the rays in between two coarse rays
+        are cast only if one of the coarse hits is closer than near distance or both land on different obstacles
+        :param segments: list of obstacle segments from the world, or the world itself (StaticMap)
+        :param near_distance: distance up to which obstacles are relevant
+        :return: tuple (ray indices, segment index, distance, contact x, contact y, segments) of the cast rays
+        """
+        num_of_rays = len(self.ray_angles)
+        step = max(1, int(round(self.coarse_resolution / self.resolution)))
+        coarse_ids = np.arange(0, num_of_rays, step)
+        hit_index, hit_distance, contact_x, contact_y, segment_list = self._cast(segments, ray_ids=coarse_ids)
+        if step == 1:
+            return coarse_ids, hit_index, hit_distance, contact_x, contact_y, segment_list
+
+        # a sector spans from a coarse ray to the next one (the last sector wraps around to the first ray)
+        near_distance = near_distance if near_distance is not None else 0
+        near = hit_distance < near_distance
+        labels = [segment_list[idx].description if idx >= 0 else None for idx in hit_index]
+        changes = np.array([label != next_label for label, next_label in zip(labels, labels[1:] + labels[:1])])
+        refine = near | np.roll(near, -1) | changes
+
+        # robots and moving obstacles can be small enough to slip through the coarse rays, refine their whole
+        # angular span. Robot parts may also be static (e.g. robot bases)
+        if hasattr(segments, "cast_rays"):
+            static_robot = segments.segment_category[:len(segments.static_coords)] == CATEGORY_ROBOT
+            thin = np.concatenate((segments.static_coords[static_robot], segments.dynamic_coords))
+        else:
+            thin = segments_to_array(segments)
+        thin = thin[point_segment_distance(self.pos.x, self.pos.y, thin) < near_distance]
+        if len(thin) > 0:
+            sector_angle = step * self.resolution
+            angle_a = np.degrees(np.arctan2(thin[:, 1] - self.pos.y, thin[:, 0] - self.pos.x)) % 360
+            angle_b = np.degrees(np.arctan2(thin[:, 3] - self.pos.y, thin[:, 2] - self.pos.x)) % 360
+            span = (angle_b - angle_a) % 360
+            first = np.where(span <= 180, angle_a, angle_b)
+            span = np.where(span <= 180, span, 360 - span)
+            for begin, width in zip(first, span):
+                sectors = np.arange(int(begin // sector_angle), int((begin + width) // sector_angle) + 1)
+                refine[sectors % len(refine)] = True
+        sector_start = coarse_ids[refine]
+        if len(sector_start) == 0:
+            return coarse_ids, hit_index, hit_distance, contact_x, contact_y, segment_list
+        sector_stop = np.minimum(sector_start + step, num_of_rays)
+        counts = sector_stop - sector_start - 1
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        fine_ids = np.repeat(sector_start + 1, counts) + offsets
+        fine_index, fine_distance, fine_x, fine_y, segment_list = self._cast(segments, ray_ids=fine_ids)
+
+        order = np.argsort(np.concatenate((coarse_ids, fine_ids)), kind='stable')
+        return (np.concatenate((coarse_ids, fine_ids))[order],
+                np.concatenate((hit_index, fine_index))[order],
+                np.concatenate((hit_distance, fine_distance))[order],
+                np.concatenate((contact_x, fine_x))[order],
+                np.concatenate((contact_y, fine_y))[order],
+                segment_list)
+
+    def view_from_hits(self,ray_ids,hit_index,hit_distance,contact_x,contact_y,segments):
+        """
+        wrap the hits of rays of this particle, cast here or by a batch or a ranging process, into a view
+        :param ray_ids: indices of the cast rays, None if all rays were cast
+        :param hit_index: index of the segment hit by every cast ray, -1 if none
+        :param hit_distance: distance to the hit of every cast ray
+        :param contact_x: x coordinate of the hit of every cast ray
+        :param contact_y: y coordinate of the hit of every cast ray
+        :param segments: segments the rays were cast against
+        :return: view with one entry per cast ray
+        """
+        if ray_ids is None:
+            ray_ids = np.arange(len(self.ray_angles))
+        return View(self.ray_angles, np.asarray(ray_ids, dtype=np.int64), hit_index, hit_distance, contact_x,
+                    contact_y, segments)
+
+    def look_reference(self,segments,ray_ids=None):
+        """
+        look the world around for the obstacles and do distance ranging by casting every ray against every segment.
+        This is the reference implementation the vectorized engine is checked against
         :param segments: list of obstacle segments from the world
-        :return:
+        :param ray_ids: indices of the rays to cast, None casts all rays
+        :return: view with one entry per cast ray
         """
-        result = []
-        if self.pos.x is not None and self.pos.y is not None:
-            for ray in self.rays:
-                closest_obstacle = None
-                closest_distance = None
-                contact_point = None
-                for obstacle in segments:
-                    pt = ray.cast(obstacle)
-                    if pt is not None:
-                        distance = abs(math.sqrt(((self.pos.x - pt.x) ** 2) + ((self.pos.y - pt.y) ** 2)))
-                        if closest_obstacle is None:
-                            closest_obstacle = obstacle
+        if self.pos.x is None or self.pos.y is None:
+            return View.empty(self.ray_angles, segments)
+        if ray_ids is None:
+            ray_ids = range(len(self.ray_angles))
+        if not isinstance(segments, list):
+            # segments stored in arrays create their end points on access, create them once for all rays
+            segments = [LineSegment(point1=segment.a, point2=segment.b, description=segment.description)
+                        for segment in segments]
+        hit_index, hit_distance, contact_x, contact_y = no_hits(len(ray_ids))
+        for idx, ray_id in enumerate(ray_ids):
+            ray = self.rays[ray_id]
+            closest_obstacle = None
+            closest_distance = None
+            contact_point = None
+            for obstacle_idx, obstacle in enumerate(segments):
+                pt = ray.cast(obstacle)
+                if pt is not None:
+                    distance = abs(math.sqrt(((self.pos.x - pt.x) ** 2) + ((self.pos.y - pt.y) ** 2)))
+                    if closest_obstacle is None:
+                        closest_obstacle = obstacle_idx
+                        closest_distance = distance
+                        contact_point = pt
+                    else:
+                        if distance < closest_distance:
+                            closest_obstacle = obstacle_idx
                             closest_distance = distance
                             contact_point = pt
-                        else:
-                            if distance < closest_distance:
-                                closest_obstacle = obstacle
-                                closest_distance = distance
-                                contact_point = pt
-                result.append({
-                    'contact_point':[contact_point.x,contact_point.y]if contact_point is not None else None,
-                    "angle":ray.angle,
-                    "obstacle":closest_obstacle.description if closest_obstacle is not None else None,
-                    "distance":closest_distance
-                })
-        return result
+            if closest_obstacle is not None:
+                hit_index[idx] = closest_obstacle
+                hit_distance[idx] = closest_distance
+                contact_x[idx] = contact_point.x
+                contact_y[idx] = contact_point.y
+        return self.view_from_hits(ray_ids, hit_index, hit_distance, contact_x, contact_y, segments)
+
+    def sector_rays(self,start_angle,stop_angle):
+        """
+        indices of the rays of the sweep between start and stop angle (both included). The sector runs counter
+        clockwise from start to stop angle, a stop angle below the start angle wraps around 0 degree (e.g. 330 to 30)
+        :param start_angle: start angle in degrees
+        :param stop_angle: stop angle in degrees
+        :return: array of ray indices ordered from start to stop angle
+        """
+        num_of_rays = len(self.ray_angles)
+        span = stop_angle - start_angle
+        if span < 0:
+            span = span % 360
+        if span >= 360:
+            return np.arange(num_of_rays)
+        start_angle = start_angle % 360
+        # small tolerance so that angles on the ray grid are not lost to floating point rounding
+        first = math.ceil(start_angle / self.resolution - 1e-9)
+        last = math.floor((start_angle + span) / self.resolution + 1e-9)
+        return np.arange(first, last + 1) % num_of_rays
+
+    def rays_across(self,coords):
+        """
+        indices of the rays of the sweep whose direction lies within the angular span of any of the segments,
+        i.e. the only rays that can hit them
+        :param coords: segment coordinate array of shape (N, 4)
+        :return: array of ray indices
+        """
+        angle_a = np.degrees(np.arctan2(coords[:, 1] - self.pos.y, coords[:, 0] - self.pos.x)) % 360
+        angle_b = np.degrees(np.arctan2(coords[:, 3] - self.pos.y, coords[:, 2] - self.pos.x)) % 360
+        span = (angle_b - angle_a) % 360
+        first = np.where(span <= 180, angle_a, angle_b)
+        span = np.where(span <= 180, span, 360 - span)
+        # small tolerance so that rays on the end points are not lost to floating point rounding
+        offset = (np.asarray(self.ray_angles, dtype=np.float64)[None, :] - first[:, None]) % 360
+        crossed = (offset <= span[:, None] + 1e-6) | (offset >= 360 - 1e-6)
+        return np.flatnonzero(crossed.any(axis=0))
+
+    def look_rays(self,segments,ray_ids):
+        """
+        look the world for the obstacles along some of the rays of the sweep and do distance ranging
+        :param segments: list of obstacle segments from the world, or the world itself (StaticMap)
+        :param ray_ids: indices of the rays to cast
+        :return: view with one entry per cast ray
+        """
+        if self.engine == "reference":
+            if hasattr(segments, "cast_rays"):
+                segments = segments.get_segments()
+            return self.look_reference(segments, ray_ids=ray_ids)
+        if self.pos.x is None or self.pos.y is None:
+            return View.empty(self.ray_angles, segments)
+        return self.view_from_hits(ray_ids, *self._cast(segments, ray_ids=ray_ids))
+
+    def look_sector(self,segments,heading,field_of_view):
+        """
+        look the world for the obstacles within the field of view around a heading and do distance ranging.
+        Only the rays of the sector are cast
+        :param segments: list of obstacle segments from the world, or the world itself (StaticMap)
+        :param heading: direction of view in degrees
+        :param field_of_view: opening angle of the sector in degrees, centered on the heading
+        :return: view with one entry per ray in the sector
+        """
+        return self.look_rays(segments, ray_ids=self.sector_rays(start_angle=heading - field_of_view / 2,
+                                                                 stop_angle=heading + field_of_view / 2))
 
     def look_at_angle(self,segments,start_angle,stop_angle):
         """
-        look the world around for the obstacles between start and stop angle and do distance ranging
-        :param segments: list of obstacle segments from the world
+        look the world around for the obstacles between start and stop angle and do distance ranging.
+        A stop angle below the start angle selects the sector across 0 degree (e.g. 330 to 30)
+        :param segments: list of obstacle segments from the world, or the world itself (StaticMap)
         :param start_angle: start angle
         :param stop_angle: stop angle
         :return:
         """
-        result = []
-        if self.pos.x is not None and self.pos.y is not None:
-            for ray in self.rays:
-                if start_angle <= ray.angle <= stop_angle:
-                    closest_obstacle = None
-                    closest_distance = None
-                    for obstacle in segments:
-                        pt = ray.cast(obstacle)
-                        if pt is not None:
-                            distance = abs(math.sqrt(((self.pos.x - pt.x) ** 2) + ((self.pos.y - pt.y) ** 2)))
-                            if closest_obstacle is None:
-                                closest_obstacle = obstacle
-                                closest_distance = distance
-                            else:
-                                if distance < closest_distance:
-                                    closest_obstacle = obstacle
-                                    closest_distance = distance
-                result.append({
-                    "angle":ray.angle,
-                    "obstacle":closest_obstacle.description if closest_obstacle is not None else None,
-                    "distance":closest_distance
-                })
-        return result
+        view = self.look_rays(segments, ray_ids=self.sector_rays(start_angle=start_angle, stop_angle=stop_angle))
+        return [{"angle": record["angle"], "obstacle": record["obstacle"], "distance": record["distance"]}
+                for record in view]
+
+
+def particle_positions(particles):
+    """
+    copy the positions of particles
+    :param particles: list of particles
+    :return: list of (x, y) positions, one per particle
+    """
+    return [(particle.pos.x, particle.pos.y) for particle in particles]
+
+
+def batch_groups(particles, segments, positions=None):
+    """
+    group the particles that cast the same full sweep and can be ranged together
+    :param particles: list of particles
+    :param segments: list of obstacle segments from the world, or the world itself (StaticMap)
+    :param positions: list of (x, y) positions, one per particle (optional, default the current positions)
+    :return: tuple (views, groups). Views is a list with an empty view for every particle without a position and
+             None for all others, groups maps (resolution, max range) to the indices of the particles to range
+    """
+    if positions is None:
+        positions = particle_positions(particles)
+    views = [None] * len(particles)
+    groups = {}
+    for idx, (particle, (x, y)) in enumerate(zip(particles, positions)):
+        if particle.engine != "vectorized" or particle.mode != "full":
+            continue
+        if x is None or y is None:
+            views[idx] = View.empty(particle.ray_angles, segments)
+            continue
+        groups.setdefault((particle.resolution, particle.max_range), []).append(idx)
+    return views, groups
+
+
+def look_batch(particles, segments, positions=None):
+    """
+    look the world around for the obstacles and do distance ranging for several particles at once.
+    Particles casting the same full sweep are ranged together in one pass over the segments
+    :param particles: list of particles
+    :param segments: list of obstacle segments from the world, or the world itself (StaticMap)
+    :param positions: list of (x, y) positions to range at, one per particle (optional, default the current
+                      positions). Positions copied beforehand keep x and y of one update together while the
+                      particles move
+    :return: list of views, one per particle. The view is None for particles that can not be batched (reference
+             engine or adaptive mode) and have to look on their own
+    """
+    if positions is None:
+        positions = particle_positions(particles)
+    views, groups = batch_groups(particles, segments, positions)
+    for (resolution, max_range), members in groups.items():
+        dir_x = particles[members[0]].ray_dir_x
+        dir_y = particles[members[0]].ray_dir_y
+        x = np.array([positions[idx][0] for idx in members], dtype=np.float64)
+        y = np.array([positions[idx][1] for idx in members], dtype=np.float64)
+        if hasattr(segments, "cast_rays_batch"):
+            hits = segments.cast_rays_batch(x=x, y=y, dir_x=dir_x, dir_y=dir_y, max_range=max_range)
+            segment_list = segments.get_segments()
+        else:
+            num_of_rays = len(dir_x)
+            hits = cast_rays(x=np.repeat(x, num_of_rays), y=np.repeat(y, num_of_rays),
+                             dir_x=np.tile(dir_x, len(members)), dir_y=np.tile(dir_y, len(members)),
+                             coords=segments_to_array(segments), max_range=max_range)
+            hits = tuple(result.reshape(len(members), num_of_rays) for result in hits)
+            segment_list = segments
+        for row, idx in enumerate(members):
+            views[idx] = particles[idx].view_from_hits(None, *(result[row] for result in hits), segment_list)
+    return views
@@ -13,71 +13,45 @@ class Point:
     """
     This class implements Coordinate points
     """
+    __slots__ = ("x", "y")
+
     def __init__(self, x, y):
         """
         Initializes coordinate points
         :param x: x coordinate
         :param y: y coordinate
         """
-        try:
-            self.x = x
-            self.y = y
-        except AssertionError as e:
-            logging.critical(e)
-            exit()
-        except ValueError as e:
-            logging.critical(e)
-            exit()
-        except Exception as e:
-            logging.critical(e)
-            exit()
+        self.x = x
+        self.y = y
 
 
 class LineSegment:
     """
     This class implements Line segment
     """
+    __slots__ = ("a", "b", "description")
+
     def __init__(self, point1, point2, description=""):
         """
-        Initialize Line segment. A line segment needs two points
+        Initialize Line segment. A line segment needs two points.
+        Points are not checked here, obstacles are validated once when they are loaded
         :param point1: coordinates of first point
         :param point2: coordinate of second point
         :param description: description about line segment
         """
-        try:
-            assert type(point1) == Point, "point1 must be of class Point"
-            assert type(point2) == Point, "point2 must be of class Point"
-            self.a = point1
-            self.b = point2
-            self.description = description
-        except AssertionError as e:
-            logging.critical(e)
-            exit()
-        except ValueError as e:
-            logging.critical(e)
-            exit()
-        except Exception as e:
-            logging.critical(e)
-            exit()
+        self.a = point1
+        self.b = point2
+        self.description = description
 
 
 class Dot:
+    __slots__ = ("a", "description")
+
     def __init__(self, point, description=""):
         """
         Initialize Dot. A Dot needs a point
         :param point: coordinates of point
         :param description: Description about a Dot
         """
-        try:
-            assert type(point) == Point, "point1 must be of class Point"
-            self.a = point
-            self.description = description
-        except AssertionError as e:
-            logging.critical(e)
-            exit()
-        except ValueError as e:
-            logging.critical(e)
-            exit()
-        except Exception as e:
-            logging.critical(e)
-            exit()
+        self.a = point
+        self.description = description
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pycollisionavoidance.raycast.Particle import batch_groups, particle_positions
+from pycollisionavoidance.raycast.Ray import get_ray_directions
+from pycollisionavoidance.raycast.Snapshot import Snapshot, build_ranging_index
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+handler = logging.FileHandler('/tmp/walkgen.log')
+handler.setLevel(logging.ERROR)
+formatter = logging.Formatter('%(levelname)-8s-[%(filename)s:%(lineno)d]-%(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# fewest particles ranged by one task, smaller shards cost more in transfer than they save
+MIN_SHARD_SIZE = 4
+# the pool is created in a process already running threads (event loop executor, broker clients), forking it could
+# hand a worker a lock held by one of them, so workers are started from a clean server process
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# static geometry attached by a worker process: scene key -> (shared memory name, shared memory, ranging index)
+_attached = {}
+
+
+def _attach(scene_key, name, num_of_segments, backend):
+    """
+    static geometry of a scene in a worker process, attached from shared memory and indexed once per layout
+    :param scene_key: scene key
+    :param name: name of the shared memory block holding the static segment coordinates
+    :param num_of_segments: number of static segments
+    :param backend: ranging backend
+    :return: tuple (static coordinate array, ranging index)
+    """
+    entry = _attached.get(scene_key)
+    if entry is None or entry[0] != name:
+        if entry is not None:
+            # the layout changed, release the previous geometry
+            del _attached[scene_key]
+            memory = entry[1]
+            del entry
+            try:
+                memory.close()
+            except BufferError:
+                logger.debug(f'shared memory {memory.name} still referenced, left to garbage collection')
+        memory = shared_memory.SharedMemory(name=name)
+        static_coords = np.ndarray((num_of_segments, 4), dtype=np.float64, buffer=memory.buf)
+        static_coords.flags.writeable = False
+        entry = (name, memory, static_coords, build_ranging_index(backend=backend, static_coords=static_coords))
+        _attached[scene_key] = entry
+    return entry[2], entry[3]
+
+
+def _warm_up():
+    """
+    no-op task started the worker processes with, the first ranging task does not wait for them and their imports
+    :return: process id of the worker
+    """
+    return os.getpid()
+
+
+def _range_shard(scene_key, name, num_of_segments, backend, dynamic_coords, x, y, resolution, max_range):
+    """
+    range a shard of particles in a worker process
+    :param scene_key: scene key
+    :param name: name of the shared memory block holding the static segment coordinates
+    :param num_of_segments: number of static segments
+    :param backend: ranging backend
+    :param dynamic_coords: moving segment coordinate array of the snapshot
+    :param x: array of x coordinates of the particles
+    :param y: array of y coordinates of the particles
+    :param resolution: angular resolution of the ray sweep in degrees
+    :param max_range: ranging distance limit
+    :return: tuple (segment index, distance, contact x, contact y) of arrays of shape (particles, rays)
+    """
+    static_coords, ranging_index = _attach(scene_key=scene_key, name=name, num_of_segments=num_of_segments,
+                                           backend=backend)
+    snapshot = Snapshot(version=None, backend=backend, ranging_index=ranging_index, static_coords=static_coords,
+                        dynamic_coords=dynamic_coords)
+    _, dir_x, dir_y = get_ray_directions(resolution)
+    return snapshot.cast_rays_batch(x=x, y=y, dir_x=dir_x, dir_y=dir_y, max_range=max_range)
+
+
+class RangingPool:
+    """
+    Ranges particles in worker processes, the event loop only hands out the tasks and collects the views.
+    The static geometry of every scene is placed in shared memory once per layout and indexed by each worker,
+    a task only carries the particle positions and the moving segments of the snapshot
+    """
+
+    def __init__(self, processes):
+        """
+        Initializes the pool
+        :param processes: number of worker processes
+        """
+        assert processes > 0, f"number of ranging processes must be positive, got {processes}"
+        self.processes = processes
+        self.executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(START_METHOD))
+        for warm_up in [self.executor.submit(_warm_up) for _ in range(processes)]:
+            warm_up.result()
+        # scene key -> (static coordinate array, shared memory)
+        self.shared = {}
+
+    def _share(self, scene_key, snapshot):
+        """
+        shared memory block with the static geometry of a snapshot, copied once per layout
+        :param scene_key: scene key
+        :param snapshot: scene snapshot
+        :return: shared memory
+        """
+        entry = self.shared.get(scene_key)
+        if entry is None or entry[0] is not snapshot.static_coords:
+            memory = shared_memory.SharedMemory(create=True, size=max(snapshot.static_coords.nbytes, 1))
+            np.ndarray(snapshot.static_coords.shape, dtype=np.float64, buffer=memory.buf)[:] = snapshot.static_coords
+            if entry is not None:
+                # tasks of the previous layout are all collected before a new layout is shared
+                self._release(entry[1])
+            entry = (snapshot.static_coords, memory)
+            self.shared[scene_key] = entry
+        return entry[1]
+
+    @staticmethod
+    def _release(memory):
+        """
+        release a shared memory block
+        :param memory: shared memory
+        :return:
+        """
+        memory.close()
+        memory.unlink()
+
+    async def look_batch(self, scene_key, particles, snapshot, positions=None):
+        """
+        look the world around for the obstacles and do distance ranging for several particles in the worker
+        processes. Particles casting the same full sweep are split into one shard per process
+        :param scene_key: key identifying the scene of the snapshot (e.g. the workspace)
+        :param particles: list of particles
+        :param snapshot: scene snapshot to range in
+        :param positions: list of (x, y) positions to range at, one per particle (optional, default the current
+                          positions)
+        :return: list of views, one per particle. The view is None for particles that can not be batched
+                 (reference engine or adaptive mode) and have to look on their own
+        """
+        if positions is None:
+            positions = particle_positions(particles)
+        views, groups = batch_groups(particles, snapshot, positions)
+        if len(groups) == 0:
+            return views
+        memory = self._share(scene_key, snapshot)
+        loop = asyncio.get_running_loop()
+        shards = []
+        tasks = []
+        for (resolution, max_range), members in groups.items():
+            num_of_shards = max(1, min(self.processes, len(members) // MIN_SHARD_SIZE))
+            for shard in np.array_split(np.array(members), num_of_shards):
+                shards.append(shard.tolist())
+                tasks.append(loop.run_in_executor(self.executor, _range_shard, scene_key, memory.name,
+                                                  len(snapshot.static_coords), snapshot.backend,
+                                                  snapshot.dynamic_coords,
+                                                  np.array([positions[idx][0] for idx in shards[-1]],
+                                                           dtype=np.float64),
+                                                  np.array([positions[idx][1] for idx in shards[-1]],
+                                                           dtype=np.float64),
+                                                  resolution, max_range))
+        results = await asyncio.gather(*tasks)
+
+        segments = snapshot.get_segments()
+        for shard, hits in zip(shards, results):
+            for row, idx in enumerate(shard):
+                views[idx] = particles[idx].view_from_hits(None, *(result[row] for result in hits), segments)
+        return views
+
+    def close(self):
+        """
+        stop the worker processes and release the shared geometry
+        :return:
+        """
+        self.executor.shutdown()
+        for _, memory in self.shared.values():
+            self._release(memory)
+        self.shared.clear()
@@ -1,5 +1,7 @@
 import math
 import logging
+import functools
+import numpy as np
 from pycollisionavoidance.raycast.Point import Point
 
 logger = logging.getLogger(__name__)
@@ -60,3 +62,26 @@ class Ray:
             pt = Point(ptx, pty)
             return pt
         return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_ray_directions(resolution=1):
+    """
+    Direction table of a full 360 degree sweep, shared by all particles using the same angular resolution
+    :param resolution: angle between two neighbouring rays in degrees, must divide 360 so that the rays are evenly
+                       spaced across 0 degree as well
+    :return: tuple (angles, x components, y components). Angles are a tuple of numbers in degrees, the direction
+             components are read-only arrays
+    """
+    assert resolution > 0, f"ray resolution must be positive, got {resolution}"
+    num_of_rays = int(round(360 / resolution))
+    assert abs(360 / resolution - num_of_rays) < 1e-9, f"ray resolution must divide 360 degree, got {resolution}"
+    angles = []
+    for i in range(0, num_of_rays):
+        angle = i * resolution
+        angles.append(int(angle) if float(angle).is_integer() else angle)
+    dir_x = np.array([math.cos(math.radians(angle)) for angle in angles], dtype=np.float64)
+    dir_y = np.array([math.sin(math.radians(angle)) for angle in angles], dtype=np.float64)
+    dir_x.flags.writeable = False
+    dir_y.flags.writeable = False
+    return tuple(angles), dir_x, dir_y
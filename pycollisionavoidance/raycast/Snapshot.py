@@ -0,0 +1,122 @@
+import logging
+import numpy as np
+from pycollisionavoidance.raycast.Engine import cast_rays
+from pycollisionavoidance.raycast.SpatialIndex import UniformGrid
+from pycollisionavoidance.raycast.Visibility import AngularSweep
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+handler = logging.FileHandler('/tmp/walkgen.log')
+handler.setLevel(logging.ERROR)
+formatter = logging.Formatter('%(levelname)-8s-[%(filename)s:%(lineno)d]-%(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+def build_ranging_index(backend, static_coords):
+    """
+    Prepare the ranging backend for the static geometry
+    :param backend: ranging backend, "raycast" (spatial index) or "sweep" (angular sweep)
+    :param static_coords: static segment coordinate array of shape (N, 4)
+    :return: spatial index or angular sweep
+    """
+    if backend == "sweep":
+        return AngularSweep(static_coords=static_coords)
+    return UniformGrid(coords=static_coords)
+
+
+class Snapshot:
+    """
+    Immutable state of a map at one version, handed out to ranging.
+    The map never modifies the arrays of a snapshot, updates after the snapshot was taken go to new arrays
+    """
+
+    def __init__(self, version, backend, ranging_index, static_coords, dynamic_coords, segments=None,
+                 segment_category=None, segment_robot=None, robot_tags=None):
+        """
+        Initializes the snapshot
+        :param version: map version
+        :param backend: ranging backend, "raycast" or "sweep"
+        :param ranging_index: spatial index ("raycast") or angular sweep ("sweep") of the static segments
+        :param static_coords: static segment coordinate array of shape (N, 4)
+        :param dynamic_coords: moving segment coordinate array of shape (M, 4), numbered after the static segments
+        :param segments: sequence of all segments with their descriptions (optional, ranging only needs the
+                         coordinates)
+        :param segment_category: category of every segment, in the order of `get_segments` (optional)
+        :param segment_robot: robot number of every segment (index into robot tags, -1 for no robot) (optional)
+        :param robot_tags: robot ids by robot number (optional)
+        """
+        self.version = version
+        self.backend = backend
+        self.ranging_index = ranging_index
+        self.static_coords = static_coords
+        self.dynamic_coords = dynamic_coords
+        self.segments = segments
+        self.segment_category = segment_category
+        self.segment_robot = segment_robot
+        self.robot_tags = robot_tags
+
+    def get_segments(self):
+        """
+        get all segments in world view. Segments of static obstacles come first, followed by the dynamic ones
+        :return: segments
+        """
+        return self.segments
+
+    def cast_rays(self, x, y, dir_x, dir_y, max_range=None):
+        """
+        Cast rays from a point source into the world view.
+        With the "raycast" backend static segments are queried through the spatial index and dynamic segments are
+        tested directly, the "sweep" backend sweeps around the point source over all segments
+        :param x: x coordinate of the ray origin (the "raycast" backend also takes one origin per ray)
+        :param y: y coordinate of the ray origin (the "raycast" backend also takes one origin per ray)
+        :param dir_x: array of x components of the (unit) ray directions
+        :param dir_y: array of y components of the (unit) ray directions
+        :param max_range: ranging distance limit (optional). Geometry farther away is skipped and hits beyond
+                          the limit are reported as no hit
+        :return: tuple (segment index, distance, contact x, contact y) of arrays, one entry per ray.
+                 Segment indices refer to the list returned by `get_segments`, rays without a hit have index -1
+        """
+        if self.backend == "sweep":
+            return self.ranging_index.cast_rays(x=x, y=y, dir_x=dir_x, dir_y=dir_y,
+                                                dynamic_coords=self.dynamic_coords, max_range=max_range)
+
+        hit_index, hit_distance, contact_x, contact_y = self.ranging_index.cast_rays(x=x, y=y, dir_x=dir_x,
+                                                                                     dir_y=dir_y,
+                                                                                     max_range=max_range)
+        if len(self.dynamic_coords) > 0:
+            dynamic_index, dynamic_distance, dynamic_x, dynamic_y = cast_rays(x=x, y=y, dir_x=dir_x, dir_y=dir_y,
+                                                                              coords=self.dynamic_coords,
+                                                                              max_range=max_range)
+            closer = dynamic_distance < hit_distance
+            hit_index[closer] = dynamic_index[closer] + len(self.static_coords)
+            hit_distance[closer] = dynamic_distance[closer]
+            contact_x[closer] = dynamic_x[closer]
+            contact_y[closer] = dynamic_y[closer]
+        return hit_index, hit_distance, contact_x, contact_y
+
+    def cast_rays_batch(self, x, y, dir_x, dir_y, max_range=None):
+        """
+        Cast the same ray sweep from several point sources (e.g. all personnel in the workspace) in one pass.
+        The rays of all sources are traversed together over the shared segment arrays
+        :param x: array of x coordinates of the ray origins
+        :param y: array of y coordinates of the ray origins
+        :param dir_x: array of x components of the (unit) ray directions
+        :param dir_y: array of y components of the (unit) ray directions
+        :param max_range: ranging distance limit (optional)
+        :return: tuple (segment index, distance, contact x, contact y) of arrays of shape (sources, rays).
+                 Segment indices refer to the list returned by `get_segments`, rays without a hit have index -1
+        """
+        num_of_sources = len(x)
+        num_of_rays = len(dir_x)
+        if self.backend == "sweep":
+            # the sweep is ordered around a single point source, sweep around every source in turn
+            hits = [self.cast_rays(x=x[idx], y=y[idx], dir_x=dir_x, dir_y=dir_y, max_range=max_range)
+                    for idx in range(num_of_sources)]
+            return tuple(np.stack(result).reshape(num_of_sources, num_of_rays) for result in zip(*hits))
+
+        origin_x = np.repeat(np.asarray(x, dtype=np.float64), num_of_rays)
+        origin_y = np.repeat(np.asarray(y, dtype=np.float64), num_of_rays)
+        hits = self.cast_rays(x=origin_x, y=origin_y, dir_x=np.tile(dir_x, num_of_sources),
+                              dir_y=np.tile(dir_y, num_of_sources), max_range=max_range)
+        return tuple(result.reshape(num_of_sources, num_of_rays) for result in hits)
@@ -0,0 +1,258 @@
+import math
+import logging
+import numpy as np
+from pycollisionavoidance.raycast.Engine import clip_range, intersect, no_hits
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+handler = logging.FileHandler('/tmp/walkgen.log')
+handler.setLevel(logging.ERROR)
+formatter = logging.Formatter('%(levelname)-8s-[%(filename)s:%(lineno)d]-%(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+class UniformGrid:
+    """
+    Uniform grid spatial index over line segments.
+    Every segment is registered in all grid cells its bounding box overlaps. Rays traverse the grid cell by cell
+    (DDA) and stop at the first cell that contains a hit, so a ray only tests the segments along its path.
+    """
+
+    def __init__(self, coords, segments_per_cell=2, max_cells_per_axis=1024):
+        """
+        Build the grid
+        :param coords: segment coordinate array of shape (N, 4) with rows [x1, y1, x2, y2]
+        :param segments_per_cell: average number of segments per grid cell aimed at
+        :param max_cells_per_axis: upper limit of grid cells along each axis
+        """
+        self.coords = coords
+        self.num_of_segments = len(coords)
+        if self.num_of_segments == 0:
+            self.nx = self.ny = 0
+            return
+
+        xs = np.concatenate((coords[:, 0], coords[:, 2]))
+        ys = np.concatenate((coords[:, 1], coords[:, 3]))
+        self.min_x = float(xs.min())
+        self.min_y = float(ys.min())
+        width = max(float(xs.max()) - self.min_x, 1e-9)
+        height = max(float(ys.max()) - self.min_y, 1e-9)
+
+        # square cells sized for the requested segment density
+        num_of_cells = max(1.0, self.num_of_segments / segments_per_cell)
+        self.cell_size = max(math.sqrt(width * height / num_of_cells), max(width, height) / max_cells_per_axis)
+        self.nx = min(max_cells_per_axis, int(width // self.cell_size) + 1)
+        self.ny = min(max_cells_per_axis, int(height // self.cell_size) + 1)
+        self.max_x = self.min_x + self.nx * self.cell_size
+        self.max_y = self.min_y + self.ny * self.cell_size
+
+        # register every segment in the cells overlapped by its bounding box
+        segment_ids, cell_ids = self._cells_of(coords)
+
+        # compressed cell -> segments table, segments ordered by index inside each cell
+        order = np.lexsort((segment_ids, cell_ids))
+        self.cell_segments = segment_ids[order]
+        self.cell_start = np.searchsorted(cell_ids[order], np.arange(self.nx * self.ny + 1))
+
+    def _cells_of(self, coords):
+        """
+        grid cells overlapped by the bounding box of every segment
+        :param coords: segment coordinate array of shape (N, 4)
+        :return: tuple (segment row, cell id) of arrays, one entry per overlapped cell
+        """
+        ix0 = self._cell_x(np.minimum(coords[:, 0], coords[:, 2]))
+        ix1 = self._cell_x(np.maximum(coords[:, 0], coords[:, 2]))
+        iy0 = self._cell_y(np.minimum(coords[:, 1], coords[:, 3]))
+        iy1 = self._cell_y(np.maximum(coords[:, 1], coords[:, 3]))
+        span_x = ix1 - ix0 + 1
+        counts = span_x * (iy1 - iy0 + 1)
+        rows = np.repeat(np.arange(len(coords)), counts)
+        offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_ids = (np.repeat(iy0, counts) + offsets // np.repeat(span_x, counts)) * self.nx \
+            + np.repeat(ix0, counts) + offsets % np.repeat(span_x, counts)
+        return rows, cell_ids
+
+    def pairs(self):
+        """
+        Candidate pairs of indexed segments that share at least one grid cell
+        :return: tuple (first segment, second segment) of arrays with first < second, every pair listed once
+        """
+        if self.num_of_segments == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        # every entry of a cell is paired with the entries after it in the same cell
+        entry_cell_end = np.repeat(self.cell_start[1:], np.diff(self.cell_start))
+        counts = entry_cell_end - np.arange(len(self.cell_segments)) - 1
+        first = np.repeat(self.cell_segments, counts)
+        offsets = np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts)
+        second = self.cell_segments[np.repeat(np.arange(len(self.cell_segments)) + 1, counts) + offsets]
+        unique = np.unique(first * self.num_of_segments + second)
+        return unique // self.num_of_segments, unique % self.num_of_segments
+
+    def query(self, coords):
+        """
+        Candidate pairs of query segments and indexed segments that share at least one grid cell
+        :param coords: query segment coordinate array of shape (M, 4)
+        :return: tuple (query row, indexed segment) of arrays, every pair listed once
+        """
+        if self.num_of_segments == 0 or len(coords) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        # query segments outside the grid only touch the border cells through clipping, drop them upfront
+        outside = (np.maximum(coords[:, 0], coords[:, 2]) < self.min_x) | \
+                  (np.minimum(coords[:, 0], coords[:, 2]) > self.max_x) | \
+                  (np.maximum(coords[:, 1], coords[:, 3]) < self.min_y) | \
+                  (np.minimum(coords[:, 1], coords[:, 3]) > self.max_y)
+        rows, cell_ids = self._cells_of(coords)
+        rows, cell_ids = rows[~outside[rows]], cell_ids[~outside[rows]]
+        starts = self.cell_start[cell_ids]
+        counts = self.cell_start[cell_ids + 1] - starts
+        query_rows = np.repeat(rows, counts)
+        offsets = np.arange(len(query_rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        segments = self.cell_segments[np.repeat(starts, counts) + offsets]
+        unique = np.unique(query_rows * self.num_of_segments + segments)
+        return unique // self.num_of_segments, unique % self.num_of_segments
+
+    def query_box(self, min_x, min_y, max_x, max_y):
+        """
+        Indexed segments registered in the grid cells overlapped by an axis aligned box
+        :param min_x: lower x bound of the box
+        :param min_y: lower y bound of the box
+        :param max_x: upper x bound of the box
+        :param max_y: upper y bound of the box
+        :return: array of segment rows, every segment listed once
+        """
+        if self.num_of_segments == 0 or max_x < self.min_x or min_x > self.max_x or \
+                max_y < self.min_y or min_y > self.max_y:
+            return np.zeros(0, dtype=np.int64)
+        ix0, ix1 = self._cell_x(np.array([min_x, max_x])).tolist()
+        iy0, iy1 = self._cell_y(np.array([min_y, max_y])).tolist()
+        # the cells of a grid row within the box are one block of the cell table
+        rows = np.arange(iy0, iy1 + 1) * self.nx
+        starts = self.cell_start[rows + ix0].tolist()
+        stops = self.cell_start[rows + ix1 + 1].tolist()
+        marked = np.zeros(self.num_of_segments, dtype=bool)
+        for start, stop in zip(starts, stops):
+            marked[self.cell_segments[start:stop]] = True
+        return np.flatnonzero(marked)
+
+    def _cell_x(self, x):
+        return np.clip(np.floor((x - self.min_x) / self.cell_size).astype(np.int64), 0, self.nx - 1)
+
+    def _cell_y(self, y):
+        return np.clip(np.floor((y - self.min_y) / self.cell_size).astype(np.int64), 0, self.ny - 1)
+
+    def cast_rays(self, x, y, dir_x, dir_y, max_range=None):
+        """
+        Cast rays from a point source through the grid.
+        Returns the same nearest hit per ray as `Engine.cast_rays` over all indexed segments
+        :param x: x coordinate of the ray origin, or array of origin x coordinates (one per ray)
+        :param y: y coordinate of the ray origin, or array of origin y coordinates (one per ray)
+        :param dir_x: array of x components of the (unit) ray directions
+        :param dir_y: array of y components of the (unit) ray directions
+        :param max_range: ranging distance limit (optional). Rays stop walking the grid at this distance
+        :return: tuple (segment index, distance, contact x, contact y) of arrays, one entry per ray.
+                 Rays without a hit have segment index -1, infinite distance and NaN contact point
+        """
+        dir_x = np.asarray(dir_x, dtype=np.float64)
+        dir_y = np.asarray(dir_y, dtype=np.float64)
+        num_of_rays = len(dir_x)
+        hit_index, hit_distance, contact_x, contact_y = no_hits(num_of_rays)
+        if num_of_rays == 0 or self.num_of_segments == 0:
+            return hit_index, hit_distance, contact_x, contact_y
+        x = np.broadcast_to(np.asarray(x, dtype=np.float64), dir_x.shape)
+        y = np.broadcast_to(np.asarray(y, dtype=np.float64), dir_y.shape)
+
+        # clip every ray against the grid bounds (slab test)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv_x = 1.0 / dir_x
+            inv_y = 1.0 / dir_y
+            tx0 = (self.min_x - x) * inv_x
+            tx1 = (self.max_x - x) * inv_x
+            ty0 = (self.min_y - y) * inv_y
+            ty1 = (self.max_y - y) * inv_y
+        inside_x = (self.min_x <= x) & (x <= self.max_x)
+        inside_y = (self.min_y <= y) & (y <= self.max_y)
+        t_enter_x = np.where(dir_x == 0, np.where(inside_x, -np.inf, np.inf), np.minimum(tx0, tx1))
+        t_exit_x = np.where(dir_x == 0, np.where(inside_x, np.inf, -np.inf), np.maximum(tx0, tx1))
+        t_enter_y = np.where(dir_y == 0, np.where(inside_y, -np.inf, np.inf), np.minimum(ty0, ty1))
+        t_exit_y = np.where(dir_y == 0, np.where(inside_y, np.inf, -np.inf), np.maximum(ty0, ty1))
+        t_enter = np.maximum(np.maximum(t_enter_x, t_enter_y), 0.0)
+        t_exit = np.minimum(t_exit_x, t_exit_y)
+        if max_range is not None:
+            # rays starting out of range of the whole grid are dropped here
+            t_exit = np.minimum(t_exit, max_range)
+
+        rays = np.flatnonzero(t_enter <= t_exit)
+        t_exit = t_exit[rays]
+        ox = x[rays]
+        oy = y[rays]
+        dx = dir_x[rays]
+        dy = dir_y[rays]
+        step_x = np.sign(dx).astype(np.int64)
+        step_y = np.sign(dy).astype(np.int64)
+        ix = self._cell_x(ox + t_enter[rays] * dx)
+        iy = self._cell_y(oy + t_enter[rays] * dy)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta_x = np.where(step_x == 0, np.inf, self.cell_size / np.abs(dx))
+            delta_y = np.where(step_y == 0, np.inf, self.cell_size / np.abs(dy))
+            next_x = np.where(step_x == 0, np.inf,
+                              (self.min_x + (ix + (step_x > 0)) * self.cell_size - ox) / dx)
+            next_y = np.where(step_y == 0, np.inf,
+                              (self.min_y + (iy + (step_y > 0)) * self.cell_size - oy) / dy)
+        tolerance = 1e-9 * self.cell_size
+
+        # all rays walk through the grid in lockstep, one cell per iteration
+        while len(rays) > 0:
+            cells = iy * self.nx + ix
+            starts = self.cell_start[cells]
+            counts = self.cell_start[cells + 1] - starts
+            cell_exit = np.minimum(np.minimum(next_x, next_y), t_exit)
+
+            finished = np.zeros(len(rays), dtype=bool)
+            pair_ray = np.repeat(np.arange(len(rays)), counts)
+            if len(pair_ray) > 0:
+                offsets = np.arange(len(pair_ray)) - np.repeat(np.cumsum(counts) - counts, counts)
+                pair_segment = self.cell_segments[np.repeat(starts, counts) + offsets]
+                distance, ptx, pty = intersect(ox[pair_ray], oy[pair_ray], dx[pair_ray], dy[pair_ray],
+                                               self.coords[pair_segment])
+
+                # only hits inside the current cell are final, farther ones may be shadowed in a later cell
+                accepted = np.flatnonzero(distance <= cell_exit[pair_ray] + tolerance)
+                if len(accepted) > 0:
+                    # nearest hit per ray, lowest segment index first on ties
+                    order = accepted[np.lexsort((pair_segment[accepted], distance[accepted], pair_ray[accepted]))]
+                    first = order[np.r_[True, pair_ray[order][1:] != pair_ray[order][:-1]]]
+                    done = rays[pair_ray[first]]
+                    hit_index[done] = pair_segment[first]
+                    hit_distance[done] = distance[first]
+                    contact_x[done] = ptx[first]
+                    contact_y[done] = pty[first]
+                    finished[pair_ray[first]] = True
+
+            # advance the remaining rays into their next cell
+            move_x = next_x < next_y
+            ix = ix + np.where(move_x, step_x, 0)
+            iy = iy + np.where(move_x, 0, step_y)
+            leaving = np.where(move_x, next_x, next_y)
+            next_x = np.where(move_x, next_x + delta_x, next_x)
+            next_y = np.where(move_x, next_y, next_y + delta_y)
+            alive = ~finished & (leaving <= t_exit) & (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)
+
+            rays = rays[alive]
+            t_exit = t_exit[alive]
+            ox = ox[alive]
+            oy = oy[alive]
+            dx = dx[alive]
+            dy = dy[alive]
+            step_x = step_x[alive]
+            step_y = step_y[alive]
+            ix = ix[alive]
+            iy = iy[alive]
+            delta_x = delta_x[alive]
+            delta_y = delta_y[alive]
+            next_x = next_x[alive]
+            next_y = next_y[alive]
+
+        if max_range is not None:
+            return clip_range(hit_index, hit_distance, contact_x, contact_y, max_range)
+        return hit_index, hit_distance, contact_x, contact_y
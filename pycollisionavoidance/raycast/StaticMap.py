@@ -1,7 +1,13 @@
 import logging
 import sys
+import threading
+from collections import deque
+import numpy as np
 from pycollisionavoidance.raycast.Obstacle import Obstacle
 from pycollisionavoidance.raycast.Point import Point
+from pycollisionavoidance.raycast.Engine import segments_to_array
+from pycollisionavoidance.raycast.Geometry import SegmentArray, SegmentChain, validate_points
+from pycollisionavoidance.raycast.Snapshot import Snapshot, build_ranging_index
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -11,6 +17,11 @@ formatter = logging.Formatter('%(levelname)-8s-[%(filename)s:%(lineno)d]-%(messa
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
+# number of dynamic obstacle updates remembered for incremental ranging
+CHANGE_LOG_LENGTH = 256
+# arm links of a robot from base to wrist, obstacle id is "robot_<robot id><link>"
+ROBOT_LINKS = ("_base_shoulder", "_shoulder_elbow", "_elbow_wrist")
+
 
 class StaticMap:
     """
@@ -22,46 +33,67 @@ class StaticMap:
         :param config_file: configuration file
         """
         try:
-            self.obstacles = []
+            # static obstacles are kept as rows of a compact segment array, moving obstacles as objects
+            static_obstacles = []
+            self.dynamic_obstacles = []
+            # every update bumps the version. Moves of dynamic obstacles are logged, any other change invalidates
+            # the segment layout (segment indices) as a whole
+            self.version = 0
+            self.layout_version = 0
+            self.change_log = deque(maxlen=CHANGE_LOG_LENGTH)
+            # the change log is read by ranging threads while updates are applied
+            self.change_lock = threading.Lock()
+            self._snapshot = None
+            # ranging backend: "raycast" (spatial index) or "sweep" (angular sweep)
+            self.backend = config_file.get("ranging_backend", "raycast")
+            assert self.backend in ("raycast", "sweep"), f"unknown ranging backend: {self.backend}"
             obstacles = config_file["obstacles"]
             robots = config_file["robots"]
+            self.robot_ids = [robot['id'] for robot in robots]
             for obstacle in obstacles:
-                points = []
-                for point in obstacle["points"]:
-                    points.append(Point(x=point[0], y=point[1]))
-                self.obstacles.append(Obstacle(id=obstacle["id"],
-                                               corner_points=tuple(points),
-                                               obstacle_shape=obstacle["render"]["shape"],
-                                               obstacle_type=obstacle["render"]["type"],
-                                               description=obstacle["description"]))
+                # corner points are validated here once, the geometry is trusted from then on
+                shape = obstacle["render"]["shape"]
+                points = validate_points(obstacle["points"], shape)
+                if obstacle["render"]["type"] == 'static':
+                    static_obstacles.append((obstacle["id"], points, shape, obstacle["description"]))
+                else:
+                    self.dynamic_obstacles.append(
+                        Obstacle(id=obstacle["id"],
+                                 corner_points=tuple(Point(x=x, y=y) for x, y in points),
+                                 obstacle_shape=shape,
+                                 obstacle_type=obstacle["render"]["type"],
+                                 description=obstacle["description"]))
             for robot in robots:
                 center_x = robot["base"]['x']
                 center_y = robot["base"]['y']
-                points = [Point(x=center_x - 2, y=center_y - 2),
-                          Point(x=center_x + 2, y=center_y - 2),
-                          Point(x=center_x + 2, y=center_y + 2),
-                          Point(x=center_x + 2, y=center_y - 2)]
-                arm = points = [Point(x=center_x - 2, y=center_y - 2), Point(x=center_x + 2, y=center_y - 2)]
-                self.obstacles.append(Obstacle(id=obstacle["id"],
-                                               corner_points=tuple(points),
-                                               obstacle_shape='polygon',
-                                               obstacle_type='static',
-                                               description="robot_" + robot['id']))
-                self.obstacles.append(Obstacle(id="robot_" + robot['id']+"_base_shoulder",
-                                               corner_points=tuple(arm),
-                                               obstacle_shape='line',
-                                               obstacle_type='dynamic',
-                                               description="robot_" + robot['id']+"_base_shoulder"))
-                self.obstacles.append(Obstacle(id="robot_" + robot['id'] + "_shoulder_elbow",
-                                               corner_points=tuple(arm),
-                                               obstacle_shape='line',
-                                               obstacle_type='dynamic',
-                                               description="robot_" + robot['id'] + "_shoulder_elbow"))
-                self.obstacles.append(Obstacle(id="robot_" + robot['id'] + "_elbow_wrist",
-                                               corner_points=tuple(arm),
-                                               obstacle_shape='line',
-                                               obstacle_type='dynamic',
-                                               description="robot_" + robot['id'] + "_elbow_wrist"))
+                arm = [Point(x=center_x - 2, y=center_y - 2), Point(x=center_x + 2, y=center_y - 2)]
+                static_obstacles.append((obstacle["id"],
+                                         validate_points([[point.x, point.y] for point in arm], 'polygon'),
+                                         'polygon',
+                                         "robot_" + robot['id']))
+                self.dynamic_obstacles.append(Obstacle(id="robot_" + robot['id']+"_base_shoulder",
+                                                       corner_points=tuple(arm),
+                                                       obstacle_shape='line',
+                                                       obstacle_type='dynamic',
+                                                       description="robot_" + robot['id']+"_base_shoulder"))
+                self.dynamic_obstacles.append(Obstacle(id="robot_" + robot['id'] + "_shoulder_elbow",
+                                                       corner_points=tuple(arm),
+                                                       obstacle_shape='line',
+                                                       obstacle_type='dynamic',
+                                                       description="robot_" + robot['id'] + "_shoulder_elbow"))
+                self.dynamic_obstacles.append(Obstacle(id="robot_" + robot['id'] + "_elbow_wrist",
+                                                       corner_points=tuple(arm),
+                                                       obstacle_shape='line',
+                                                       obstacle_type='dynamic',
+                                                       description="robot_" + robot['id'] + "_elbow_wrist"))
+
+            self.static_segments = SegmentArray.from_obstacles(static_obstacles)
+            # obstacle id -> moving obstacle, the first obstacle wins if ids repeat
+            self.dynamic_index = {}
+            for obstacle in self.dynamic_obstacles:
+                self.dynamic_index.setdefault(obstacle.id, obstacle)
+            self._compile_static()
+            self._compile_dynamic()
         except AssertionError as e:
             logging.critical(e)
             sys.exit()
@@ -79,21 +111,215 @@ class StaticMap:
         """
         try:
             assert type(corner_points) == tuple, "Corner points must be tuple of Points"
-            for idx, obstacle in enumerate(self.obstacles):
-                if obstacle.id == obstacle_id:
-                    obstacle.update(corner_points=corner_points, shape=shape)
-                    break
+            obstacle = self.dynamic_index.get(obstacle_id)
+            if obstacle is not None:
+                num_of_segments = len(obstacle.line_segments)
+                obstacle.update(corner_points=corner_points, shape=shape)
+                self.version += 1
+                if len(obstacle.line_segments) != num_of_segments:
+                    self._compile_dynamic()
+                    self._invalidate_layout()
+                else:
+                    # patch only the rows of the moved obstacle, log where it was and where it is now
+                    start = self.dynamic_rows[obstacle.id]
+                    dynamic_coords = self._writable_dynamic_coords()
+                    before = dynamic_coords[start:start + num_of_segments].copy()
+                    for row, segment in enumerate(obstacle.line_segments, start=start):
+                        dynamic_coords[row] = (segment.a.x, segment.a.y, segment.b.x, segment.b.y)
+                    with self.change_lock:
+                        self.change_log.append((self.version, before,
+                                                dynamic_coords[start:start + num_of_segments].copy()))
+            else:
+                obstacle = self.static_segments.find(obstacle_id)
+                if obstacle is not None:
+                    # static geometry is not expected to move, recompile it as a whole
+                    shape = shape if shape is not None else self.static_segments.shapes[obstacle]
+                    points = validate_points([[point.x, point.y] for point in corner_points], shape)
+                    self.static_segments = self.static_segments.replace(obstacle, points=points, shape=shape)
+                    self.version += 1
+                    self._compile_static()
+                    self._compile_dynamic()
+                    self._invalidate_layout()
         except Exception as e:
             logging.critical(e)
             sys.exit()
 
+    def update_robot_pose(self, robot_id, base, shoulder, elbow, wrist):
+        """
+        Move all arm links of a robot in one step. The pose is validated once for all links
+        :param robot_id: robot id
+        :param base: [x, y] coordinates of the base joint
+        :param shoulder: [x, y] coordinates of the shoulder joint
+        :param elbow: [x, y] coordinates of the elbow joint
+        :param wrist: [x, y] coordinates of the wrist
+        :return: True if the pose was applied, False if the pose is invalid or the robot is unknown
+        """
+        try:
+            joints = validate_points([base, shoulder, elbow, wrist], 'line')
+        except (AssertionError, TypeError, ValueError, IndexError) as e:
+            logger.error(f"invalid pose of robot {robot_id}: {e}")
+            return False
+        points = [Point(x=x, y=y) for x, y in joints]
+        arm = self.robot_arms.get(robot_id)
+        if arm is None:
+            # links reshaped or missing, take the general path for every link
+            links = [self.dynamic_index.get("robot_" + robot_id + link) for link in ROBOT_LINKS]
+            if any(link is None for link in links):
+                return False
+            for link, point1, point2 in zip(links, points, points[1:]):
+                self.update(obstacle_id=link.id, corner_points=(point1, point2), shape='line')
+            return True
+
+        links, start = arm
+        for link, point1, point2 in zip(links, points, points[1:]):
+            link.update(corner_points=(point1, point2))
+        after = np.array([point1 + point2 for point1, point2 in zip(joints, joints[1:])])
+        dynamic_coords = self._writable_dynamic_coords()
+        before = dynamic_coords[start:start + len(links)].copy()
+        dynamic_coords[start:start + len(links)] = after
+        self.version += 1
+        with self.change_lock:
+            self.change_log.append((self.version, before, after))
+        return True
+
+    def _invalidate_layout(self):
+        """
+        segment indices changed, views ranged before can not be updated incrementally anymore
+        :return:
+        """
+        with self.change_lock:
+            self.layout_version = self.version
+            self.change_log.clear()
+
+    def changes_since(self, version, until=None):
+        """
+        Dynamic segments moved since a version of the map
+        :param version: map version (e.g. the version a view was ranged at)
+        :param until: last map version to include (e.g. the version of a snapshot), default the current version
+        :return: coordinate array of shape (N, 4) holding every moved segment at its previous and its new position,
+                 or None if the changes are not known (layout changed or change log exceeded)
+        """
+        until = self.version if until is None else until
+        with self.change_lock:
+            if version < self.layout_version:
+                return None
+            if version >= until:
+                return np.zeros((0, 4))
+            if len(self.change_log) == 0 or self.change_log[0][0] > version + 1:
+                return None
+            changes = [coords for change_version, before, after in self.change_log
+                       if version < change_version <= until for coords in (before, after)]
+        return np.concatenate(changes)
+
+    def _compile_static(self):
+        """
+        Prepare the ranging backend for the static geometry
+        :return:
+        """
+        self.static_coords = self.static_segments.coords
+        self.ranging_index = build_ranging_index(backend=self.backend, static_coords=self.static_coords)
+
+    def _compile_dynamic(self):
+        """
+        Lay out the dynamic (moving) segments in a small mutable coordinate buffer, one block of rows per obstacle
+        :return:
+        """
+        self.dynamic_segments = []
+        self.dynamic_rows = {}
+        for obstacle in self.dynamic_obstacles:
+            self.dynamic_rows[obstacle.id] = len(self.dynamic_segments)
+            self.dynamic_segments.extend(obstacle.line_segments)
+        self.dynamic_coords = segments_to_array(self.dynamic_segments)
+        # descriptions and tags of the moving segments, combined with the coordinates of each snapshot
+        self.dynamic_layout = SegmentArray(
+            coords=self.dynamic_coords.copy(),
+            obstacle_ids=[obstacle.id for obstacle in self.dynamic_obstacles],
+            descriptions=[obstacle.description for obstacle in self.dynamic_obstacles],
+            shapes=[obstacle.shape for obstacle in self.dynamic_obstacles],
+            obstacle_start=np.cumsum([0] + [len(obstacle.line_segments) for obstacle in self.dynamic_obstacles]))
+
+        # robots whose arm links are straight lines in consecutive rows are moved by a single block write
+        self.robot_arms = {}
+        for robot_id in self.robot_ids:
+            links = [self.dynamic_index.get("robot_" + robot_id + link) for link in ROBOT_LINKS]
+            if any(link is None or link.shape != 'line' or len(link.line_segments) != 1 for link in links):
+                continue
+            start = self.dynamic_rows[links[0].id]
+            if [self.dynamic_rows[link.id] for link in links] == list(range(start, start + len(links))):
+                self.robot_arms[robot_id] = (links, start)
+        self._compile_tags()
+
+    def _compile_tags(self):
+        """
+        Tag every segment of the world view with the category and robot of its obstacle, in the order of
+        `get_segments`. Robots are numbered by their position in `robot_tags`, -1 tags no robot
+        :return:
+        """
+        robot_numbers = {}
+        static_robots = np.array([robot_numbers.setdefault(robot_id, len(robot_numbers))
+                                  if robot_id is not None else -1
+                                  for robot_id in self.static_segments.robot_ids], dtype=np.int64)
+        dynamic_robots = [robot_numbers.setdefault(obstacle.robot_id, len(robot_numbers))
+                          if obstacle.robot_id is not None else -1
+                          for obstacle in self.dynamic_obstacles for _ in obstacle.line_segments]
+        dynamic_categories = [obstacle.category for obstacle in self.dynamic_obstacles
+                              for _ in obstacle.line_segments]
+        self.robot_tags = list(robot_numbers)
+        self.segment_category = np.concatenate((self.static_segments.categories[self.static_segments.segment_obstacle],
+                                                np.array(dynamic_categories, dtype=np.int8)))
+        self.segment_robot = np.concatenate((static_robots[self.static_segments.segment_obstacle],
+                                             np.array(dynamic_robots, dtype=np.int64)))
+
+    def snapshot(self):
+        """
+        Current state of the map for ranging. Snapshots are immutable: once a snapshot is handed out, updates of
+        the moving obstacles are written to a copy of their coordinate buffer (copy on write), so ranging never
+        sees a half updated robot arm and every update is applied once for all walkers
+        :return: snapshot of the current version
+        """
+        if self._snapshot is None or self._snapshot.version != self.version:
+            # the buffer is shared with the snapshot from now on
+            self.dynamic_coords.flags.writeable = False
+            self._snapshot = Snapshot(version=self.version,
+                                      backend=self.backend,
+                                      ranging_index=self.ranging_index,
+                                      static_coords=self.static_coords,
+                                      dynamic_coords=self.dynamic_coords,
+                                      segments=SegmentChain(self.static_segments,
+                                                            self.dynamic_layout.with_coords(self.dynamic_coords)),
+                                      segment_category=self.segment_category,
+                                      segment_robot=self.segment_robot,
+                                      robot_tags=self.robot_tags)
+        return self._snapshot
+
+    def _writable_dynamic_coords(self):
+        """
+        coordinate buffer of the moving obstacles that may be written, copied first if a snapshot shares it
+        :return: coordinate array
+        """
+        if not self.dynamic_coords.flags.writeable:
+            self.dynamic_coords = self.dynamic_coords.copy()
+        return self.dynamic_coords
+
     def get_segments(self):
         """
-        get all segments in world view
+        get all segments in world view. Segments of static obstacles come first, followed by the dynamic ones.
+        The sequence belongs to the current snapshot and must not be modified
         :return: segments
         """
-        segments = []
-        for obstacle in self.obstacles:
-            for segment in obstacle.line_segments:
-                segments.append(segment)
-        return segments
+        return self.snapshot().get_segments()
+
+    def cast_rays(self, x, y, dir_x, dir_y, max_range=None):
+        """
+        Cast rays from a point source into the current snapshot of the world view, see `Snapshot.cast_rays`
+        :return: tuple (segment index, distance, contact x, contact y) of arrays, one entry per ray
+        """
+        return self.snapshot().cast_rays(x=x, y=y, dir_x=dir_x, dir_y=dir_y, max_range=max_range)
+
+    def cast_rays_batch(self, x, y, dir_x, dir_y, max_range=None):
+        """
+        Cast the same ray sweep from several point sources into the current snapshot of the world view,
+        see `Snapshot.cast_rays_batch`
+        :return: tuple (segment index, distance, contact x, contact y) of arrays of shape (sources, rays)
+        """
+        return self.snapshot().cast_rays_batch(x=x, y=y, dir_x=dir_x, dir_y=dir_y, max_range=max_range)
@@ -0,0 +1,141 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+handler = logging.FileHandler('/tmp/walkgen.log')
+handler.setLevel(logging.ERROR)
+formatter = logging.Formatter('%(levelname)-8s-[%(filename)s:%(lineno)d]-%(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+class View:
+    """
+    Ranging result of a particle, one entry per cast ray held in contiguous arrays.
+    The view is also a read-only sequence of the ranging records
+    {'contact_point', 'angle', 'obstacle', 'distance'}; records are only created when they are accessed
+    """
+    __slots__ = ("angle_table", "ray_ids", "obstacle_index", "distances", "contact_points", "segments")
+
+    def __init__(self, angle_table, ray_ids, obstacle_index, distances, contact_x, contact_y, segments):
+        """
+        Initializes the view
+        :param angle_table: angles of all rays of the sweep in degrees
+        :param ray_ids: array of indices of the cast rays into the angle table
+        :param obstacle_index: array of indices of the hit segments, -1 where the ray hit nothing
+        :param distances: array of distances to the hits, infinite where the ray hit nothing
+        :param contact_x: array of x coordinates of the contact points, NaN where the ray hit nothing
+        :param contact_y: array of y coordinates of the contact points, NaN where the ray hit nothing
+        :param segments: segments the obstacle indices refer to
+        """
+        self.angle_table = angle_table
+        self.ray_ids = ray_ids
+        self.obstacle_index = obstacle_index
+        self.distances = distances
+        self.contact_points = np.column_stack((contact_x, contact_y))
+        self.segments = segments
+
+    @classmethod
+    def empty(cls, angle_table, segments):
+        """
+        view without any cast ray
+        :param angle_table: angles of all rays of the sweep in degrees
+        :param segments: segments of the world
+        :return: view
+        """
+        return cls(angle_table, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0),
+                   np.zeros(0), np.zeros(0), segments)
+
+    @property
+    def angles(self):
+        """
+        angles of the cast rays in degrees
+        :return: float array
+        """
+        return np.asarray(self.angle_table, dtype=np.float64)[self.ray_ids]
+
+    @property
+    def hits(self):
+        """
+        rays that hit an obstacle
+        :return: boolean array
+        """
+        return self.obstacle_index >= 0
+
+    def closer_than(self, distance):
+        """
+        entries with a hit closer than the distance
+        :param distance: distance threshold
+        :return: array of entry indices
+        """
+        return np.flatnonzero(self.distances < distance)
+
+    def farther_than(self, distance):
+        """
+        entries with a hit farther than the distance
+        :param distance: distance threshold
+        :return: array of entry indices
+        """
+        return np.flatnonzero(np.isfinite(self.distances) & (self.distances > distance))
+
+    def select(self, rows):
+        """
+        view of a subset of the entries
+        :param rows: entry indices or boolean mask
+        :return: view
+        """
+        return View(self.angle_table, self.ray_ids[rows], self.obstacle_index[rows], self.distances[rows],
+                    self.contact_points[rows, 0], self.contact_points[rows, 1], self.segments)
+
+    def replace(self, rows, view):
+        """
+        copy of the view with some entries replaced by the entries of another view (e.g. rays cast again)
+        :param rows: entry indices to replace
+        :param view: view holding the replacing entries in the same order
+        :return: view
+        """
+        obstacle_index = self.obstacle_index.copy()
+        distances = self.distances.copy()
+        contact_points = self.contact_points.copy()
+        obstacle_index[rows] = view.obstacle_index
+        distances[rows] = view.distances
+        contact_points[rows] = view.contact_points
+        return View(self.angle_table, self.ray_ids, obstacle_index, distances, contact_points[:, 0],
+                    contact_points[:, 1], view.segments)
+
+    def records(self):
+        """
+        ranging records of all entries
+        :return: list of records with contact point, angle, obstacle and distance of every cast ray
+        """
+        return list(self)
+
+    def __len__(self):
+        return len(self.ray_ids)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.select(idx)
+        segment = int(self.obstacle_index[idx])
+        angle = self.angle_table[self.ray_ids[idx]]
+        if segment < 0:
+            return {"contact_point": None, "angle": angle, "obstacle": None, "distance": None}
+        return {"contact_point": self.contact_points[idx].tolist(),
+                "angle": angle,
+                "obstacle": self.segments[segment].description,
+                "distance": float(self.distances[idx])}
+
+    def __iter__(self):
+        # plain python values, element access on numpy arrays is slow
+        for ray_id, segment, distance, contact_point in zip(self.ray_ids.tolist(), self.obstacle_index.tolist(),
+                                                            self.distances.tolist(),
+                                                            self.contact_points.tolist()):
+            if segment < 0:
+                yield {"contact_point": None, "angle": self.angle_table[ray_id], "obstacle": None,
+                       "distance": None}
+            else:
+                yield {"contact_point": contact_point,
+                       "angle": self.angle_table[ray_id],
+                       "obstacle": self.segments[segment].description,
+                       "distance": distance}
@@ -0,0 +1,610 @@
+import math
+import heapq
+import logging
+import numpy as np
+from pycollisionavoidance.raycast.Engine import bounding_box_distance, cast_rays, clip_range, intersect, no_hits
+from pycollisionavoidance.raycast.SpatialIndex import UniformGrid
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+handler = logging.FileHandler('/tmp/walkgen.log')
+handler.setLevel(logging.ERROR)
+formatter = logging.Formatter('%(levelname)-8s-[%(filename)s:%(lineno)d]-%(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+TWO_PI = 2 * math.pi
+# relative distance below which two segments are considered to overlap along a ray
+TIE_TOLERANCE = 1e-9
+# angle (radians) within which a ray passes through a segment end point, or a segment is in line with the particle.
+# Whether such a ray hits the segment depends on rounding, so the segment is handed to the final solve without hiding
+# the segments behind it
+END_POINT_TOLERANCE = 1e-9
+# radius of the first ring swept around the particle in grid cells, every further ring is this many times wider
+FIRST_RING_CELLS = 8
+RING_GROWTH = 2
+
+
+class AngularSweep:
+    """
+    Rotational plane sweep (visibility polygon) ranging backend.
+    Segment end points are processed in angular order around the particle while the segments crossed by the sweep
+    line are kept ordered by distance, so the nearest obstacle of every ray is known without testing it against all
+    segments. The ordering is only stable for segments that do not cross each other, therefore the static geometry
+    is split at its crossings once and the moving segments are split against it on every query. The points a
+    segment was split at lie inside the original segment, so rays passing exactly through them hit it.
+    """
+
+    def __init__(self, static_coords):
+        """
+        Prepare the static geometry for sweeping
+        :param static_coords: static segment coordinate array of shape (N, 4)
+        """
+        self.static_coords = static_coords
+        # the original segments are indexed as well, rays escaping the sweep rings walk them like ray casting
+        self.segment_index = UniformGrid(coords=static_coords)
+        first, second = self.segment_index.pairs()
+        t, u, crossing = crossing_params(static_coords[first], static_coords[second])
+        self.pieces, self.origin, self.interior = split_segments(
+            static_coords, rows=np.concatenate((first[crossing], second[crossing])),
+            params=np.concatenate((t[crossing], u[crossing])))
+        self.index = UniformGrid(coords=self.pieces)
+
+    def cast_rays(self, x, y, dir_x, dir_y, dynamic_coords, max_range=None):
+        """
+        Cast rays from a point source by sweeping around it
+        :param x: x coordinate of the ray origin
+        :param y: y coordinate of the ray origin
+        :param dir_x: array of x components of the (unit) ray directions
+        :param dir_y: array of y components of the (unit) ray directions
+        :param dynamic_coords: moving segment coordinate array of shape (M, 4), numbered after the static segments
+        :param max_range: ranging distance limit (optional)
+        :return: tuple (segment index, distance, contact x, contact y) of arrays, one entry per ray.
+                 Rays without a hit have segment index -1, infinite distance and NaN contact point
+        """
+        dir_x = np.asarray(dir_x, dtype=np.float64)
+        dir_y = np.asarray(dir_y, dtype=np.float64)
+        if len(dynamic_coords) > 0:
+            untouched, extra, extra_origin, extra_interior = self._split_dynamic(dynamic_coords)
+        else:
+            untouched, extra, extra_origin, extra_interior = (None, np.zeros((0, 4)), np.zeros(0, dtype=np.int64),
+                                                              np.zeros((0, 2), dtype=bool))
+
+        rays, segments = self._sweep_rings(x=x, y=y, dir_x=dir_x, dir_y=dir_y, dynamic_coords=dynamic_coords,
+                                           untouched=untouched, extra=extra, extra_origin=extra_origin,
+                                           extra_interior=extra_interior, max_range=max_range)
+
+        # solve the final hit against the original segments exactly like the ray casting engines do,
+        # equally near candidates (overlapping segments) resolve to the lowest segment index
+        hit_index, hit_distance, contact_x, contact_y = no_hits(len(dir_x))
+        distance, ptx, pty = intersect(x, y, dir_x[rays], dir_y[rays],
+                                       coords=self._segment_coords(segments, dynamic_coords))
+        found = np.flatnonzero(np.isfinite(distance))
+        if len(found) > 0:
+            order = found[np.lexsort((segments[found], distance[found], rays[found]))]
+            first = order[np.r_[True, rays[order][1:] != rays[order][:-1]]]
+            hit_index[rays[first]] = segments[first]
+            hit_distance[rays[first]] = distance[first]
+            contact_x[rays[first]] = ptx[first]
+            contact_y[rays[first]] = pty[first]
+        if max_range is not None:
+            return clip_range(hit_index, hit_distance, contact_x, contact_y, max_range)
+        return hit_index, hit_distance, contact_x, contact_y
+
+    def _sweep_rings(self, x, y, dir_x, dir_y, dynamic_coords, untouched, extra, extra_origin, extra_interior,
+                     max_range=None):
+        """
+        sweep in growing rings around the particle. A ring holds the pieces whose bounding box lies within its
+        radius, the static ones are looked up in the grid. A hit within the radius is final because every piece
+        that could be nearer is in the ring, only the rays without such a hit are swept again with the next ring.
+        So in dense clutter the occluded far away geometry is never touched. Rays still open once the ring covers
+        the grid are cast through the grid of the original segments
+        :param x: x coordinate of the ray origin
+        :param y: y coordinate of the ray origin
+        :param dir_x: array of x components of the (unit) ray directions
+        :param dir_y: array of y components of the (unit) ray directions
+        :param dynamic_coords: moving segment coordinate array of shape (M, 4)
+        :param untouched: bool array marking the static pieces that are not split by moving segments, None for all
+        :param extra: coordinate array of the pieces of moving segments and of the split static pieces
+        :param extra_origin: segment index of every extra piece
+        :param extra_interior: split point flags of the end points of every extra piece
+        :param max_range: ranging distance limit (optional)
+        :return: tuple (ray, segment) of arrays pairing every ray with the segment index of its nearest piece
+        """
+        angles = np.arctan2(dir_y, dir_x) % TWO_PI
+        extra_bound = bounding_box_distance(x, y, extra)
+        index = self.index
+        pending = np.arange(len(angles))
+        found_rays = []
+        found_segments = []
+        radius = FIRST_RING_CELLS * index.cell_size if index.num_of_segments > 0 else math.inf
+        while True:
+            if max_range is not None and radius >= max_range:
+                radius = max_range
+            if index.num_of_segments > 0 and x - radius <= index.min_x and x + radius >= index.max_x and \
+                    y - radius <= index.min_y and y + radius >= index.max_y:
+                # the remaining rays escape the clutter into open space, where walking the grid is cheaper than
+                # sweeping the whole scene. Both the static and the moving hit go to the final solve
+                hit, _, _, _ = self.segment_index.cast_rays(x=x, y=y, dir_x=dir_x[pending], dir_y=dir_y[pending],
+                                                            max_range=max_range)
+                moving_hit, _, _, _ = cast_rays(x=x, y=y, dir_x=dir_x[pending], dir_y=dir_y[pending],
+                                                coords=dynamic_coords, max_range=max_range)
+                found_rays.extend((pending[hit >= 0], pending[moving_hit >= 0]))
+                found_segments.extend((hit[hit >= 0], moving_hit[moving_hit >= 0] + len(self.static_coords)))
+                return np.concatenate(found_rays), np.concatenate(found_segments)
+
+            # a ring without static pieces (empty grid) or at the range limit is the last one
+            final = index.num_of_segments == 0 or radius == max_range
+            rows = index.query_box(x - radius, y - radius, x + radius, y + radius)
+            rows = rows[bounding_box_distance(x, y, self.pieces[rows]) <= radius]
+            if untouched is not None:
+                rows = rows[untouched[rows]]
+            extra_rows = np.flatnonzero(extra_bound <= radius)
+            ring = np.concatenate((self.pieces[rows], extra[extra_rows]))
+            ring_origin = np.concatenate((self.origin[rows], extra_origin[extra_rows]))
+            ring_interior = np.concatenate((self.interior[rows], extra_interior[extra_rows]))
+
+            rays, nearest = sweep(x=x, y=y, angles=angles[pending], coords=ring, interior=ring_interior)
+            rays = pending[rays]
+            if not final:
+                # a ray through a split point does not hit the pieces, but their original segment
+                distance, _, _ = intersect(x, y, dir_x[rays], dir_y[rays],
+                                           coords=self._segment_coords(ring_origin[nearest], dynamic_coords))
+                resolved = np.zeros(len(angles), dtype=bool)
+                resolved[rays[distance <= radius]] = True
+                keep = resolved[rays]
+                rays, nearest = rays[keep], nearest[keep]
+                pending = pending[~resolved[pending]]
+            found_rays.append(rays)
+            found_segments.append(ring_origin[nearest])
+            if final or len(pending) == 0:
+                return np.concatenate(found_rays), np.concatenate(found_segments)
+            radius *= RING_GROWTH
+
+    def _segment_coords(self, segments, dynamic_coords):
+        """
+        coordinates of segments by index, without joining the static and the moving segment arrays
+        :param segments: array of segment indices, moving segments are numbered after the static segments
+        :param dynamic_coords: moving segment coordinate array of shape (M, 4)
+        :return: coordinate array of shape (len(segments), 4)
+        """
+        num_of_static = len(self.static_coords)
+        is_static = segments < num_of_static
+        coords = np.empty((len(segments), 4), dtype=np.float64)
+        coords[is_static] = self.static_coords[segments[is_static]]
+        coords[~is_static] = dynamic_coords[segments[~is_static] - num_of_static]
+        return coords
+
+    def _split_dynamic(self, dynamic_coords):
+        """
+        split moving segments and the static pieces they cross at their crossings
+        :param dynamic_coords: moving segment coordinate array of shape (M, 4)
+        :return: tuple (untouched, extra, extra origin, extra interior). Untouched marks the static pieces that
+                 are not split, extra holds the pieces of the moving segments and of the split static pieces, extra
+                 origin their segment index (moving segments are numbered after the static segments) and extra
+                 interior the split point flags of their end points
+        """
+        num_of_static = len(self.static_coords)
+        num_of_dynamic = len(dynamic_coords)
+
+        # moving segments against static pieces
+        dynamic_rows, static_rows = self.index.query(dynamic_coords)
+        t, u, crossing = crossing_params(dynamic_coords[dynamic_rows], self.pieces[static_rows])
+        dynamic_rows, static_rows, t, u = dynamic_rows[crossing], static_rows[crossing], t[crossing], u[crossing]
+
+        # moving segments against each other
+        first, second = np.triu_indices(num_of_dynamic, k=1)
+        t2, u2, crossing = crossing_params(dynamic_coords[first], dynamic_coords[second])
+        dynamic_pieces, dynamic_origin, dynamic_interior = split_segments(
+            dynamic_coords, rows=np.concatenate((dynamic_rows, first[crossing], second[crossing])),
+            params=np.concatenate((t, t2[crossing], u2[crossing])))
+
+        # only the static pieces that are crossed need to be split again
+        crossed, rows = np.unique(static_rows, return_inverse=True)
+        split_pieces, split_origin, split_interior = split_segments(self.pieces[crossed], rows=rows, params=u,
+                                                                    interior=self.interior[crossed])
+        untouched = np.ones(len(self.pieces), dtype=bool)
+        untouched[crossed] = False
+        extra = np.concatenate((split_pieces, dynamic_pieces))
+        extra_origin = np.concatenate((self.origin[crossed][split_origin], dynamic_origin + num_of_static))
+        extra_interior = np.concatenate((split_interior, dynamic_interior))
+        return untouched, extra, extra_origin, extra_interior
+
+
+def crossing_params(coords_a, coords_b):
+    """
+    Proper crossings of segment pairs (row i of a with row i of b). Touching end points are no crossing
+    :param coords_a: segment coordinate array of shape (N, 4)
+    :param coords_b: segment coordinate array of shape (N, 4)
+    :return: tuple (t, u, crossing) of arrays. The crossing lies at parameter t along segment a and u along b
+    """
+    rx = coords_a[:, 2] - coords_a[:, 0]
+    ry = coords_a[:, 3] - coords_a[:, 1]
+    sx = coords_b[:, 2] - coords_b[:, 0]
+    sy = coords_b[:, 3] - coords_b[:, 1]
+    qx = coords_b[:, 0] - coords_a[:, 0]
+    qy = coords_b[:, 1] - coords_a[:, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        den = rx * sy - ry * sx
+        t = (qx * sy - qy * sx) / den
+        u = (qx * ry - qy * rx) / den
+        crossing = (den != 0) & (t > 0) & (t < 1) & (u > 0) & (u < 1)
+    return t, u, crossing
+
+
+def split_segments(coords, rows, params, interior=None):
+    """
+    Split segments at given parameters along them
+    :param coords: segment coordinate array of shape (N, 4)
+    :param rows: array of rows of the segments to split
+    :param params: array of parameters (0 < t < 1) to split at, one per entry of rows
+    :param interior: bool array of shape (N, 2) marking the end points of the segments that are split points
+                     already, i.e. the segments are pieces themselves (optional)
+    :return: tuple (pieces, origin, interior). Pieces is a coordinate array, origin holds the row each piece came
+             from and interior marks the end points of the pieces that are split points
+    """
+    num_of_segments = len(coords)
+    if interior is None:
+        interior = np.zeros((num_of_segments, 2), dtype=bool)
+    if len(rows) == 0:
+        return coords, np.arange(num_of_segments), interior
+    segment = np.concatenate((np.arange(num_of_segments), np.arange(num_of_segments), rows))
+    cut = np.concatenate((np.zeros(num_of_segments), np.ones(num_of_segments), params))
+    order = np.lexsort((cut, segment))
+    segment = segment[order]
+    cut = cut[order]
+    # consecutive cuts of the same segment delimit a piece
+    valid = (segment[1:] == segment[:-1]) & (cut[1:] > cut[:-1])
+    origin = segment[:-1][valid]
+    begin = cut[:-1][valid]
+    end = cut[1:][valid]
+    source = coords[origin]
+    delta_x = source[:, 2] - source[:, 0]
+    delta_y = source[:, 3] - source[:, 1]
+    pieces = np.stack((source[:, 0] + begin * delta_x, source[:, 1] + begin * delta_y,
+                       np.where(end == 1, source[:, 2], source[:, 0] + end * delta_x),
+                       np.where(end == 1, source[:, 3], source[:, 1] + end * delta_y)), axis=1)
+    piece_interior = np.stack((np.where(begin == 0, interior[origin, 0], True),
+                               np.where(end == 1, interior[origin, 1], True)), axis=1)
+    return pieces, origin, piece_interior
+
+
+def rays_near(sorted_angles, angles, split):
+    """
+    Rays within END_POINT_TOLERANCE of given angles
+    :param sorted_angles: sorted array of ray angles
+    :param angles: array of angles
+    :param split: array of positions in sorted angles, one per angle, the rays before it are below the angle
+                  and the rays from it on are above
+    :return: tuple (ray, angle) of arrays pairing positions in sorted angles with positions in angles
+    """
+    found_rays = [np.zeros(0, dtype=np.int64)]
+    found_angles = [np.zeros(0, dtype=np.int64)]
+    # most angles are far from both neighbouring rays
+    padded = np.concatenate(([-np.inf], sorted_angles, [np.inf]))
+    candidate = np.flatnonzero(np.minimum(padded[split + 1] - angles, angles - padded[split]) <= END_POINT_TOLERANCE)
+    for step in (1, -1):
+        # walk away from the split, rarely further than one ray
+        angle = candidate
+        ray = split[candidate] if step == 1 else split[candidate] - 1
+        while len(angle) > 0:
+            near = (ray >= 0) & (ray < len(sorted_angles))
+            angle, ray = angle[near], ray[near]
+            near = np.abs(sorted_angles[ray] - angles[angle]) <= END_POINT_TOLERANCE
+            angle, ray = angle[near], ray[near]
+            found_rays.append(ray)
+            found_angles.append(angle)
+            ray = ray + step
+    return np.concatenate(found_rays), np.concatenate(found_angles)
+
+
+class ActiveSet:
+    """
+    Segments crossed by the sweep line ordered by their distance along the current ray, kept in a treap
+    (randomized balanced binary search tree). Nodes are segment rows, so a segment is removed through its parent
+    links without comparing distances. Distances are only compared between segments crossed by the same ray
+    """
+    __slots__ = ("left", "right", "parent", "priority", "root")
+
+    def __init__(self, num_of_segments, seed=0):
+        """
+        Initializes an empty set
+        :param num_of_segments: number of segment rows that may enter the set
+        :param seed: seed of the node priorities
+        """
+        self.left = [-1] * num_of_segments
+        self.right = [-1] * num_of_segments
+        self.parent = [-1] * num_of_segments
+        self.priority = np.random.default_rng(seed).random(num_of_segments).tolist()
+        self.root = -1
+
+    def __bool__(self):
+        return self.root != -1
+
+    def insert(self, segment, distance, distance_of, nearer=None):
+        """
+        insert a segment
+        :param segment: segment row
+        :param distance: distance of the segment along the current ray
+        :param distance_of: function returning the distance of an active segment along the current ray
+        :param nearer: function telling whether an active segment meeting the segment on the current ray is the
+                       nearer one on the following rays (optional)
+        :return:
+        """
+        left = self.left
+        right = self.right
+        parent = self.parent
+        left[segment] = right[segment] = -1
+        if self.root == -1:
+            parent[segment] = -1
+            self.root = segment
+            return
+        node = self.root
+        # active segments within the band meet the segment on the current ray
+        if nearer is None:
+            band_low = band_high = distance
+        else:
+            band_low = distance - TIE_TOLERANCE * abs(distance)
+            band_high = distance + TIE_TOLERANCE * abs(distance)
+        while True:
+            node_distance = distance_of(node)
+            if node_distance < band_low or (node_distance <= band_high and
+                                            (node_distance < distance if nearer is None else nearer(node, segment))):
+                if right[node] == -1:
+                    right[node] = segment
+                    break
+                node = right[node]
+            else:
+                if left[node] == -1:
+                    left[node] = segment
+                    break
+                node = left[node]
+        parent[segment] = node
+        priority = self.priority
+        while parent[segment] != -1 and priority[segment] < priority[parent[segment]]:
+            self._rotate_up(segment)
+
+    def remove(self, segment):
+        """
+        remove a segment
+        :param segment: segment row
+        :return:
+        """
+        left = self.left
+        right = self.right
+        priority = self.priority
+        # rotate the node down to a leaf, then cut it off
+        while left[segment] != -1 or right[segment] != -1:
+            if right[segment] == -1 or (left[segment] != -1 and priority[left[segment]] < priority[right[segment]]):
+                self._rotate_up(left[segment])
+            else:
+                self._rotate_up(right[segment])
+        node = self.parent[segment]
+        if node == -1:
+            self.root = -1
+        elif left[node] == segment:
+            left[node] = -1
+        else:
+            right[node] = -1
+
+    def _rotate_up(self, node):
+        """
+        rotate a node above its parent, keeping the in-order sequence
+        :param node: segment row
+        :return:
+        """
+        left = self.left
+        right = self.right
+        parent = self.parent
+        above = parent[node]
+        grand = parent[above]
+        if left[above] == node:
+            child = right[node]
+            left[above] = child
+            right[node] = above
+        else:
+            child = left[node]
+            right[above] = child
+            left[node] = above
+        if child != -1:
+            parent[child] = above
+        parent[above] = node
+        parent[node] = grand
+        if grand == -1:
+            self.root = node
+        elif left[grand] == above:
+            left[grand] = node
+        else:
+            right[grand] = node
+
+    def nearest(self):
+        """
+        segments in order of distance, starting with the nearest one
+        :return: generator of segment rows
+        """
+        left = self.left
+        right = self.right
+        parent = self.parent
+        node = self.root
+        while left[node] != -1:
+            node = left[node]
+        while node != -1:
+            yield node
+            if right[node] != -1:
+                node = right[node]
+                while left[node] != -1:
+                    node = left[node]
+            else:
+                while parent[node] != -1 and right[parent[node]] == node:
+                    node = parent[node]
+                node = parent[node]
+
+
+def sweep(x, y, angles, coords, interior=None):
+    """
+    Nearest segment along every ray by a rotational plane sweep. Segments must not cross each other.
+    A ray passing through a split point hits the pieces meeting there, since the point lies inside the original
+    segment. A ray passing through any other end point, or a segment almost in line with the particle, may or may not
+    be hit, like in `Ray.cast` this is up to rounding, so the segment is listed without hiding the segments behind it
+    :param x: x coordinate of the ray origin
+    :param y: y coordinate of the ray origin
+    :param angles: array of ray angles in radians within [0, 2 pi)
+    :param coords: segment coordinate array of shape (N, 4)
+    :param interior: bool array of shape (N, 2) marking the end points that are split points (optional)
+    :return: tuple (ray, segment) of arrays pairing every ray with the row of its nearest segment. Segments at the
+             same distance (overlapping segments) are all listed, rays that hit nothing are left out
+    """
+    hit_ray = []
+    hit_segment = []
+    if len(angles) == 0 or len(coords) == 0:
+        return np.array(hit_ray, dtype=np.int64), np.array(hit_segment, dtype=np.int64)
+    ax = coords[:, 0] - x
+    ay = coords[:, 1] - y
+    bx = coords[:, 2] - x
+    by = coords[:, 3] - y
+    cross = ax * by - ay * bx
+
+    # angular interval covered by every segment, segments exactly in line with the particle are never hit
+    visible = np.flatnonzero(cross != 0)
+    ax, ay, bx, by, cross = ax[visible], ay[visible], bx[visible], by[visible], cross[visible]
+    angle_a = np.arctan2(ay, ax) % TWO_PI
+    angle_b = np.arctan2(by, bx) % TWO_PI
+    counter_clockwise = cross > 0
+    start = np.where(counter_clockwise, angle_a, angle_b)
+    end = np.where(counter_clockwise, angle_b, angle_a)
+    wraps = start > end
+    # segments almost in line with the particle have no reliable angular interval, they are not swept. Those the
+    # particle lies on are candidates of every ray, the others of the rays through their end points
+    in_line = np.flatnonzero(cross * cross <= END_POINT_TOLERANCE ** 2 * (ax * ax + ay * ay) * (bx * bx + by * by))
+    on_segment = in_line[ax[in_line] * bx[in_line] + ay[in_line] * by[in_line] < 0]
+
+    # segments strictly between two neighbouring rays are never hit, most of the far away clutter is dropped here
+    ray_order = np.argsort(angles, kind='stable')
+    sorted_angles = angles[ray_order]
+    up_to_start = np.searchsorted(sorted_angles, start, side='right')
+    before_end = np.searchsorted(sorted_angles, end, side='left')
+    swept = np.where(wraps, before_end - up_to_start + len(sorted_angles), before_end - up_to_start) > 0
+    swept[in_line] = False
+
+    # rays passing through an end point, also across angle 0. Pairs refer to positions in sorted angles
+    end_point_angle = np.concatenate((start, end))
+    through_ray, through_point = rays_near(sorted_angles, end_point_angle, np.concatenate((up_to_start, before_end)))
+    near_zero = np.flatnonzero(np.minimum(end_point_angle, TWO_PI - end_point_angle) <= END_POINT_TOLERANCE)
+    if len(near_zero) > 0:
+        shifted = end_point_angle[near_zero] - np.where(end_point_angle[near_zero] > math.pi, TWO_PI, -TWO_PI)
+        wrapped_ray, wrapped_point = rays_near(sorted_angles, shifted, np.searchsorted(sorted_angles, shifted))
+        through_ray = np.concatenate((through_ray, wrapped_ray))
+        through_point = np.concatenate((through_point, near_zero[wrapped_point]))
+    through_segment = through_point % len(visible)
+    if interior is None:
+        through_closed = np.zeros(len(through_point), dtype=bool)
+    else:
+        # the start point is end point a of a counter clockwise segment, the end point is b
+        is_b = (through_point >= len(visible)) == counter_clockwise[through_segment]
+        through_closed = interior[visible[through_segment], is_b.astype(np.int64)]
+
+    kept = swept.copy()
+    kept[on_segment] = True
+    kept[through_segment] = True
+    renumber = np.cumsum(kept) - 1
+    near_end = {renumber[segment]: math.sqrt(min(ax[segment] ** 2 + ay[segment] ** 2, bx[segment] ** 2 +
+                                                 by[segment] ** 2)) for segment in in_line.tolist()}
+    uncertain_segments = set(near_end)
+    always = [(0.0, segment) for segment in renumber[on_segment].tolist()]
+    through = {}
+    for ray, segment, closed in zip(through_ray.tolist(), renumber[through_segment].tolist(), through_closed.tolist()):
+        through.setdefault(ray, []).append((segment, closed))
+    visible, start, end, wraps, swept = visible[kept], start[kept], end[kept], wraps[kept], swept[kept]
+    ax, ay, bx, by, counter_clockwise = ax[kept], ay[kept], bx[kept], by[kept], counter_clockwise[kept]
+
+    # events sorted by angle, at equal angles segments leave the sweep before others enter it.
+    # Segments covering angle 0 enter before everything else. Events refer to positions in visible
+    local = np.flatnonzero(swept)
+    wraps = wraps[swept]
+    event_angle = np.concatenate((np.full(int(wraps.sum()), -1.0), end[swept], start[swept]))
+    event_kind = np.concatenate((np.ones(int(wraps.sum()), dtype=np.int64),
+                                 np.zeros(len(local), dtype=np.int64),
+                                 np.ones(len(local), dtype=np.int64)))
+    event_segment = np.concatenate((local[wraps], local, local))
+    order = np.lexsort((event_kind, event_angle))
+    event_angle = event_angle[order].tolist()
+    event_kind = event_kind[order].tolist()
+    event_segment = event_segment[order].tolist()
+
+    # distance along the ray at angle phi is numerator / (cos(phi) * edge_y - sin(phi) * edge_x)
+    edge_x = bx - ax
+    edge_y = by - ay
+    numerator = (ax * edge_y - ay * edge_x).tolist()
+    # edges pointing along the sweep
+    sweep_x = np.where(counter_clockwise, edge_x, -edge_x).tolist()
+    sweep_y = np.where(counter_clockwise, edge_y, -edge_y).tolist()
+    edge_x = edge_x.tolist()
+    edge_y = edge_y.tolist()
+
+    def nearer(segment, other):
+        # the segments meet on the ray, the nearer one is where the other continues to the far side of its line
+        return (edge_x[segment] * sweep_y[other] - edge_y[segment] * sweep_x[other]) * numerator[segment] < 0
+
+    # the active segments do not cross, so their order by distance holds for all angles they share
+    active = ActiveSet(len(visible))
+    event = 0
+    num_of_events = len(event_angle)
+    for position, (ray, angle) in enumerate(zip(ray_order.tolist(), sorted_angles.tolist())):
+        cos_angle = math.cos(angle)
+        sin_angle = math.sin(angle)
+
+        def distance_of(segment):
+            return numerator[segment] / (cos_angle * edge_y[segment] - sin_angle * edge_x[segment])
+
+        # segments entering before the ray, leaving at or before the ray
+        entering = []
+        while event < num_of_events and (event_angle[event] < angle or
+                                         (event_angle[event] == angle and event_kind[event] == 0)):
+            segment = event_segment[event]
+            if event_kind[event] == 1:
+                entering.append(segment)
+            elif segment in entering:
+                # a segment around angle 0 may leave before the first ray
+                entering.remove(segment)
+            else:
+                active.remove(segment)
+            event += 1
+        # every remaining segment crosses this ray, so distances are compared along it
+        for segment in entering:
+            active.insert(segment, distance_of(segment), distance_of, nearer)
+
+        if position not in through and not always:
+            if not active:
+                continue
+            # the nearest segment and every segment overlapping it
+            front = None
+            for segment in active.nearest():
+                distance = distance_of(segment)
+                if front is None:
+                    front = distance
+                elif distance - front > TIE_TOLERANCE * front:
+                    break
+                hit_ray.append(ray)
+                hit_segment.append(segment)
+            continue
+
+        # segments with an end point on the ray join the active ones, the uncertain hits do not hide others
+        uncertain = uncertain_segments.union(segment for segment, closed in through.get(position, ()) if not closed)
+        ends = list(always)
+        for segment, _ in through.get(position, ()):
+            if segment in uncertain_segments or cos_angle * edge_y[segment] == sin_angle * edge_x[segment]:
+                # the ray runs along the segment, it is hit in the final solve if at all
+                uncertain.add(segment)
+                ends.append((near_end.get(segment, 0.0), segment))
+            else:
+                ends.append((distance_of(segment), segment))
+        candidates = heapq.merge(((distance_of(segment), segment) for segment in active.nearest()), sorted(ends))
+        front = None
+        for distance, segment in candidates:
+            if front is not None and distance - front > TIE_TOLERANCE * front:
+                break
+            hit_ray.append(ray)
+            hit_segment.append(segment)
+            if front is None and segment not in uncertain:
+                front = distance
+    return np.array(hit_ray, dtype=np.int64), visible[np.array(hit_segment, dtype=np.int64)]
@@ -1,18 +1,22 @@
 from __future__ import generator_stop
 from __future__ import annotations
 
+from .Geometry import SegmentArray
 from .Obstacle import Obstacle
 from .Particle import Particle
 from .Point import Point, LineSegment, Dot
 from .Ray import Ray
 from .StaticMap import StaticMap
+from .View import View
 
 __all__ = [
+    'SegmentArray',
     'Obstacle',
     'Particle',
     'Point',
     'LineSegment',
     'Dot',
     'Ray',
-    'StaticMap'
+    'StaticMap',
+    'View'
 ]
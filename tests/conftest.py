@@ -0,0 +1,40 @@
+import copy
+import os
+import pytest
+import yaml
+from pycollisionavoidance.pub_sub import Local
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')
+
+
+@pytest.fixture(scope="session")
+def config():
+    """configuration file of the repository"""
+    with open(CONFIG_FILE, 'r') as yaml_file:
+        return yaml.safe_load(yaml_file)
+
+
+@pytest.fixture
+def scene_config(config):
+    """scene of the first workspace"""
+    workspace = config['collision_avoidance']['workareas'][0]['workspace']
+    return {"obstacles": workspace["obstacles"], "robots": workspace["robots"]}
+
+
+@pytest.fixture
+def local_workarea(config):
+    """first workarea of the configuration with every publisher and subscriber on the local transport"""
+    workarea = copy.deepcopy(config['collision_avoidance']['workareas'][0])
+    for pub_sub in workarea['protocol']['publishers'] + workarea['protocol']['subscribers']:
+        pub_sub['type'] = 'local'
+    return workarea
+
+
+@pytest.fixture(autouse=True)
+def local_broker():
+    """fresh in memory broker for every test"""
+    Local.broker.exchanges.clear()
+    Local.broker.bindings.clear()
+    yield Local.broker
+    Local.broker.exchanges.clear()
+    Local.broker.bindings.clear()
@@ -0,0 +1,275 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from pycollisionavoidance.collision.Avoidance import CollisionAvoidance
+from pycollisionavoidance.collision.Detection import ParticleCollisionDetection, merge_robot_collisions
+from pycollisionavoidance.pub_sub.Local import PubSubLocal
+from pycollisionavoidance.raycast.Particle import Particle
+from pycollisionavoidance.raycast.StaticMap import StaticMap
+from tests.test_raycast import assert_same_view
+
+ROBOT_POSE = {"id": "1", "base": [20, 20], "shoulder": [22, 22], "elbow": [24, 26], "wrist": [26, 30]}
+
+
+def test_merge_robot_collisions_keeps_nearest_per_robot():
+    merged = merge_robot_collisions([
+        [{"id": "1", "control": "stop", "distance": 2.0, "angle": 10},
+         {"id": "2", "control": "stop", "distance": 1.0, "angle": 20}],
+        [{"id": "1", "control": "stop", "distance": 0.5, "angle": 30}],
+        [],
+    ])
+    assert merged == [{"id": "1", "control": "stop", "distance": 0.5, "angle": 30},
+                      {"id": "2", "control": "stop", "distance": 1.0, "angle": 20}]
+
+
+@pytest.mark.parametrize("backend", ["raycast", "sweep"])
+@pytest.mark.parametrize("max_range", [None, 20.0])
+def test_patched_view_matches_fresh_ranging(scene_config, backend, max_range):
+    scene = StaticMap(config_file=dict(scene_config, ranging_backend=backend))
+    rng = np.random.default_rng(8)
+    detections = [ParticleCollisionDetection(scene=scene, particle=Particle(particle_id=str(idx), x=x, y=y,
+                                                                            max_range=max_range),
+                                             env_collision_distance=1, robot_collision_distance=5)
+                  for idx, (x, y) in enumerate(rng.uniform(0, 100, size=(5, 2)).tolist())]
+    full_rangings = 0
+    for _ in range(20):
+        robot_id = scene.robot_ids[rng.integers(len(scene.robot_ids))]
+        pose = (rng.uniform(0, 100, size=2) + rng.uniform(-8, 8, size=(4, 2))).tolist()
+        scene.update_robot_pose(robot_id, *pose)
+        for detection in detections:
+            full_rangings += detection.needs_full_ranging()
+            detection.ranging()
+            assert_same_view(detection.views, detection.particle.look(scene))
+    # only the first ranging of every walker starts from scratch, robot moves are patched in
+    assert full_rangings == len(detections)
+
+
+def test_adaptive_ranging_stops_like_full_ranging(config):
+    scene = StaticMap(config_file={"obstacles": config["scene"]["obstacles_1"], "robots": config["scene"]["robots"]})
+    # robot arms folded onto their base, small enough to slip through the coarse rays next to the static base
+    for robot in config["scene"]["robots"]:
+        x, y = robot["base"]["x"], robot["base"]["y"]
+        scene.update_robot_pose(robot["id"], [x - 0.5, y - 0.5], [x + 0.5, y - 0.5], [x + 0.5, y + 0.5],
+                                [x - 0.5, y + 0.5])
+
+    def stops(x, y, mode):
+        detection = ParticleCollisionDetection(scene=scene, particle=Particle(particle_id="1", x=x, y=y, mode=mode),
+                                               env_collision_distance=5, robot_collision_distance=10)
+        detection.ranging()
+        return detection.get_robot_collision_distance()
+
+    # grid around the robots, where the stops are decided
+    num_of_stops = 0
+    offsets = np.arange(-11, 11, 1.37)
+    for robot in config["scene"]["robots"]:
+        for x in robot["base"]["x"] + offsets:
+            for y in robot["base"]["y"] + offsets:
+                full = stops(x, y, "full")
+                assert stops(x, y, "adaptive") == full, (x, y)
+                num_of_stops += len(full)
+    assert num_of_stops > 0
+
+
+async def _workspace_with_walkers(workarea, positions, **kwargs):
+    """workspace with walkers at the given positions next to a robot, and the control messages it publishes"""
+    loop = asyncio.get_running_loop()
+    workspace = CollisionAvoidance(eventloop=loop, config_file=workarea, **kwargs)
+    await workspace.connect()
+    received = []
+    control = PubSubLocal(loop, {"exchange": "control_robot", "binding_keys": ["control.robot."]}, "",
+                          app_callback=lambda **kwargs: received.append(json.loads(kwargs["message_body"])))
+    await control.connect(mode="subscriber")
+    robot = PubSubLocal(loop, {"exchange": "rmt_robot", "binding_keys": ["rmt.robot."]}, "1")
+    await robot.connect()
+    await robot.publish(json.dumps(ROBOT_POSE).encode())
+    for walker_id, (x, y) in positions.items():
+        walker = PubSubLocal(loop, {"exchange": "plm_walker", "binding_keys": ["plm.walker."]}, walker_id)
+        await walker.connect()
+        await walker.publish(json.dumps({"id": walker_id, "x_est_pos": x, "y_est_pos": y, "z_est_pos": 0,
+                                         "timestamp": 0}).encode())
+    await asyncio.sleep(0)
+    return workspace, received
+
+
+async def _tick_with_walkers(workarea, positions):
+    """range a workspace once with walkers at the given positions, return the control messages published"""
+    workspace, received = await _workspace_with_walkers(workarea, positions)
+    await workspace._tick()
+    await asyncio.sleep(0)
+    return workspace, received
+
+
+def test_tick_publishes_one_stop_per_robot_for_all_walkers(local_workarea):
+    workspace, received = asyncio.run(_tick_with_walkers(local_workarea, {"w1": (25, 25), "w2": (25.5, 24.5)}))
+    per_walker = [msg["distance"] for walker in workspace.walkers_in_ws.values()
+                  for msg in walker.robot_collision if msg["id"] == "1"]
+    assert len(per_walker) == 2
+    assert len(received) == 1
+    assert received[0]["id"] == "1"
+    assert received[0]["control"] == "stop"
+    assert received[0]["distance"] == min(per_walker)
+
+
+def test_tick_publishes_nothing_without_walkers_near_robots(local_workarea):
+    _, received = asyncio.run(_tick_with_walkers(local_workarea, {"w1": (80, 80)}))
+    assert received == []
+
+
+async def _supersede(workarea, max_in_flight):
+    """schedule three ticks while the first ones are held in the executor, return the workspace and messages"""
+    executor = ThreadPoolExecutor(max_workers=2)
+    workspace, received = await _workspace_with_walkers(workarea, {"w1": (25, 25)}, ranging_executor=executor,
+                                                        max_in_flight=max_in_flight)
+    gate = threading.Event()
+    range_walkers = workspace._range
+
+    def held_range(*args):
+        gate.wait()
+        range_walkers(*args)
+
+    workspace._range = held_range
+    try:
+        for _ in range(3):
+            workspace._schedule_tick()
+            await asyncio.sleep(0.01)
+        gate.set()
+        while workspace.in_flight or workspace.tick_pending:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0)
+    finally:
+        gate.set()
+        executor.shutdown()
+    return workspace, received
+
+
+def test_overrunning_tick_is_superseded_by_one_catch_up_tick(local_workarea):
+    workspace, received = asyncio.run(_supersede(local_workarea, max_in_flight=1))
+    # the first tick is superseded, the catch-up tick waits for its slot, the third tick is skipped
+    assert len(received) == 1
+    statistics = workspace.get_tick_statistics()
+    assert statistics["superseded_ticks"] == 1
+    assert statistics["overrun_ticks"] == 1
+    assert statistics["skipped_ticks"] == 1
+
+
+def test_catch_up_tick_is_not_superseded(local_workarea):
+    workspace, received = asyncio.run(_supersede(local_workarea, max_in_flight=2))
+    # both ticks range at once, only the catch-up tick publishes although it overran as well
+    assert len(received) == 1
+    statistics = workspace.get_tick_statistics()
+    assert statistics["superseded_ticks"] == 1
+    assert statistics["overrun_ticks"] == 2
+    assert statistics["skipped_ticks"] == 1
+
+
+async def _move_while_ranging(workarea):
+    """move a walker while its tick ranges in the executor, return the workspace"""
+    executor = ThreadPoolExecutor(max_workers=1)
+    workspace, _ = await _workspace_with_walkers(workarea, {"w1": (25, 25)}, ranging_executor=executor)
+    gate = threading.Event()
+    range_walkers = workspace._range
+
+    def held_range(*args):
+        gate.wait()
+        range_walkers(*args)
+
+    workspace._range = held_range
+    try:
+        workspace._schedule_tick()
+        await asyncio.sleep(0.01)
+        # telemetry applied by the next tick, only x arrived yet
+        workspace.walkers_in_ws["w1"].particle.pos.x = 40
+        gate.set()
+        while workspace.in_flight:
+            await asyncio.sleep(0.01)
+    finally:
+        gate.set()
+        executor.shutdown()
+    return workspace
+
+
+def test_tick_ranges_at_the_positions_copied_before_ranging(local_workarea):
+    workspace = asyncio.run(_move_while_ranging(local_workarea))
+    walker = workspace.walkers_in_ws["w1"]
+    particle = Particle(particle_id="w1", x=25, y=25)
+    assert walker.ranged_pos == (25, 25)
+    assert_same_view(walker.views, particle.look(walker.snapshot))
+
+
+async def _update(workarea, times):
+    """run the update loop of a workspace a number of times, return the workspace"""
+    workspace, _ = await _workspace_with_walkers(workarea, {"w1": (25, 25)})
+    for _ in range(times):
+        await workspace.update()
+    return workspace
+
+
+def test_free_running_ticks_do_not_overrun(local_workarea, caplog):
+    local_workarea["workspace"]["update_interval"] = 0
+    workspace = asyncio.run(_update(local_workarea, times=5))
+    assert workspace.get_tick_statistics() == {"ticks": 5, "overrun_ticks": 0, "skipped_ticks": 0,
+                                               "superseded_ticks": 0}
+    assert "overran" not in caplog.text
+
+
+async def _update_on_events(workarea):
+    """
+    run event driven updates of two walkers: a heartbeat, a burst of telemetry, a heartbeat and telemetry of one
+    walker after the other went idle. Return the workspace and the walkers ranged by every tick
+    """
+    workspace, _ = await _workspace_with_walkers(workarea, {"w1": (25, 25), "w2": (60, 60)})
+    ranged = []
+    tick = workspace._tick
+
+    async def recorded_tick(walker_ids=None):
+        ranged.append(None if walker_ids is None else sorted(walker_ids))
+        await tick(walker_ids=walker_ids)
+
+    workspace._tick = recorded_tick
+    walkers = {}
+    for walker_id in ("w1", "w2"):
+        walkers[walker_id] = PubSubLocal(asyncio.get_running_loop(),
+                                         {"exchange": "plm_walker", "binding_keys": ["plm.walker."]}, walker_id)
+        await walkers[walker_id].connect()
+
+    async def move(walker_id, x, y):
+        await walkers[walker_id].publish(json.dumps({"id": walker_id, "x_est_pos": x, "y_est_pos": y,
+                                                     "z_est_pos": 0, "timestamp": 0}).encode())
+
+    # the first update is a heartbeat
+    await workspace.update()
+    for x in (26, 27):
+        await move("w1", x, 25)
+        await move("w2", 60, x + 35)
+    await asyncio.sleep(0)
+    await workspace.update()
+    await workspace.update()
+    workspace.last_seen["w2"] -= 2 * workspace.idle_timeout
+    await move("w1", 28, 25)
+    await asyncio.sleep(0)
+    await workspace.update()
+    return workspace, ranged
+
+
+def test_event_updates_coalesce_telemetry_between_heartbeats(local_workarea):
+    local_workarea["workspace"].update({"update_mode": "event", "latency_budget": 0.02, "heartbeat_interval": 0.1})
+    workspace, ranged = asyncio.run(_update_on_events(local_workarea))
+    # heartbeat, one coalesced ranging of the burst, heartbeat, event tick evicting the idle walker
+    assert ranged == [None, ["w1", "w2"], None, ["w1"]]
+    assert workspace.walkers_in_ws["w1"].particle.pos.x == 28
+    assert "w2" not in workspace.walkers_in_ws
+    assert workspace.get_tick_statistics()["ticks"] == 4
+
+
+def test_late_tick_skips_the_deadlines_it_missed(local_workarea):
+    workspace = asyncio.run(_update(local_workarea, times=1))
+    before = workspace.get_tick_statistics()
+    workspace.deadline = time.monotonic() - 3.5 * workspace.interval
+    assert workspace._advance_deadline() == 0.0
+    after = workspace.get_tick_statistics()
+    assert after["overrun_ticks"] - before["overrun_ticks"] == 1
+    assert after["skipped_ticks"] - before["skipped_ticks"] == 2
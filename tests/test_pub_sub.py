@@ -0,0 +1,212 @@
+import asyncio
+import struct
+import pytest
+from pycollisionavoidance.pub_sub import Codec
+from pycollisionavoidance.pub_sub.AMQP import PubSubAMQP
+from pycollisionavoidance.pub_sub.Codec import get_codec
+from pycollisionavoidance.pub_sub.Local import LocalBroker, PubSubLocal, topic_matches
+
+MESSAGES = {
+    "walker": {"id": "w1", "x_est_pos": 25.5, "y_est_pos": -3.25, "z_est_pos": 0.0, "timestamp": 1634563200.125},
+    "robot": {"id": "1", "base": [20.0, 20.0], "shoulder": [22.0, 22.5], "elbow": [24.0, 26.0], "wrist": [26.0, 30.0]},
+    "control": {"id": "1", "control": "stop", "distance": 1.3416794452438794, "angle": 153.0},
+}
+
+
+def _codec(name):
+    """codec by name, the orjson codec is only tested where orjson is installed"""
+    if name == "orjson":
+        pytest.importorskip("orjson")
+    codec = get_codec(name)
+    assert codec.name == name
+    return codec
+
+
+@pytest.mark.parametrize("codec_name", ["json", "orjson", "struct"])
+@pytest.mark.parametrize("schema", sorted(MESSAGES))
+def test_codec_round_trip(codec_name, schema):
+    codec = _codec(codec_name)
+    assert codec.decode(codec.encode(MESSAGES[schema], schema=schema), schema=schema) == MESSAGES[schema]
+
+
+@pytest.mark.parametrize("codec_name", ["json", "orjson"])
+def test_json_codecs_reject_invalid_messages(codec_name):
+    codec = _codec(codec_name)
+    assert codec.decode(b"{not json", schema="walker") is None
+    assert codec.decode(b"[1, 2]", schema="walker") is None
+    assert codec.decode(b'{"id": "w1", "x_est_pos": 1}', schema="walker") is None
+
+
+def test_struct_codec_rejects_invalid_messages():
+    codec = get_codec("struct")
+    body = codec.encode(MESSAGES["control"], schema="control")
+    assert codec.decode(b"", schema="control") is None
+    # message of another schema
+    assert codec.decode(body, schema="walker") is None
+    assert codec.decode(body[:-1], schema="control") is None
+    assert codec.decode(body + b"\0", schema="control") is None
+    not_finite = body[:-struct.calcsize("<d")] + struct.pack("<d", float("nan"))
+    assert codec.decode(not_finite, schema="control") is None
+
+
+def test_struct_codec_accepts_large_finite_numbers():
+    codec = get_codec("struct")
+    # the sum of the numbers overflows, every number is finite
+    msg = dict(MESSAGES["control"], distance=1e308, angle=1e308)
+    assert codec.decode(codec.encode(msg, schema="control"), schema="control") == msg
+
+
+def test_orjson_codec_falls_back_to_json(monkeypatch):
+    monkeypatch.setattr(Codec, "orjson", None)
+    assert get_codec("orjson").name == "json"
+
+
+def test_unknown_codec():
+    with pytest.raises(AssertionError):
+        get_codec("xml")
+
+
+class Subscriber:
+    """subscriber recording the routing keys of the messages delivered to it"""
+
+    def __init__(self):
+        self.received = []
+
+    def deliver(self, exchange_name, routing_key, message_content):
+        self.received.append(routing_key)
+
+
+def _broker_with_subscribers(exchange_type, binding_keys):
+    """broker with one exchange and a subscriber per list of binding keys"""
+    broker = LocalBroker()
+    broker.declare_exchange("control_robot", exchange_type)
+    subscribers = []
+    for keys in binding_keys:
+        subscribers.append(Subscriber())
+        for key in keys:
+            broker.bind("control_robot", key, subscribers[-1])
+    return broker, subscribers
+
+
+def test_fanout_exchange_routes_to_every_subscriber():
+    broker, subscribers = _broker_with_subscribers("fanout", [["control.robot.1"], ["control.robot.2"]])
+    broker.route("control_robot", "control.robot.1", b"stop")
+    assert [subscriber.received for subscriber in subscribers] == [["control.robot.1"], ["control.robot.1"]]
+
+
+def test_direct_exchange_routes_to_equal_binding_keys():
+    broker, subscribers = _broker_with_subscribers("direct", [["control.robot.1"], ["control.robot.2"], []])
+    broker.route("control_robot", "control.robot.2", b"stop")
+    assert [subscriber.received for subscriber in subscribers] == [[], ["control.robot.2"], []]
+
+
+def test_topic_exchange_routes_to_matching_binding_keys_once():
+    broker, subscribers = _broker_with_subscribers("topic", [["control.robot.*", "control.#"], ["control.walker.*"],
+                                                             ["#"]])
+    broker.route("control_robot", "control.robot.1", b"stop")
+    assert [subscriber.received for subscriber in subscribers] == [["control.robot.1"], [], ["control.robot.1"]]
+
+
+def test_unbound_subscriber_receives_nothing():
+    broker, subscribers = _broker_with_subscribers("fanout", [["control.robot.1"], ["control.robot.2"]])
+    broker.unbind(subscribers[0])
+    broker.route("control_robot", "control.robot.1", b"stop")
+    assert [subscriber.received for subscriber in subscribers] == [[], ["control.robot.1"]]
+
+
+def test_exchange_type_can_not_change():
+    broker = LocalBroker()
+    broker.declare_exchange("control_robot", "fanout")
+    broker.declare_exchange("control_robot", "fanout")
+    with pytest.raises(AssertionError):
+        broker.declare_exchange("control_robot", "direct")
+
+
+@pytest.mark.parametrize("binding_key, routing_key, matches", [
+    ("control.robot.1", "control.robot.1", True),
+    ("control.robot.1", "control.robot.2", False),
+    ("control.*.1", "control.robot.1", True),
+    ("control.*", "control.robot.1", False),
+    ("control.#", "control.robot.1", True),
+    ("control.#", "control", True),
+    ("#.1", "control.robot.1", True),
+    ("control.#.2", "control.robot.1", False),
+])
+def test_topic_matches(binding_key, routing_key, matches):
+    assert topic_matches(tuple(binding_key.split(".")), tuple(routing_key.split("."))) == matches
+
+
+async def _publish_locally(messages):
+    """publish messages with suffixes from one local publisher to a subscriber, return what it received"""
+    loop = asyncio.get_running_loop()
+    received = []
+    subscriber = PubSubLocal(loop, {"exchange": "control_robot", "exchange_type": "direct",
+                                    "binding_keys": ["control.robot."]}, "1",
+                             app_callback=lambda **kwargs: received.append((kwargs["binding_name"],
+                                                                            kwargs["message_body"])))
+    await subscriber.connect(mode="subscriber")
+    publisher = PubSubLocal(loop, {"exchange": "control_robot", "exchange_type": "direct",
+                                   "binding_keys": ["control.robot."]}, "")
+    await publisher.connect()
+    await publisher.publish_batch(messages=messages)
+    # nothing is delivered within the publishing call
+    assert received == []
+    await asyncio.sleep(0)
+    await subscriber.terminate()
+    await publisher.publish(b"late", external_binding_suffix="1")
+    await asyncio.sleep(0)
+    return received
+
+
+def test_local_subscriber_receives_its_messages_in_order():
+    received = asyncio.run(_publish_locally([(b"stop", "1"), (b"other", "2"), (b"go", "1")]))
+    assert received == [("control.robot.1", b"stop"), ("control.robot.1", b"go")]
+
+
+class Message:
+    """incoming AMQP message recording its acknowledgements"""
+
+    def __init__(self, routing_key, body, acks):
+        self.exchange = "plm_walker"
+        self.routing_key = routing_key
+        self.body = body
+        self.acks = acks
+
+    def ack(self, multiple=False):
+        self.acks.append((self.body, multiple))
+
+
+async def _consume(messages, **settings):
+    """consume a burst of messages, return the bodies passed to the callback and the acknowledgements sent"""
+    received = []
+    acks = []
+    subscriber = PubSubAMQP(asyncio.get_running_loop(),
+                            dict({"broker": {}, "credential": {}, "exchange": "plm_walker",
+                                  "binding_keys": ["plm.walker."]}, **settings), "",
+                            app_callback=lambda **kwargs: received.append(kwargs["message_body"]))
+    for routing_key, body in messages:
+        await subscriber._sub_on_message(Message(routing_key, body, acks))
+    # the burst is consumed, what is still waiting is flushed on the next iteration of the event loop
+    await asyncio.sleep(0)
+    return received, acks
+
+
+def test_amqp_acknowledges_batches_with_one_multiple_ack():
+    messages = [(f"plm.walker.{idx % 2}", str(idx).encode()) for idx in range(7)]
+    received, acks = asyncio.run(_consume(messages, ack_batch_size=3))
+    assert received == [body for _, body in messages]
+    # every full batch right away, the rest once the burst is consumed
+    assert acks == [(b"2", True), (b"5", True), (b"6", True)]
+
+
+def test_amqp_acknowledges_every_message_by_default():
+    received, acks = asyncio.run(_consume([("plm.walker.1", b"0"), ("plm.walker.1", b"1")]))
+    assert received == [b"0", b"1"]
+    assert acks == [(b"0", True), (b"1", True)]
+
+
+def test_amqp_coalesces_a_burst_to_the_latest_message_per_routing_key():
+    messages = [("plm.walker.a", b"a0"), ("plm.walker.b", b"b0"), ("plm.walker.a", b"a1")]
+    received, acks = asyncio.run(_consume(messages, coalesce=True, ack_batch_size=2))
+    assert received == [b"b0", b"a1"]
+    assert acks == [(b"a1", True)]
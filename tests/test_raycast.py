@@ -0,0 +1,248 @@
+import asyncio
+import numpy as np
+import pytest
+from pycollisionavoidance.raycast.Particle import Particle, look_batch
+from pycollisionavoidance.raycast.Point import Point
+from pycollisionavoidance.raycast.RangingPool import RangingPool
+from pycollisionavoidance.raycast.StaticMap import StaticMap
+from pycollisionavoidance.raycast.View import View
+from pycollisionavoidance.raycast.Visibility import ActiveSet
+
+
+def assert_same_view(view, expected):
+    """views with the same hits, up to floating point rounding"""
+    np.testing.assert_array_equal(view.ray_ids, expected.ray_ids)
+    np.testing.assert_array_equal(view.obstacle_index, expected.obstacle_index)
+    np.testing.assert_allclose(view.distances, expected.distances, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(view.contact_points, expected.contact_points, rtol=1e-9, atol=1e-9)
+
+
+def positions(count, seed=0):
+    """positions spread over the scene of the configuration file and around it"""
+    return np.random.default_rng(seed).uniform(-10, 210, size=(count, 2)).tolist()
+
+
+def generated_scene(scene_config, num_of_walls, seed=0):
+    """scene of randomly placed walls of the same density as the configuration file scene, with its robots"""
+    rng = np.random.default_rng(seed)
+    start = rng.uniform(0, 10 * np.sqrt(num_of_walls), size=(num_of_walls, 2))
+    angle = rng.uniform(0, 2 * np.pi, size=num_of_walls)
+    stop = start + np.stack((np.cos(angle), np.sin(angle)), axis=1) * rng.uniform(1, 5, size=(num_of_walls, 1))
+    obstacles = [{"id": f"gen-{idx}", "description": f"wall-gen-{idx}", "render": {"type": "static", "shape": "line"},
+                  "points": [start[idx].tolist(), stop[idx].tolist()]} for idx in range(num_of_walls)]
+    return {"obstacles": obstacles, "robots": scene_config["robots"]}
+
+
+@pytest.mark.parametrize("resolution", [1, 2.5])
+def test_vectorized_engine_matches_reference(scene_config, resolution):
+    segments = list(StaticMap(config_file=scene_config).get_segments())
+    for x, y in positions(4):
+        vectorized = Particle(particle_id="1", x=x, y=y, resolution=resolution)
+        reference = Particle(particle_id="1", x=x, y=y, resolution=resolution, engine="reference")
+        assert_same_view(vectorized.look(segments), reference.look(segments))
+
+
+def test_vectorized_engine_matches_reference_on_some_rays(scene_config):
+    segments = list(StaticMap(config_file=scene_config).get_segments())
+    ray_ids = np.array([0, 45, 90, 181, 359])
+    for x, y in positions(4, seed=1):
+        vectorized = Particle(particle_id="1", x=x, y=y)
+        reference = Particle(particle_id="1", x=x, y=y, engine="reference")
+        assert_same_view(vectorized.look_rays(segments, ray_ids=ray_ids),
+                         reference.look_rays(segments, ray_ids=ray_ids))
+
+
+def test_particle_without_position_sees_nothing(scene_config):
+    segments = list(StaticMap(config_file=scene_config).get_segments())
+    assert len(Particle(particle_id="1", x=None, y=None).look(segments)) == 0
+
+
+@pytest.mark.parametrize("num_of_walls", [None, 400])
+def test_spatial_index_matches_all_segments(scene_config, num_of_walls):
+    config = scene_config if num_of_walls is None else generated_scene(scene_config, num_of_walls)
+    scene = StaticMap(config_file=dict(config, ranging_backend="raycast"))
+    scene.update_robot_pose("1", base=[20, 20], shoulder=[22, 22], elbow=[24, 26], wrist=[26, 30])
+    segments = list(scene.get_segments())
+    for x, y in positions(20, seed=2):
+        particle = Particle(particle_id="1", x=x, y=y)
+        assert_same_view(particle.look(scene), particle.look(segments))
+
+
+def without_far_hits(view, max_range):
+    """view with the hits farther than the range limit reported as no hit"""
+    far = view.distances > max_range
+    return View(view.angle_table, view.ray_ids, np.where(far, -1, view.obstacle_index),
+                np.where(far, np.inf, view.distances), np.where(far, np.nan, view.contact_points[:, 0]),
+                np.where(far, np.nan, view.contact_points[:, 1]), view.segments)
+
+
+@pytest.mark.parametrize("backend", [None, "raycast", "sweep"])
+@pytest.mark.parametrize("max_range", [3.0, 25.0])
+def test_range_limit_drops_far_hits(scene_config, backend, max_range):
+    scene = StaticMap(config_file=dict(scene_config, ranging_backend=backend or "raycast"))
+    segments = scene if backend is not None else list(scene.get_segments())
+    for x, y in positions(10, seed=3):
+        limited = Particle(particle_id="1", x=x, y=y, max_range=max_range)
+        unlimited = Particle(particle_id="1", x=x, y=y)
+        assert_same_view(limited.look(segments), without_far_hits(unlimited.look(segments), max_range))
+
+
+@pytest.mark.parametrize("num_of_walls", [None, 400])
+def test_sweep_matches_raycast_while_robots_move(scene_config, num_of_walls):
+    config = scene_config if num_of_walls is None else generated_scene(scene_config, num_of_walls)
+    scenes = {backend: StaticMap(config_file=dict(config, ranging_backend=backend)) for backend in ("raycast", "sweep")}
+    rng = np.random.default_rng(4)
+    for trial in range(10):
+        for robot_id in scenes["sweep"].robot_ids:
+            pose = rng.uniform(0, 200, size=(4, 2)).tolist()
+            for scene in scenes.values():
+                scene.update_robot_pose(robot_id, *pose)
+        for x, y in positions(3, seed=trial):
+            for max_range in (None, 10.0):
+                particle = Particle(particle_id="1", x=x, y=y, max_range=max_range)
+                assert_same_view(particle.look(scenes["sweep"]), particle.look(scenes["raycast"]))
+
+
+def grid_scene(scene_config, num_of_walls, seed=0):
+    """scene of horizontal, vertical and diagonal walls between integer points, many of them collinear or touching"""
+    rng = np.random.default_rng(seed)
+    obstacles = []
+    for idx in range(num_of_walls):
+        start = rng.integers(0, 30, size=2)
+        kind = rng.integers(3)
+        if kind == 0:
+            stop = start + rng.integers(-8, 9, size=2)
+        elif kind == 1:
+            stop = start + [rng.integers(1, 9), 0]
+        else:
+            stop = start + [0, rng.integers(1, 9)]
+        obstacles.append({"id": f"grid-{idx}", "description": f"wall-grid-{idx}",
+                          "render": {"type": "static", "shape": "line"}, "points": [start.tolist(), stop.tolist()]})
+    return {"obstacles": obstacles, "robots": scene_config["robots"]}
+
+
+def test_sweep_hits_split_points_like_raycast(scene_config):
+    config = {"obstacles": [{"id": "wall", "description": "wall", "render": {"type": "static", "shape": "line"},
+                             "points": [[24, 12], [24, 16]]}], "robots": scene_config["robots"]}
+    scenes = {backend: StaticMap(config_file=dict(config, ranging_backend=backend)) for backend in ("raycast", "sweep")}
+    for scene in scenes.values():
+        # the arm crosses the wall at (24, 13), the ray upwards passes through the split point
+        scene.update_robot_pose(scene.robot_ids[0], base=[22, 11], shoulder=[26, 15], elbow=[26, 15], wrist=[26, 15])
+    particle = Particle(particle_id="1", x=24, y=11)
+    view = particle.look(scenes["sweep"])
+    assert_same_view(view, particle.look(scenes["raycast"]))
+    assert view.distances[90] == pytest.approx(2)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_sweep_matches_raycast_on_integer_grid(scene_config, seed):
+    config = grid_scene(scene_config, num_of_walls=40, seed=seed)
+    scenes = {backend: StaticMap(config_file=dict(config, ranging_backend=backend)) for backend in ("raycast", "sweep")}
+    rng = np.random.default_rng(seed)
+    for robot_id in scenes["sweep"].robot_ids:
+        pose = rng.integers(0, 30, size=(4, 2)).astype(float).tolist()
+        for scene in scenes.values():
+            scene.update_robot_pose(robot_id, *pose)
+    for x, y in rng.integers(0, 30, size=(5, 2)).tolist():
+        for max_range in (None, 6.0):
+            particle = Particle(particle_id="1", x=x, y=y, max_range=max_range)
+            assert_same_view(particle.look(scenes["sweep"]), particle.look(scenes["raycast"]))
+
+
+def test_active_set_keeps_segments_ordered_by_distance():
+    rng = np.random.default_rng(5)
+    distances = rng.uniform(0, 100, size=200).tolist()
+    active = ActiveSet(num_of_segments=len(distances))
+    assert not active
+    for segment in rng.permutation(len(distances)).tolist():
+        active.insert(segment, distances[segment], distances.__getitem__)
+    removed = set(rng.choice(len(distances), size=120, replace=False).tolist())
+    for segment in removed:
+        active.remove(segment)
+    remaining = [segment for segment in range(len(distances)) if segment not in removed]
+    assert list(active.nearest()) == sorted(remaining, key=distances.__getitem__)
+    for segment in remaining:
+        active.remove(segment)
+    assert not active
+
+
+@pytest.mark.parametrize("start_angle, stop_angle, expected", [
+    (330, 30, list(range(330, 360)) + list(range(0, 31))),
+    (-30, 30, list(range(330, 360)) + list(range(0, 31))),
+    (350.5, 2.5, list(range(351, 360)) + [0, 1, 2]),
+    (90, 90, [90]),
+    (0, 360, list(range(360))),
+])
+def test_sector_rays_wrap_around_zero_degree(start_angle, stop_angle, expected):
+    particle = Particle(particle_id="1", x=0, y=0)
+    assert particle.sector_rays(start_angle=start_angle, stop_angle=stop_angle).tolist() == expected
+
+
+def test_sector_rays_at_finer_resolution():
+    particle = Particle(particle_id="1", x=0, y=0, resolution=0.5)
+    rays = particle.sector_rays(start_angle=350, stop_angle=10)
+    assert len(rays) == 41
+    assert particle.ray_angles[rays[0]] == 350
+    assert particle.ray_angles[rays[-1]] == 10
+
+
+@pytest.mark.parametrize("resolution", [0.25, 2.5, 7.5])
+def test_sector_rays_wrap_around_zero_degree_at_any_resolution(resolution):
+    particle = Particle(particle_id="1", x=0, y=0, resolution=resolution)
+    angles = [particle.ray_angles[ray_id] for ray_id in particle.sector_rays(start_angle=330, stop_angle=30)]
+    expected = np.arange(330, 390 + resolution / 2, resolution) % 360
+    np.testing.assert_allclose(angles, expected)
+
+
+@pytest.mark.parametrize("resolution", [7, 0.7, 400])
+def test_resolution_must_divide_full_circle(resolution):
+    with pytest.raises(AssertionError):
+        Particle(particle_id="1", x=0, y=0, resolution=resolution)
+
+
+def test_sector_across_zero_degree_matches_full_sweep(scene_config):
+    scene = StaticMap(config_file=scene_config)
+    wrapped = list(range(330, 360)) + list(range(0, 31))
+    for x, y in positions(5, seed=6):
+        particle = Particle(particle_id="1", x=x, y=y)
+        expected = particle.look(scene).select(wrapped)
+        assert_same_view(particle.look_sector(scene, heading=0, field_of_view=60), expected)
+        records = particle.look_at_angle(scene, start_angle=330, stop_angle=30)
+        assert [record["angle"] for record in records] == [particle.ray_angles[ray_id] for ray_id in wrapped]
+
+
+@pytest.mark.parametrize("backend", [None, "raycast", "sweep"])
+def test_batch_matches_looking_one_by_one(scene_config, backend):
+    scene = StaticMap(config_file=dict(scene_config, ranging_backend=backend or "raycast"))
+    segments = scene if backend is not None else list(scene.get_segments())
+    particles = [Particle(particle_id=str(idx), x=x, y=y, resolution=1 + idx % 2, max_range=[None, 20.0][idx % 3 == 0])
+                 for idx, (x, y) in enumerate(positions(8, seed=7))]
+    particles.append(Particle(particle_id="adaptive", x=50, y=50, mode="adaptive"))
+    particles.append(Particle(particle_id="nowhere", x=None, y=None))
+    views = look_batch(particles, segments)
+    for particle, view in zip(particles[:8], views):
+        assert_same_view(view, particle.look(segments))
+    assert views[8] is None
+    assert len(views[9]) == 0
+
+
+@pytest.mark.parametrize("backend", ["raycast", "sweep"])
+def test_ranging_pool_matches_batch_across_layout_changes(scene_config, backend):
+    scene = StaticMap(config_file=dict(scene_config, ranging_backend=backend))
+    particles = [Particle(particle_id=str(idx), x=x, y=y, max_range=[None, 20.0][idx % 2])
+                 for idx, (x, y) in enumerate(positions(8, seed=8) + [[80, 8], [120, 6]])]
+    pool = RangingPool(processes=2)
+    try:
+        below = []
+        for layout in range(2):
+            if layout == 1:
+                # the static wall 1 grows towards the particles, the workers attach the new layout
+                scene.update("1", corner_points=(Point(0, 0), Point(0, 4), Point(160, 4), Point(160, 0)))
+            snapshot = scene.snapshot()
+            views = asyncio.run(pool.look_batch("workspace", particles, snapshot))
+            for view, expected in zip(views, look_batch(particles, snapshot)):
+                assert_same_view(view, expected)
+            below.append(views[8].distances[270])
+        assert below == pytest.approx([6, 4])
+    finally:
+        pool.close()